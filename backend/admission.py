@@ -0,0 +1,181 @@
+import asyncio
+import math
+import time
+
+from metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of admitted; carries the HTTP answer."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class ConcurrencyLimit:
+    """Caps how many requests of one kind run at once, overall and per user.
+
+    Up to ``concurrency`` requests run; the next ``max_queue`` wait for at most
+    ``queue_timeout`` seconds and anything beyond that is shed with a 503. A user
+    with ``per_user`` of these requests already running or queued gets a 429
+    straight away, so one admin cannot fill the queue on their own.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, queue_timeout: float,
+                 per_user: int = 0, retry_after: float = 1.0):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_user = per_user
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(concurrency)
+        self._active = 0
+        self._queued = 0
+        self._by_user = {}
+        self.admitted = 0
+        self.rejected = {}
+
+    def _reject(self, reason: str, status_code: int, detail: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTED.inc(self.name, reason)
+        raise AdmissionRejected(status_code, detail, self.retry_after)
+
+    async def acquire(self, user_id: str = None) -> "Ticket":
+        if self.per_user and user_id is not None and self._by_user.get(user_id, 0) >= self.per_user:
+            self._reject("per_user", 429, f"Too many concurrent {self.name} requests for this user")
+
+        # A user's requests count from the moment they queue until they are released
+        self._hold(user_id)
+        try:
+            if self._active >= self.concurrency or self._queued:
+                if self._queued >= self.max_queue:
+                    self._reject("queue_full", 503, "Server is busy, please retry shortly")
+                self._queued += 1
+                ADMISSION_QUEUED.inc(self.name)
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self._reject("queue_timeout", 503, "Server is busy, please retry shortly")
+                finally:
+                    self._queued -= 1
+                    ADMISSION_QUEUED.dec(self.name)
+            else:
+                await self._slots.acquire()
+        except BaseException:
+            self._unhold(user_id)
+            raise
+
+        self._active += 1
+        ADMISSION_ACTIVE.inc(self.name)
+        self.admitted += 1
+        return Ticket(self, user_id)
+
+    def _hold(self, user_id):
+        if user_id is not None:
+            self._by_user[user_id] = self._by_user.get(user_id, 0) + 1
+
+    def _unhold(self, user_id):
+        if user_id is not None:
+            remaining = self._by_user[user_id] - 1
+            if remaining:
+                self._by_user[user_id] = remaining
+            else:
+                del self._by_user[user_id]
+
+    def _release(self, user_id):
+        self._active -= 1
+        ADMISSION_ACTIVE.dec(self.name)
+        self._unhold(user_id)
+        self._slots.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "per_user": self.per_user,
+            "active": self._active,
+            "queued": self._queued,
+            # Users with a request running or queued
+            "users_active": len(self._by_user),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class Ticket:
+    """One admitted request. release() is idempotent; detach() hands it to a streamed body."""
+
+    __slots__ = ("limit", "user_id", "released", "detached")
+
+    def __init__(self, limit: ConcurrencyLimit, user_id):
+        self.limit = limit
+        self.user_id = user_id
+        self.released = False
+        self.detached = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limit._release(self.user_id)
+
+    def detach(self):
+        """Keep the slot after the handler returns; the caller must release() when the stream ends."""
+        self.detached = True
+        return self
+
+
+class TokenBucket:
+    """Per-key token buckets: ``burst`` requests at once, refilled at ``rate`` per second.
+
+    Full buckets carry no state, so once there are more than ``max_keys`` keys the
+    ones that have refilled completely are dropped.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int = 100000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self.admitted = 0
+        self.rejected = 0
+
+    def _prune(self, now: float):
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if now - updated < full_after
+        }
+
+    def take(self, key: str):
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            self.rejected += 1
+            ADMISSION_REJECTED.inc(self.name, "rate_limited")
+            raise AdmissionRejected(429, "Too many attempts, please retry later", (1 - tokens) / self.rate)
+
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            self._prune(now)
+        self._buckets[key] = (tokens - 1, now)
+        self.admitted += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tracked_keys": len(self._buckets),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
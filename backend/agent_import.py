@@ -0,0 +1,64 @@
+import csv
+import io
+
+from pymongo.errors import BulkWriteError
+
+AGENT_CSV_COLUMNS = ['name', 'email', 'mobile', 'password']
+# Optional columns; empty cells fall back to the model defaults
+AGENT_CSV_OPTIONAL_COLUMNS = ['weight', 'capacity']
+
+DUPLICATE_KEY = 11000
+
+
+class AgentImportError(Exception):
+    """Raised when a bulk agent file cannot be read at all (as opposed to a bad row)."""
+
+
+def parse_agent_csv(data: bytes) -> list:
+    """Read an agent CSV into one dict per row, dropping empty cells."""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise AgentImportError("File must be UTF-8 encoded") from e
+
+    reader = csv.DictReader(io.StringIO(text))
+    columns = [column.strip() for column in reader.fieldnames or []]
+    missing = [column for column in AGENT_CSV_COLUMNS if column not in columns]
+    if missing:
+        raise AgentImportError(f"CSV must contain columns: {', '.join(AGENT_CSV_COLUMNS)}")
+    reader.fieldnames = columns
+
+    rows = []
+    for record in reader:
+        rows.append({
+            key: value.strip()
+            for key, value in record.items()
+            if key in AGENT_CSV_COLUMNS + AGENT_CSV_OPTIONAL_COLUMNS and value and value.strip()
+        })
+    return rows
+
+
+async def existing_emails(db, emails: list) -> set:
+    """Emails that already belong to an agent, in one $in query."""
+    if not emails:
+        return set()
+    docs = await db.agents.find({"email": {"$in": emails}}, {"_id": 0, "email": 1}).to_list(None)
+    return {doc['email'] for doc in docs}
+
+
+async def insert_agents(db, docs: list, batch_size: int = 500) -> set:
+    """Insert agent docs with unordered insert_many batches.
+
+    Returns the positions of docs rejected by the unique email index, which happens
+    when an agent with the same email was created after the duplicate check.
+    """
+    rejected = set()
+    for start in range(0, len(docs), batch_size):
+        try:
+            await db.agents.insert_many(docs[start:start + batch_size], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != DUPLICATE_KEY:
+                    raise
+                rejected.add(start + error['index'])
+    return rejected
@@ -0,0 +1,178 @@
+from collections import defaultdict
+from datetime import datetime
+
+from bson import Binary
+
+from distribution import format_uuids
+from pagination import decode_cursor, sequence_key
+from search import normalize_phones
+
+BUCKETS_COLLECTION = "assignment_buckets"
+# Leads per bucket document; well under the 16 MB document limit even with long notes
+BUCKET_SIZE = 1000
+# Buckets sharing a created_at are read together, so their relative order does not matter
+BUCKET_SORT = [("created_at", 1)]
+
+
+def pack_ids(ids: list) -> Binary:
+    """36-character UUID strings -> one binary of 16 bytes per id."""
+    return Binary(bytes.fromhex("".join(ids).replace("-", "")))
+
+
+def unpack_ids(raw: bytes) -> list:
+    return format_uuids(bytes(raw))
+
+
+def to_buckets(docs: list, bucket_size: int = BUCKET_SIZE) -> list:
+    """Group assignment docs into bucket documents, one or more per (upload, agent, created_at).
+
+    Everything the leads of a bucket share is stored once; the per-lead values
+    are kept as parallel arrays.
+    """
+    groups = defaultdict(list)
+    for doc in docs:
+        groups[(doc['upload_id'], doc['agent_id'], doc['created_at'])].append(doc)
+
+    buckets = []
+    for (upload_id, agent_id, created_at), leads in groups.items():
+        for start in range(0, len(leads), bucket_size):
+            part = leads[start:start + bucket_size]
+            buckets.append({
+                "upload_id": upload_id,
+                "agent_id": agent_id,
+                "agent_name": part[0]['agent_name'],
+                "created_at": created_at,
+                "updated_at": max(lead.get('updated_at') or created_at for lead in part),
+                "count": len(part),
+                "ids": pack_ids([lead['id'] for lead in part]),
+                "seqs": [lead.get('seq') for lead in part],
+                "first_names": [lead['first_name'] for lead in part],
+                "phones": [lead['phone'] for lead in part],
+                "notes": [lead['notes'] for lead in part],
+            })
+    return buckets
+
+
+def from_bucket(bucket: dict) -> list:
+    """The assignment docs of one bucket, in the shape the assignments collection stores."""
+    shared = {
+        "agent_id": bucket['agent_id'],
+        "agent_name": bucket['agent_name'],
+        "upload_id": bucket['upload_id'],
+        "created_at": bucket['created_at'],
+        "updated_at": bucket.get('updated_at'),
+    }
+    # Buckets written before leads had a seq carry none
+    seqs = bucket.get('seqs') or [None] * bucket['count']
+    return [
+        {
+            "id": assignment_id,
+            "first_name": first_name,
+            "phone": phone,
+            "phone_normalized": phone_normalized,
+            "notes": notes,
+            "seq": seq,
+            **shared,
+        }
+        for assignment_id, first_name, phone, phone_normalized, notes, seq in zip(
+            unpack_ids(bucket['ids']), bucket['first_names'], bucket['phones'],
+            normalize_phones(bucket['phones']), bucket['notes'], seqs
+        )
+    ]
+
+
+class BucketStore:
+    """Assignments stored as bucket documents instead of one document per lead.
+
+    A bucket holds up to ``bucket_size`` leads of one upload, given to one agent
+    in one insert batch, so agent_name, upload_id and the timestamps are stored
+    once per bucket and ids take 16 bytes instead of a 36-character string.
+    Listing, streaming replay and stats read through this class and get the
+    usual assignment docs back, in the same (created_at, seq, id) keyset order.
+    Deleting an agent's or an upload's assignments removes whole buckets.
+    """
+
+    def __init__(self, bucket_size: int = BUCKET_SIZE):
+        self.bucket_size = bucket_size
+
+    async def insert(self, db, docs: list) -> int:
+        buckets = to_buckets(docs, self.bucket_size)
+        if buckets:
+            await db[BUCKETS_COLLECTION].insert_many(buckets)
+        return len(buckets)
+
+    async def delete(self, db, agent_id: str = None, upload_id: str = None) -> int:
+        """Delete every assignment of an agent and/or an upload; returns how many leads went."""
+        match = {}
+        if agent_id:
+            match['agent_id'] = agent_id
+        if upload_id:
+            match['upload_id'] = upload_id
+        if not match:
+            raise ValueError("agent_id or upload_id is required")
+        counts = await self.count_by_agent_and_upload(db, match)
+        await db[BUCKETS_COLLECTION].delete_many(match)
+        return sum(n for per_upload in counts.values() for n in per_upload.values())
+
+    async def count_by_agent_and_upload(self, db, match: dict = None) -> dict:
+        """Like stats.count_by_agent_and_upload, summing bucket sizes instead of counting docs."""
+        pipeline = [{"$match": match}] if match else []
+        pipeline.append({"$group": {
+            "_id": {"agent_id": "$agent_id", "upload_id": "$upload_id"},
+            "count": {"$sum": "$count"},
+        }})
+
+        counts = defaultdict(dict)
+        async for row in db[BUCKETS_COLLECTION].aggregate(pipeline):
+            counts[row['_id']['agent_id']][row['_id']['upload_id']] = row['count']
+        return counts
+
+    async def agent_loads(self, db) -> dict:
+        rows = db[BUCKETS_COLLECTION].aggregate([{"$group": {"_id": "$agent_id", "count": {"$sum": "$count"}}}])
+        return {row['_id']: row['count'] async for row in rows}
+
+    async def find(self, db, query: dict = None, after: str = None, limit: int = None):
+        """Assignment docs matching query (agent_id, upload_id, created_at), in (created_at, seq, id) order.
+
+        Buckets are read in created_at order; all buckets sharing a timestamp are
+        unpacked together and their leads sorted by (seq, id), which is the keyset order.
+        ``after`` is a cursor from pagination.encode_cursor. Raises InvalidCursor.
+        """
+        query = query or {}
+        created_after = after_key = None
+        if after:
+            created_after, after_seq, after_id = decode_cursor(after)
+            after_key = sequence_key(after_seq, after_id)
+            # Legacy string cursors sort before every date, so they select everything
+            if isinstance(created_after, datetime):
+                bound = {"created_at": {"$gte": created_after}}
+                query = {"$and": [query, bound]} if query else bound
+            else:
+                created_after = None
+
+        sent = 0
+        group, group_at = [], None
+        buckets = db[BUCKETS_COLLECTION].find(query, {"_id": 0}).sort(BUCKET_SORT)
+        async for bucket in buckets:
+            if group and bucket['created_at'] != group_at:
+                for doc in self._ordered(group, group_at, created_after, after_key):
+                    yield doc
+                    sent += 1
+                    if limit and sent >= limit:
+                        return
+                group = []
+            group_at = bucket['created_at']
+            group.append(bucket)
+        for doc in self._ordered(group, group_at, created_after, after_key):
+            yield doc
+            sent += 1
+            if limit and sent >= limit:
+                return
+
+    @staticmethod
+    def _ordered(group: list, created_at, created_after, after_key) -> list:
+        docs = [doc for bucket in group for doc in from_bucket(bucket)]
+        if created_after is not None and created_at == created_after:
+            docs = [doc for doc in docs if sequence_key(doc['seq'], doc['id']) > after_key]
+        docs.sort(key=lambda doc: sequence_key(doc['seq'], doc['id']))
+        return docs
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import os
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+logger = logging.getLogger(__name__)
+
+# MongoClient option -> (environment variable, type); unset variables keep the driver default
+CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "maxConnecting": ("MONGO_MAX_CONNECTING", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    # Comma separated, e.g. "zstd,snappy,zlib"; zstd and snappy need their Python packages
+    "compressors": ("MONGO_COMPRESSORS", str),
+    "zlibCompressionLevel": ("MONGO_ZLIB_COMPRESSION_LEVEL", int),
+    "appname": ("MONGO_APP_NAME", str),
+}
+
+
+def client_options(environ=os.environ) -> dict:
+    options = {}
+    for option, (variable, cast) in CLIENT_OPTIONS.items():
+        value = environ.get(variable)
+        if value not in (None, ""):
+            options[option] = cast(value)
+    return options
+
+
+def create_client(url: str, event_listeners=(), environ=os.environ) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(url, tz_aware=True, event_listeners=list(event_listeners), **client_options(environ))
+
+
+async def ping(client, timeout: float) -> float:
+    """Round-trip a ping to the deployment; returns the latency in seconds."""
+    start = time.perf_counter()
+    await asyncio.wait_for(client.admin.command("ping"), timeout)
+    return time.perf_counter() - start
+
+
+async def open_connections(client, count: int):
+    """Run count pings at once so the pool opens count connections before traffic arrives."""
+    if count > 0:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(count)))
+
+
+async def wait_until_reachable(client, timeout: float, interval: float = 0.5) -> bool:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await ping(client, max(interval, 1.0))
+            return True
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                logger.warning("MongoDB not reachable after %.1fs: %s", timeout, e)
+                return False
+            await asyncio.sleep(interval)
@@ -0,0 +1,213 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from search import normalize_phones
+from validation import PHONE_DIGITS_COLUMN
+
+_DASH = ord('-')
+# Offsets of the hex groups inside a canonical 36-character UUID string
+_UUID_GROUPS = [(0, 8, 0), (8, 12, 9), (12, 16, 14), (16, 20, 19), (20, 32, 24)]
+
+
+def bulk_uuid4(n: int) -> list:
+    """Generate n random (version 4) UUID strings without a per-row uuid.uuid4() call."""
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return format_uuids(raw.tobytes())
+
+
+def format_uuids(raw: bytes) -> list:
+    """Canonical UUID strings for a run of concatenated 16-byte UUIDs."""
+    n = len(raw) // 16
+    hexed = np.frombuffer(raw.hex().encode('ascii'), dtype=np.uint8).reshape(n, 32)
+    out = np.full((n, 36), _DASH, dtype=np.uint8)
+    for src_start, src_end, dst_start in _UUID_GROUPS:
+        out[:, dst_start:dst_start + src_end - src_start] = hexed[:, src_start:src_end]
+    return out.view('S36').ravel().astype('U36').tolist()
+
+
+class InsufficientCapacity(Exception):
+    """Raised when the agents' remaining capacity cannot absorb an upload."""
+
+
+def build_assignments(df: pd.DataFrame, agents: list, agent_idx: np.ndarray, upload_id: str,
+                      created_at: datetime = None, first_seq: int = 0) -> list:
+    """Turn a frame plus one agent index per row into assignment docs ready for insert_many.
+
+    All columns are computed at once and every doc of the frame shares one timestamp;
+    ``seq`` numbers the rows from first_seq, their position in the upload.
+    """
+    n = len(df)
+    if n == 0:
+        return []
+
+    agent_ids = np.array([agent['id'] for agent in agents], dtype=object)[agent_idx]
+    agent_names = np.array([agent['name'] for agent in agents], dtype=object)[agent_idx]
+
+    ids = bulk_uuid4(n)
+    created = created_at or datetime.now(timezone.utc)
+    # BSON dates hold milliseconds; truncating here keeps these docs equal to what is stored,
+    # so cursors built from them (e.g. by assignment streams) match the stored sort keys
+    created = created.replace(microsecond=created.microsecond // 1000 * 1000)
+    first_names = df['FirstName'].astype(str).tolist()
+    phones = df['Phone'].astype(str)
+    if PHONE_DIGITS_COLUMN in df.columns:
+        # Validated frames carry the digits already
+        phones_normalized = df[PHONE_DIGITS_COLUMN].tolist()
+    else:
+        phones_normalized = normalize_phones(phones)
+    phones = phones.tolist()
+    notes = df['Notes'].astype(str).tolist()
+    seqs = range(first_seq, first_seq + n)
+
+    return [
+        {
+            "id": assignment_id,
+            "agent_id": agent_id,
+            "agent_name": agent_name,
+            "first_name": first_name,
+            "phone": phone,
+            "phone_normalized": phone_normalized,
+            "notes": note,
+            "upload_id": upload_id,
+            "created_at": created,
+            "seq": seq,
+        }
+        for assignment_id, agent_id, agent_name, first_name, phone, phone_normalized, note, seq
+        in zip(ids, agent_ids.tolist(), agent_names.tolist(), first_names, phones, phones_normalized, notes, seqs)
+    ]
+
+
+def distribute_frame(df: pd.DataFrame, agents: list, upload_id: str, offset: int = 0, created_at: datetime = None) -> list:
+    """Assign the rows of df to agents round-robin.
+
+    Row i of the frame goes to agents[(offset + i) % len(agents)], which is exactly
+    the order the per-row loop produced; offset carries the position across chunks.
+    """
+    agent_idx = (np.arange(len(df)) + offset) % len(agents)
+    return build_assignments(df, agents, agent_idx, upload_id, created_at, first_seq=offset)
+
+
+# Distribution strategies
+#
+# A strategy is created once per upload and then asked for agent indices chunk by
+# chunk; it keeps whatever state it needs so that chunked and whole-file runs agree.
+
+class RoundRobinStrategy:
+    name = "round_robin"
+
+    def __init__(self, agents: list, loads: dict = None):
+        self.agent_count = len(agents)
+        self.offset = 0
+
+    def allocate(self, n: int) -> np.ndarray:
+        agent_idx = (np.arange(n) + self.offset) % self.agent_count
+        self.offset += n
+        return agent_idx
+
+
+class WeightedStrategy:
+    """Round-robin in proportion to each agent's integer ``weight`` (default 1).
+
+    One period of sum(weights) slots is laid out by stride scheduling: agent i's
+    j-th slot sits at (j + 0.5) / w_i, so heavier agents are spread evenly instead
+    of receiving their rows in runs.
+    """
+    name = "weighted"
+
+    def __init__(self, agents: list, loads: dict = None):
+        weights = np.array(
+            [1 if agent.get('weight') is None else max(int(agent['weight']), 0) for agent in agents],
+            dtype=np.int64,
+        )
+        if weights.sum() == 0:
+            weights[:] = 1
+        owners = np.repeat(np.arange(len(agents)), weights)
+        ranks = np.arange(len(owners)) - np.repeat(np.cumsum(weights) - weights, weights)
+        positions = (ranks + 0.5) / weights[owners]
+        self.pattern = owners[np.argsort(positions, kind='stable')]
+        self.offset = 0
+
+    def allocate(self, n: int) -> np.ndarray:
+        agent_idx = self.pattern[(np.arange(n) + self.offset) % len(self.pattern)]
+        self.offset += n
+        return agent_idx
+
+
+def _water_fill(loads: np.ndarray, n: int, caps: np.ndarray) -> np.ndarray:
+    """Split n rows so the least-loaded agents are topped up first, never exceeding caps.
+
+    Binary-searches the smallest fill level T with sum(clip(T - loads, 0, caps)) >= n,
+    fills everyone to T - 1 and hands the remainder to agents that would reach T.
+    """
+    lo, hi = int(loads.min()), int(loads.max()) + n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if np.clip(mid - loads, 0, caps).sum() >= n:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    counts = np.clip(lo - 1 - loads, 0, caps)
+    remainder = n - int(counts.sum())
+    if remainder:
+        eligible = np.flatnonzero((loads + counts == lo - 1) & (counts < caps))
+        counts[eligible[:remainder]] += 1
+    return counts
+
+
+def _fill_order(loads: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Agent index per row, interleaved in the order the rows fill the agents up."""
+    owners = np.repeat(np.arange(len(counts)), counts)
+    ranks = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners[np.argsort(loads[owners] + ranks, kind='stable')]
+
+
+# Remaining capacity of an agent without a cap; large, but summable over any roster
+UNCAPPED = 1 << 40
+
+
+class LeastLoadedStrategy:
+    """Give each row to the agent with the fewest assignments, counting existing ones."""
+    name = "least_loaded"
+
+    def __init__(self, agents: list, loads: dict = None):
+        loads = loads or {}
+        self.loads = np.array([loads.get(agent['id'], 0) for agent in agents], dtype=np.int64)
+        self.caps = np.full(len(agents), UNCAPPED, dtype=np.int64)
+
+    def allocate(self, n: int) -> np.ndarray:
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        if int(self.caps.sum()) < n:
+            raise InsufficientCapacity(
+                f"Agents can take {int(self.caps.sum())} more assignments, upload needs {n}"
+            )
+        counts = _water_fill(self.loads, n, self.caps)
+        agent_idx = _fill_order(self.loads, counts)
+        self.loads += counts
+        self.caps -= counts
+        return agent_idx
+
+
+class CapacityCappedStrategy(LeastLoadedStrategy):
+    """Least-loaded, but no agent goes past its ``capacity`` (agents without one are uncapped)."""
+    name = "capacity_capped"
+
+    def __init__(self, agents: list, loads: dict = None):
+        super().__init__(agents, loads)
+        for i, agent in enumerate(agents):
+            if agent.get('capacity') is not None:
+                self.caps[i] = max(int(agent['capacity']) - int(self.loads[i]), 0)
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (RoundRobinStrategy, WeightedStrategy, LeastLoadedStrategy, CapacityCappedStrategy)
+}
+# Strategies whose allocation depends on the agents' current assignment counts
+LOAD_AWARE_STRATEGIES = (LeastLoadedStrategy.name, CapacityCappedStrategy.name)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Subscription key that receives every agent's assignments (admin dashboards)
+ALL_AGENTS = "*"
+
+
+class Subscription:
+    """One stream's mailbox: a bounded queue of assignment batches.
+
+    A subscriber that falls ``max_batches`` behind is not allowed to hold memory
+    for the rest; further batches are dropped and ``overflowed`` is set, and the
+    stream catches up from MongoDB instead.
+    """
+
+    __slots__ = ("key", "queue", "overflowed", "closed")
+
+    def __init__(self, key: str, max_batches: int):
+        self.key = key
+        self.queue = asyncio.Queue(max_batches)
+        self.overflowed = False
+        self.closed = False
+
+    def put(self, docs: list):
+        try:
+            self.queue.put_nowait(docs)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        """Next batch of assignments, or None once the broker closed the subscription."""
+        if self.closed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+
+class AssignmentBroker:
+    """In-process fan-out of newly created assignments to the streams of their agents.
+
+    Writers call ``inserted()`` after each committed batch. With a change stream
+    running (``follow()``), the broker is fed from MongoDB instead, which also
+    delivers assignments inserted by other workers, and ``inserted()`` does nothing.
+    An idle stream costs one queue and one sleeping task; nothing is polled.
+    """
+
+    def __init__(self, max_batches: int = 256):
+        self.max_batches = max_batches
+        self._subscribers = defaultdict(set)
+        self.following = False
+        self.published = 0
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self, key: str) -> Subscription:
+        subscription = Subscription(key, self.max_batches)
+        self._subscribers[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.key]
+
+    def inserted(self, docs: list):
+        if not self.following:
+            self._dispatch(docs)
+
+    def _dispatch(self, docs: list):
+        if not self._subscribers or not docs:
+            return
+        # Kept in insertion order, per agent and overall
+        everything = []
+        by_agent = defaultdict(list)
+        for doc in docs:
+            if doc['agent_id'] in self._subscribers or ALL_AGENTS in self._subscribers:
+                # insert_many adds the ObjectId to the caller's dicts
+                doc = {key: value for key, value in doc.items() if key != "_id"}
+                everything.append(doc)
+                by_agent[doc['agent_id']].append(doc)
+        for agent_id, agent_docs in by_agent.items():
+            for subscription in self._subscribers.get(agent_id, ()):
+                subscription.put(agent_docs)
+        if everything and ALL_AGENTS in self._subscribers:
+            for subscription in self._subscribers[ALL_AGENTS]:
+                subscription.put(everything)
+        self.published += len(everything)
+
+    def close(self):
+        """End every stream, e.g. on shutdown."""
+        for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+                subscription.closed = True
+                subscription.overflowed = False
+                try:
+                    subscription.queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    pass
+
+    async def follow(self, db, batch_size: int = 500, retry_seconds: float = 5.0):
+        """Feed the broker from a change stream on the assignments collection.
+
+        Needs a replica set or sharded cluster; on a standalone server this logs once
+        and leaves the broker on in-process publishing.
+        """
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        resume_token = None
+        while True:
+            try:
+                async with db.assignments.watch(pipeline, resume_after=resume_token, batch_size=batch_size) as stream:
+                    self.following = True
+                    batch = []
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            batch.append(change["fullDocument"])
+                            resume_token = stream.resume_token
+                            if len(batch) < batch_size:
+                                continue
+                        self._dispatch(batch)
+                        batch = []
+            except OperationFailure as e:
+                if self.following:
+                    # e.g. the resume token fell off the oplog; start again from now
+                    logger.warning("Assignment change stream failed, restarting: %s", e)
+                    resume_token = None
+                    self.following = False
+                    await asyncio.sleep(retry_seconds)
+                    continue
+                logger.warning("Change streams unavailable (%s), publishing assignments in-process", e)
+                return
+            except PyMongoError as e:
+                logger.warning("Assignment change stream interrupted, retrying: %s", e)
+                self.following = False
+                await asyncio.sleep(retry_seconds)
+            finally:
+                self.following = False
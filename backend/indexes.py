@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from buckets import BUCKETS_COLLECTION
+from pagination import KEYSET_SORT
+from sync import TOMBSTONE_RETENTION_SECONDS, TOMBSTONES_COLLECTION
+from validation import REJECTIONS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Every index the API relies on, per collection
+INDEXES = {
+    "admins": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "agents": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "assignments": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        # Keyset listing for admins: sort (created_at, seq, id). These replace the earlier
+        # (created_at, id) indexes, which can be dropped once they are built
+        IndexModel([("created_at", ASCENDING), ("seq", ASCENDING), ("id", ASCENDING)], name="created_at_seq_id"),
+        # Agent listing, delete_many by agent, per-agent stats
+        IndexModel([("agent_id", ASCENDING), ("created_at", ASCENDING), ("seq", ASCENDING), ("id", ASCENDING)], name="agent_created_at_seq_id"),
+        # Upload filter and upload rollback
+        IndexModel([("upload_id", ASCENDING), ("created_at", ASCENDING), ("seq", ASCENDING), ("id", ASCENDING)], name="upload_created_at_seq_id"),
+        # Delta sync (?since=), per agent and for admins
+        IndexModel([("agent_id", ASCENDING), ("updated_at", ASCENDING), ("id", ASCENDING)], name="agent_updated_at_id"),
+        IndexModel([("updated_at", ASCENDING), ("id", ASCENDING)], name="updated_at_id"),
+        # Search: phone prefixes read in order, and words in names and notes
+        IndexModel([("phone_normalized", ASCENDING), ("id", ASCENDING)], name="phone_normalized_id"),
+        IndexModel(
+            [("first_name", TEXT), ("notes", TEXT)], name="first_name_notes_text",
+            weights={"first_name": 5, "notes": 1}, default_language="none",
+        ),
+    ],
+    # ASSIGNMENT_STORAGE=buckets: listing by agent or upload, bulk deletes, admin listing
+    BUCKETS_COLLECTION: [
+        IndexModel([("agent_id", ASCENDING), ("created_at", ASCENDING)], name="agent_created_at"),
+        IndexModel([("upload_id", ASCENDING), ("created_at", ASCENDING)], name="upload_created_at"),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    TOMBSTONES_COLLECTION: [
+        IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=TOMBSTONE_RETENTION_SECONDS, name="deleted_at_ttl"),
+        IndexModel([("agent_id", ASCENDING), ("deleted_at", ASCENDING), ("id", ASCENDING)], name="agent_deleted_at_id"),
+        IndexModel([("kind", ASCENDING), ("deleted_at", ASCENDING), ("id", ASCENDING)], name="kind_deleted_at_id"),
+    ],
+    "uploads": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("uploaded_at", DESCENDING)], name="uploaded_at_desc"),
+        # Finding uploads whose worker died (UploadJobManager.reap_orphans)
+        IndexModel([("status", ASCENDING)], name="status"),
+        # Duplicate upload detection; failed and cancelled uploads drop both fields
+        IndexModel(
+            [("content_hash", ASCENDING)], unique=True, name="content_hash_unique",
+            partialFilterExpression={"content_hash": {"$type": "string"}},
+        ),
+        IndexModel(
+            [("idempotency_key", ASCENDING)], unique=True, name="idempotency_key_unique",
+            partialFilterExpression={"idempotency_key": {"$type": "string"}},
+        ),
+    ],
+    # The rejected-rows report, in file order, and removing an upload's rejections
+    REJECTIONS_COLLECTION: [
+        IndexModel([("upload_id", ASCENDING), ("row", ASCENDING)], name="upload_row"),
+    ],
+    "rebalances": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "assignment_counters": [
+        IndexModel([("agent_id", ASCENDING)], unique=True, name="agent_id_unique"),
+    ],
+}
+
+# (name, collection, filter, sort, projection) for each hot query, with representative values
+HOT_QUERIES = [
+    ("login admin by email", "admins", {"email": "someone@example.com"}, None, None),
+    ("login agent by email", "agents", {"email": "someone@example.com"}, None, None),
+    ("agent by id", "agents", {"id": "agent-id"}, None, None),
+    ("upload by id", "uploads", {"id": "upload-id"}, None, None),
+    ("upload by content hash", "uploads", {"content_hash": "0" * 64}, None, None),
+    ("uploads newest first", "uploads", {}, [("uploaded_at", DESCENDING)], {"_id": 0}),
+    ("assignments page", "assignments", {}, KEYSET_SORT, {"_id": 0}),
+    ("assignments by agent", "assignments", {"agent_id": "agent-id"}, KEYSET_SORT, {"_id": 0}),
+    ("assignments by upload", "assignments", {"upload_id": "upload-id"}, KEYSET_SORT, {"_id": 0}),
+    ("assignments by phone prefix", "assignments", {"phone_normalized": {"$regex": "^555"}}, [("phone_normalized", ASCENDING), ("id", ASCENDING)], {"_id": 0}),
+    ("assignment buckets by agent", BUCKETS_COLLECTION, {"agent_id": "agent-id"}, [("created_at", ASCENDING)], {"_id": 0}),
+    ("assignment changes by agent", "assignments", {"agent_id": "agent-id", "updated_at": {"$gte": datetime(2024, 1, 1, tzinfo=timezone.utc)}}, [("updated_at", ASCENDING), ("id", ASCENDING)], {"_id": 0}),
+]
+
+
+async def ensure_indexes(db) -> dict:
+    """Create all declared indexes; returns {collection: [created names]}.
+
+    Indexes are created one at a time so a single failure (e.g. existing duplicate
+    emails blocking a unique index) is logged without skipping the rest.
+    """
+    created = {}
+    for collection, models in INDEXES.items():
+        created[collection] = []
+        for model in models:
+            try:
+                created[collection] += await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                logger.error("Could not create index %s on %s: %s", model.document['name'], collection, e)
+    return created
+
+
+def _plan_stages(plan: dict):
+    while plan:
+        yield plan
+        if "inputStages" in plan:
+            for child in plan["inputStages"]:
+                yield from _plan_stages(child)
+            return
+        plan = plan.get("inputStage")
+
+
+def summarize_plan(explain: dict) -> dict:
+    winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+    # Slot-based engine plans nest the classic tree under queryPlan
+    winning = winning.get("queryPlan", winning)
+    stages = list(_plan_stages(winning))
+    names = [stage.get("stage") for stage in stages]
+    indexes = [stage["indexName"] for stage in stages if stage.get("stage") == "IXSCAN" and "indexName" in stage]
+    return {
+        "stages": names,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in names,
+        "in_memory_sort": "SORT" in names,
+        "covered": bool(indexes) and "FETCH" not in names and "COLLSCAN" not in names,
+    }
+
+
+async def explain_hot_queries(db) -> list:
+    report = []
+    for name, collection, query, sort, projection in HOT_QUERIES:
+        command = {"find": collection, "filter": query, "limit": 1}
+        if sort:
+            command["sort"] = dict(sort)
+        if projection:
+            command["projection"] = projection
+        try:
+            explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except OperationFailure as e:
+            report.append({"query": name, "collection": collection, "error": str(e)})
+            continue
+        report.append({"query": name, "collection": collection, "filter": query, **summarize_plan(explain)})
+    return report
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for collection, names in (await ensure_indexes(db)).items():
+            print(f"{collection}: {', '.join(names) or '-'}")
+        print()
+        for row in await explain_hot_queries(db):
+            if "error" in row:
+                print(f"?? {row['query']}: {row['error']}")
+                continue
+            verdict = "COLLSCAN" if row["collection_scan"] else ("covered" if row["covered"] else "indexed")
+            print(f"{verdict:<9} {row['query']:<24} {', '.join(row['indexes']) or '-'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
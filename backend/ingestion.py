@@ -0,0 +1,242 @@
+import asyncio
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from validation import normalize_leads
+
+try:
+    import python_calamine
+except ImportError:  # pragma: no cover - optional speedup
+    python_calamine = None
+
+REQUIRED_COLUMNS = ['FirstName', 'Phone', 'Notes']
+
+
+class LeadFileError(Exception):
+    """Raised when an uploaded lead file cannot be parsed."""
+
+
+def missing_columns(df: pd.DataFrame) -> list:
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+
+def peek_columns(fileobj, filename: str):
+    """Return the header of a CSV upload without parsing its rows.
+
+    Returns None for Excel workbooks, whose header is only known once the sheet is parsed.
+    """
+    if not filename.endswith('.csv'):
+        return None
+    try:
+        return list(pd.read_csv(fileobj, nrows=0).columns)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError) as e:
+        raise LeadFileError(str(e)) from e
+
+
+def copy_and_hash(src, dst, chunk_size: int = 1024 * 1024) -> str:
+    """Copy one file object into another; returns the sha256 hex digest of the bytes copied."""
+    digest = hashlib.sha256()
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+        dst.write(chunk)
+
+
+# Parallel parsing
+#
+# Everything below runs in a worker pool. The functions are module-level so they
+# can be pickled into a process pool; they take a path rather than a file object.
+
+_SCAN_BYTES = 64 * 1024
+_PARSE_ERRORS = (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError)
+
+
+def _row_end(fh, start: int, target: int, size: int) -> int:
+    """Offset just past the first row terminator at or after target, starting a row at start.
+
+    A newline only ends a row when an even number of quotes precede it in the row
+    block, so newlines inside quoted fields never split a record.
+    """
+    if target >= size:
+        return size
+    fh.seek(start)
+    quotes = fh.read(target - start).count(b'"')
+    pos = target
+    while True:
+        piece = fh.read(_SCAN_BYTES)
+        if not piece:
+            return size
+        i = 0
+        while True:
+            nl = piece.find(b'\n', i)
+            if nl < 0:
+                quotes += piece.count(b'"', i)
+                break
+            quotes += piece.count(b'"', i, nl)
+            if quotes % 2 == 0:
+                return pos + nl + 1
+            i = nl + 1
+        pos += len(piece)
+
+
+def split_csv(path: str, block_bytes: int):
+    """Return (header_end, [(start, end), ...]) byte ranges of whole CSV rows, about block_bytes each."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fh:
+        header_end = _row_end(fh, 0, 0, size)
+        blocks = []
+        start = header_end
+        while start < size:
+            end = _row_end(fh, start, min(start + block_bytes, size), size)
+            blocks.append((start, end))
+            start = end
+    return header_end, blocks
+
+
+def parse_csv_block(path: str, header_end: int, start: int = 0, end: int = 0) -> pd.DataFrame:
+    """Parse the header plus the rows in [start, end) of a CSV file, normalized when the columns are there.
+
+    Every cell is read as text, so phones keep their leading zeros and empty cells
+    stay empty instead of becoming NaN.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read(header_end)
+        if end > start:
+            fh.seek(start)
+            data += fh.read(end - start)
+    try:
+        df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    except _PARSE_ERRORS as e:
+        raise LeadFileError(str(e)) from e
+    return df if missing_columns(df) else normalize_leads(df)
+
+
+def _cell(value):
+    # Spreadsheet numbers come back as floats; integral ones (phone numbers) are written as ints, like read_excel
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def excel_to_csv(path: str, out_path: str) -> str:
+    """Stream the first sheet of a workbook into a CSV file and return the engine used.
+
+    Uses calamine (Rust, handles .xlsx and .xls) when python-calamine is installed,
+    otherwise openpyxl in read-only mode for .xlsx and pandas/xlrd for .xls.
+    """
+    try:
+        with open(out_path, 'w', newline='', encoding='utf-8') as out:
+            writer = csv.writer(out)
+            if python_calamine is not None:
+                workbook = python_calamine.CalamineWorkbook.from_path(path)
+                try:
+                    for row in workbook.get_sheet_by_index(0).iter_rows():
+                        writer.writerow([_cell(value) for value in row])
+                finally:
+                    workbook.close()
+                return "calamine"
+
+            if path.endswith('.xlsx'):
+                from openpyxl import load_workbook
+
+                workbook = load_workbook(path, read_only=True, data_only=True)
+                try:
+                    for row in workbook.worksheets[0].iter_rows(values_only=True):
+                        writer.writerow(['' if value is None else _cell(value) for value in row])
+                finally:
+                    workbook.close()
+                return "openpyxl"
+
+            pd.read_excel(path).to_csv(out, index=False)
+            return "xlrd"
+    except LeadFileError:
+        raise
+    except Exception as e:
+        raise LeadFileError(str(e)) from e
+
+
+def _warm_worker() -> int:
+    # Unpickling this imports the module (and pandas) in the worker; the pause keeps
+    # one worker from taking every warm-up call
+    time.sleep(0.05)
+    return os.getpid()
+
+
+class ParsePool:
+    """Parses stored lead files on a worker pool so the event loop only awaits frames.
+
+    CSV files are cut into blocks of about ``block_bytes`` at row boundaries and
+    parsed in parallel; workbooks are first streamed to CSV in a worker. Each file
+    keeps at most ``workers`` blocks in flight and frames come back in file order,
+    so distribution is the same as a sequential parse.
+    """
+
+    def __init__(self, workers: int = 2, block_bytes: int = 4 * 1024 * 1024, kind: str = "process"):
+        self.workers = workers
+        self.block_bytes = block_bytes
+        self.kind = kind
+        if kind == "process":
+            # Forking a process that runs an event loop and driver threads is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def warm_up(self):
+        """Start every worker now instead of on the first upload."""
+        await asyncio.gather(*(self._run(_warm_worker) for _ in range(self.workers)))
+
+    async def frames(self, path: str, filename: str, chunk_rows: int):
+        """Yield the rows of a stored lead file as DataFrames of at most chunk_rows rows."""
+        converted = None
+        try:
+            if not filename.endswith('.csv'):
+                converted = f"{path}.csv"
+                await self._run(excel_to_csv, path, converted)
+                path = converted
+
+            header_end, blocks = await self._run(split_csv, path, self.block_bytes)
+            if header_end == 0:
+                raise LeadFileError("No columns to parse from file")
+            if not blocks:
+                yield await self._run(parse_csv_block, path, header_end)
+                return
+
+            pending = deque()
+            blocks = iter(blocks)
+            try:
+                while True:
+                    while len(pending) < self.workers:
+                        block = next(blocks, None)
+                        if block is None:
+                            break
+                        pending.append(asyncio.ensure_future(self._run(parse_csv_block, path, header_end, *block)))
+                    if not pending:
+                        return
+                    df = await pending.popleft()
+                    for start in range(0, len(df), chunk_rows):
+                        yield df.iloc[start:start + chunk_rows]
+            finally:
+                for future in pending:
+                    future.cancel()
+        finally:
+            if converted:
+                try:
+                    os.remove(converted)
+                except OSError:
+                    pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
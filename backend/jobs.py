@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from distribution import LOAD_AWARE_STRATEGIES, STRATEGIES, InsufficientCapacity, build_assignments
+from ingestion import REQUIRED_COLUMNS, LeadFileError, missing_columns
+from metrics import UPLOAD_ROWS, PhaseTimer
+from stats import agent_loads, count_batch, forget_upload
+from sync import record_upload_removed, stamp
+from validation import REJECTIONS_COLLECTION, LeadValidator, record_rejections
+
+logger = logging.getLogger(__name__)
+
+# Upload job states
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+ACTIVE_STATES = (QUEUED, PROCESSING)
+
+
+class UploadJobError(Exception):
+    """An upload that cannot be processed; the message is shown to the admin."""
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class UploadJobManager:
+    """Runs stored uploads through parse -> validate -> distribute -> insert in background tasks.
+
+    Progress is written to the upload document after every chunk so any worker can
+    serve the status endpoint. Cancellation is requested through the
+    ``cancel_requested`` flag on the document (checked on every progress write) and,
+    when the job runs in this process, by cancelling its task directly. Rows that
+    fail validation are counted per reason and the first ``max_rejected_rows`` of
+    them are kept for the rejected-rows report.
+
+    Every worker renews a lease (``heartbeat_at``) on the uploads it holds while
+    ``maintain()`` runs, and fails uploads whose lease ran out: their worker died,
+    and they would otherwise stay queued or processing, holding their content
+    hash and idempotency key, for good.
+    """
+
+    def __init__(self, chunk_rows: int, batch_size: int, concurrency: int, roster, parser,
+                 maintain_counters: bool = False, events=None, store=None, max_rejected_rows: int = 100000,
+                 lease_seconds: float = 60.0):
+        self.chunk_rows = chunk_rows
+        self.batch_size = batch_size
+        self.max_rejected_rows = max_rejected_rows
+        self.lease_seconds = lease_seconds
+        self.roster = roster
+        self.parser = parser
+        self.maintain_counters = maintain_counters
+        self.events = events
+        # A buckets.BucketStore when assignments are stored in buckets, else None
+        self.store = store
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = {}
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, db, upload_id: str, path: str, filename: str):
+        task = asyncio.create_task(self._run(db, upload_id, path, filename))
+        self._tasks[upload_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(upload_id, None))
+
+    def cancel(self, upload_id: str) -> bool:
+        task = self._tasks.get(upload_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def maintain(self, db):
+        """Renew this worker's leases and reap orphaned uploads, until cancelled."""
+        while True:
+            try:
+                await self.renew_leases(db)
+                await self.reap_orphans(db)
+            except Exception:
+                logger.exception("Upload lease maintenance failed")
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def renew_leases(self, db):
+        if self._tasks:
+            await db.uploads.update_many(
+                {"id": {"$in": list(self._tasks)}, "status": {"$in": list(ACTIVE_STATES)}},
+                {"$set": {"heartbeat_at": _now()}},
+            )
+
+    async def reap_orphans(self, db) -> int:
+        """Fail queued or processing uploads whose lease has expired; returns how many."""
+        cutoff = _now() - timedelta(seconds=self.lease_seconds)
+        # Uploads that never got a heartbeat (stored as null, or older docs without the
+        # field; None matches both) count from when they were stored
+        expired = {"status": {"$in": list(ACTIVE_STATES)}, "$or": [
+            {"heartbeat_at": {"$lt": cutoff}},
+            {"heartbeat_at": None, "uploaded_at": {"$lt": cutoff}},
+        ]}
+        reaped = 0
+        async for upload in db.uploads.find(expired, {"_id": 0, "id": 1}):
+            if upload['id'] in self._tasks:
+                continue
+            # Claiming the upload first keeps two workers from reaping it at once
+            claimed = await db.uploads.find_one_and_update(
+                {"id": upload['id'], **expired}, {"$set": {"status": FAILED}}
+            )
+            if claimed is None:
+                continue
+            logger.warning("Upload %s lost its worker, failing it", upload['id'])
+            await self._abort(db, upload['id'], FAILED, "Upload was interrupted, please upload the file again")
+            reaped += 1
+        return reaped
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _run(self, db, upload_id, path, filename):
+        try:
+            async with self._slots:
+                await self._process(db, upload_id, path, filename)
+        except (asyncio.CancelledError, UploadCancelled):
+            await self._abort(db, upload_id, CANCELLED, None)
+        except LeadFileError as e:
+            await self._abort(db, upload_id, FAILED, f"Error reading file: {str(e)}")
+        except (UploadJobError, InsufficientCapacity) as e:
+            await self._abort(db, upload_id, FAILED, str(e))
+        except Exception as e:
+            logger.exception("Upload %s failed", upload_id)
+            await self._abort(db, upload_id, FAILED, str(e))
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _process(self, db, upload_id, path, filename):
+        started = await db.uploads.find_one_and_update(
+            {"id": upload_id, "status": QUEUED, "cancel_requested": {"$ne": True}},
+            {"$set": {"status": PROCESSING, "started_at": _now()}},
+        )
+        if started is None:
+            raise UploadCancelled()
+
+        agents = await self.roster.agents(db)
+        if not agents:
+            raise UploadJobError("No agents available for distribution")
+
+        strategy_name = started.get("strategy") or "round_robin"
+        loads = None
+        if strategy_name in LOAD_AWARE_STRATEGIES:
+            if self.store is not None:
+                loads = await self.store.agent_loads(db)
+            else:
+                loads = await agent_loads(db, self.maintain_counters)
+        strategy = STRATEGIES[strategy_name](agents, loads)
+
+        rows_parsed = 0
+        rows_inserted = 0
+        rows_distributed = 0
+        rejections_stored = 0
+        batch = []
+        validator = LeadValidator()
+        timer = PhaseTimer()
+
+        # Parsing (and per-row normalization) happens on the parse pool; this loop
+        # drops duplicates, then distributes and inserts
+        frames = self.parser.frames(path, filename, self.chunk_rows)
+        try:
+            while True:
+                with timer.time("parse"):
+                    df = await anext(frames, None)
+                if df is None:
+                    break
+                if rows_parsed == 0 and missing_columns(df):
+                    raise UploadJobError(f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}")
+                rows_parsed += len(df)
+
+                with timer.time("validate"):
+                    df, rejected = validator.validate(df)
+                if len(rejected):
+                    rejections_stored += await record_rejections(
+                        db, upload_id, rejected, self.max_rejected_rows - rejections_stored
+                    )
+
+                if len(df):
+                    with timer.time("distribute"):
+                        batch.extend(build_assignments(
+                            df, agents, strategy.allocate(len(df)), upload_id, first_seq=rows_distributed
+                        ))
+                    rows_distributed += len(df)
+
+                while len(batch) >= self.batch_size:
+                    with timer.time("insert"):
+                        rows_inserted += await self._insert(db, upload_id, batch[:self.batch_size])
+                    del batch[:self.batch_size]
+
+                await self._report(db, upload_id, rows_parsed, rows_inserted, validator)
+
+            if batch:
+                with timer.time("insert"):
+                    rows_inserted += await self._insert(db, upload_id, batch)
+        finally:
+            await frames.aclose()
+            timer.observe()
+
+        await db.uploads.update_one({"id": upload_id}, {"$set": {
+            "status": COMPLETED,
+            "total_records": rows_inserted,
+            "rows_parsed": rows_parsed,
+            "rows_inserted": rows_inserted,
+            "rows_rejected": validator.rows_rejected,
+            "rejected_reasons": dict(validator.rejected),
+            "agents_count": len(agents),
+            "finished_at": _now(),
+        }})
+
+    async def _insert(self, db, upload_id, docs) -> int:
+        # created_at is taken when the batch is written rather than when its chunk was
+        # distributed, so it follows insertion order (streams resume from it)
+        now = stamp(docs)
+        for doc in docs:
+            doc['created_at'] = now
+        if self.store is not None:
+            await self.store.insert(db, docs)
+        else:
+            await db.assignments.insert_many(docs)
+        if self.maintain_counters:
+            await count_batch(db, upload_id, docs)
+        UPLOAD_ROWS.inc(amount=len(docs))
+        if self.events is not None:
+            self.events.inserted(docs)
+        return len(docs)
+
+    async def _report(self, db, upload_id, rows_parsed, rows_inserted, validator):
+        doc = await db.uploads.find_one_and_update(
+            {"id": upload_id},
+            {"$set": {
+                "rows_parsed": rows_parsed,
+                "rows_inserted": rows_inserted,
+                "rows_rejected": validator.rows_rejected,
+                "rejected_reasons": dict(validator.rejected),
+            }},
+            projection={"_id": 0, "cancel_requested": 1},
+        )
+        if doc is None or doc.get("cancel_requested"):
+            raise UploadCancelled()
+
+    async def _abort(self, db, upload_id, state, error):
+        # Roll back whatever was inserted so a failed or cancelled upload leaves no leads behind
+        if self.maintain_counters:
+            await forget_upload(db, upload_id)
+        if self.store is not None:
+            await self.store.delete(db, upload_id=upload_id)
+        else:
+            await db.assignments.delete_many({"upload_id": upload_id})
+        await record_upload_removed(db, upload_id)
+        await db[REJECTIONS_COLLECTION].delete_many({"upload_id": upload_id})
+        # Dropping the hash and key lets the same file be uploaded again
+        await db.uploads.update_one({"id": upload_id}, {
+            "$set": {
+                "status": state,
+                "error": error,
+                "total_records": 0,
+                "rows_inserted": 0,
+                "rows_rejected": 0,
+                "rejected_reasons": {},
+                "finished_at": _now(),
+            },
+            "$unset": {"content_hash": "", "idempotency_key": ""},
+        })
@@ -0,0 +1,272 @@
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+# Request latency buckets in seconds, from a cached token check up to a slow export
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upload phases run for seconds to minutes
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        lines += [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items]
+        return lines
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; or, with ``function``, read at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        lines = self._header()
+        if self.function is not None:
+            return lines + [f"{self.name} {_number(self.function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        lines += [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items]
+        return lines
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observe() is one bisect and two additions under a lock."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (made cumulative when rendered), then sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self.register(Gauge(name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template and status code", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until the response body was fully sent", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being served", ("method",))
+
+MONGO_COMMANDS = REGISTRY.histogram(
+    "mongodb_command_duration_seconds", "Driver-measured MongoDB command time", ("collection", "command"))
+MONGO_FAILURES = REGISTRY.counter(
+    "mongodb_command_failures_total", "MongoDB commands that returned an error", ("collection", "command"))
+
+UPLOAD_PHASES = REGISTRY.histogram(
+    "upload_phase_seconds", "Time per upload spent in each phase", ("phase",), buckets=PHASE_BUCKETS)
+UPLOAD_ROWS = REGISTRY.counter(
+    "upload_rows_total", "Lead rows inserted by upload jobs")
+
+PASSWORD_OPERATIONS = REGISTRY.counter(
+    "password_operations_total", "bcrypt hash and verify calls", ("operation",))
+PASSWORD_LATENCY = REGISTRY.histogram(
+    "password_operation_duration_seconds", "bcrypt call time including pool queueing", ("operation",))
+
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "admission_active", "Admitted heavy requests currently running", ("limit",))
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "admission_queued", "Heavy requests waiting for a slot", ("limit",))
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Requests shed by admission control", ("limit", "reason"))
+
+
+class PhaseTimer:
+    """Accumulates the time one upload spends per phase; observe() records the totals."""
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, phase: str, seconds: float):
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+
+    def time(self, phase: str):
+        return _Timing(self, phase)
+
+    def observe(self):
+        for phase, seconds in self.totals.items():
+            UPLOAD_PHASES.observe(seconds, phase)
+
+
+class _Timing:
+    __slots__ = ("timer", "phase", "start")
+
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and labels it with the matched route template.
+
+    Unmatched paths share one label, so ids in URLs never create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec(method)
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start, method, template)
+            HTTP_REQUESTS.inc(method, template, status_code)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding MONGO_COMMANDS; runs on driver threads."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event):
+        return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.observe(event.duration_micros / 1e6, self._finish(event), event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        MONGO_COMMANDS.observe(event.duration_micros / 1e6, collection, event.command_name)
+        MONGO_FAILURES.inc(collection, event.command_name)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+from search import normalize_phones
+
+logger = logging.getLogger(__name__)
+
+# Timestamp fields that used to be written as ISO strings
+DATE_FIELDS = {
+    "admins": ["created_at"],
+    "agents": ["created_at"],
+    "uploads": ["uploaded_at", "started_at", "finished_at"],
+    "assignments": ["created_at"],
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_field(db, collection: str, field: str, batch_size: int = 1000, pause: float = 0.0) -> int:
+    """Convert string timestamps in one field to native dates, batch_size documents at a time.
+
+    Each update is conditional on the old string value, so documents rewritten
+    concurrently by the application are left alone. Safe to interrupt and re-run.
+    """
+    converted = 0
+    last_id = None
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await db[collection].find(query, {"_id": 1, field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return converted
+        last_id = docs[-1]["_id"]
+
+        ops = []
+        for doc in docs:
+            try:
+                ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: parse_timestamp(doc[field])}}))
+            except ValueError:
+                logger.warning("Leaving unparseable %s.%s on %s: %r", collection, field, doc["_id"], doc[field])
+        if ops:
+            result = await db[collection].bulk_write(ops, ordered=False)
+            converted += result.modified_count
+        if pause:
+            # Give foreground traffic room between batches on a busy primary
+            await asyncio.sleep(pause)
+
+
+async def backfill_phone_normalized(db, batch_size: int = 1000, pause: float = 0.0) -> int:
+    """Add phone_normalized to assignments created before phone search existed."""
+    filled = 0
+    last_id = None
+    while True:
+        query = {"phone_normalized": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await db.assignments.find(query, {"_id": 1, "phone": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return filled
+        last_id = docs[-1]["_id"]
+
+        phones = normalize_phones([doc.get("phone", "") for doc in docs])
+        ops = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"phone_normalized": phone}})
+            for doc, phone in zip(docs, phones)
+        ]
+        result = await db.assignments.bulk_write(ops, ordered=False)
+        filled += result.modified_count
+        if pause:
+            await asyncio.sleep(pause)
+
+
+async def migrate_dates(db, batch_size: int = 1000, pause: float = 0.0) -> dict:
+    report = {}
+    for collection, fields in DATE_FIELDS.items():
+        for field in fields:
+            report[f"{collection}.{field}"] = await migrate_field(db, collection, field, batch_size, pause)
+    return report
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name, converted in (await migrate_dates(db)).items():
+            print(f"{name}: {converted} converted")
+        print(f"assignments.phone_normalized: {await backfill_phone_normalized(db)} filled")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
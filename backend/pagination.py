@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque keyset cursor pointing just after doc in (created_at, seq, id) order."""
+    created_at = doc['created_at']
+    if isinstance(created_at, datetime):
+        key = ["d", created_at.isoformat(), doc.get('seq'), doc['id']]
+    else:
+        key = ["s", created_at, doc.get('seq'), doc['id']]
+    raw = json.dumps(key, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, seq, id); seq is None for rows stored before they had one."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(key) == 2:
+            # Cursors issued while timestamps were still stored as strings
+            key = ["s", *key]
+        if len(key) == 3:
+            # Cursors issued before rows had a seq
+            key = [key[0], key[1], None, key[2]]
+        kind, created_at, seq, doc_id = key
+        if kind == "d":
+            created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if kind not in ("d", "s") or not isinstance(created_at, (datetime, str)) or not isinstance(doc_id, str):
+        raise InvalidCursor("Invalid cursor")
+    if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool)):
+        raise InvalidCursor("Invalid cursor")
+    return created_at, seq, doc_id
+
+
+def after_cursor(cursor: str) -> dict:
+    """Query clause selecting documents strictly after the cursor position."""
+    created_at, seq, doc_id = decode_cursor(cursor)
+    clauses = [{"created_at": {"$gt": created_at}}]
+    if seq is None:
+        # A missing seq sorts before every number, like None in sequence_key
+        clauses += [
+            {"created_at": created_at, "seq": None, "id": {"$gt": doc_id}},
+            {"created_at": created_at, "seq": {"$ne": None}},
+        ]
+    else:
+        clauses += [
+            {"created_at": created_at, "seq": {"$gt": seq}},
+            {"created_at": created_at, "seq": seq, "id": {"$gt": doc_id}},
+        ]
+    if isinstance(created_at, str):
+        # Legacy string timestamps sort before native dates, so every date comes after them
+        clauses.append({"created_at": {"$type": "date"}})
+    return {"$or": clauses}
+
+
+def sequence_key(seq, doc_id: str) -> tuple:
+    """Sort key of the rows sharing one created_at, in the order MongoDB sorts (seq, id)."""
+    return (seq is not None, seq or 0, doc_id)
+
+
+# Every lead of an upload chunk shares created_at; seq (the row's position in its
+# upload) keeps them in file order and insertion order, id breaks the remaining ties
+KEYSET_SORT = [("created_at", 1), ("seq", 1), ("id", 1)]
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from metrics import PASSWORD_LATENCY, PASSWORD_OPERATIONS
+
+
+class PasswordPoolSaturated(Exception):
+    """Raised when too many password operations are already queued."""
+
+
+@lru_cache(maxsize=None)
+def _context(rounds: int) -> CryptContext:
+    # min_rounds == default_rounds makes hashes with a lower cost report needs_update
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+
+# Module-level so they can be pickled into a process pool
+def _hash(rounds: int, password: str) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(rounds: int, password: str, hashed: str):
+    return _context(rounds).verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a bounded worker pool.
+
+    At most ``workers`` hashes run at once; up to ``max_pending`` operations may be
+    running or waiting, beyond which callers get PasswordPoolSaturated instead of
+    queueing without bound.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 4, max_pending: int = 64, kind: str = "thread"):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.kind = kind
+        if kind == "process":
+            # Forking a process that runs an event loop and driver threads is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _run(self, operation, fn, *args):
+        if self._pending >= self.max_pending:
+            raise PasswordPoolSaturated()
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+            PASSWORD_OPERATIONS.inc(operation)
+            PASSWORD_LATENCY.observe(time.perf_counter() - start, operation)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, self.rounds, password)
+
+    async def hash_many(self, passwords: list) -> list:
+        """Hash a batch of passwords across all workers, keeping at most ``workers`` of them queued.
+
+        Reserves its slots up front, so a batch either runs to completion or fails
+        with PasswordPoolSaturated before any hashing starts.
+        """
+        if not passwords:
+            return []
+        slots = min(self.workers, len(passwords))
+        if self._pending + slots > self.max_pending:
+            raise PasswordPoolSaturated()
+        self._pending += slots
+        try:
+            loop = asyncio.get_running_loop()
+            hashes = [None] * len(passwords)
+            queue = iter(range(len(passwords)))
+
+            async def drain():
+                for i in queue:
+                    start = time.perf_counter()
+                    hashes[i] = await loop.run_in_executor(self._executor, _hash, self.rounds, passwords[i])
+                    PASSWORD_OPERATIONS.inc("hash")
+                    PASSWORD_LATENCY.observe(time.perf_counter() - start, "hash")
+
+            await asyncio.gather(*(drain() for _ in range(slots)))
+            return hashes
+        finally:
+            self._pending -= slots
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """Return (valid, new_hash); new_hash is set when the stored hash should be upgraded."""
+        return await self._run("verify", _verify_and_update, self.rounds, password, hashed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import uuid
+from collections import Counter, defaultdict
+
+import numpy as np
+from pymongo import DESCENDING, UpdateMany
+
+from distribution import UNCAPPED, InsufficientCapacity, _water_fill
+from jobs import CANCELLED, COMPLETED, FAILED, PROCESSING, QUEUED, _now
+from stats import COUNTERS_COLLECTION, agent_loads, move_counters, rebuild_counters
+from sync import record_reassigned
+
+logger = logging.getLogger(__name__)
+
+REBALANCES_COLLECTION = "rebalances"
+
+# even: same number of assignments per agent (within capacity)
+# weighted: proportional to each agent's weight
+# reassign: only move the assignments of removed agents, to the least-loaded agents
+REBALANCE_MODES = ("even", "weighted", "reassign")
+
+
+class RebalanceCancelled(Exception):
+    pass
+
+
+def _caps(agents: list) -> np.ndarray:
+    return np.array(
+        [UNCAPPED if agent.get('capacity') is None else int(agent['capacity']) for agent in agents],
+        dtype=np.int64,
+    )
+
+
+def _weighted_targets(current: np.ndarray, weights: np.ndarray, total: int) -> np.ndarray:
+    """Split total in proportion to weights; leftover rows go to the largest fractions, busier agents first."""
+    if weights.sum() == 0:
+        weights = np.ones_like(weights)
+    quotas = total * weights / weights.sum()
+    targets = np.floor(quotas).astype(np.int64)
+    order = np.lexsort((-current, -(quotas - targets)))
+    targets[order[:total - int(targets.sum())]] += 1
+    return targets
+
+
+def plan_rebalance(agents: list, loads: dict, mode: str = "even", sources: list = None) -> dict:
+    """Work out who should hand how many assignments to whom.
+
+    loads holds the current count per agent id, including ids of agents that no
+    longer exist; their assignments are always moved to agents on the roster.
+    Returns the per-agent targets and a list of (from, to, count) transfers.
+    """
+    if not agents:
+        raise InsufficientCapacity("No agents available for distribution")
+    agent_ids = [agent['id'] for agent in agents]
+    on_roster = set(agent_ids)
+    current = np.array([int(loads.get(agent_id, 0)) for agent_id in agent_ids], dtype=np.int64)
+    orphans = {
+        agent_id: int(n) for agent_id, n in loads.items()
+        if agent_id not in on_roster and n > 0 and (sources is None or agent_id in sources)
+    }
+    caps = _caps(agents)
+    total = int(current.sum()) + sum(orphans.values())
+
+    if mode == "reassign":
+        moving = sum(orphans.values())
+        room = np.clip(caps - current, 0, None)
+        if int(room.sum()) < moving:
+            raise InsufficientCapacity(f"Agents can take {int(room.sum())} more assignments, {moving} need a new agent")
+        targets = current + (_water_fill(current, moving, room) if moving else 0)
+    elif mode == "weighted":
+        if int(caps.sum()) < total:
+            raise InsufficientCapacity(f"Agents can hold {int(caps.sum())} assignments, there are {total}")
+        weights = np.array([1 if agent.get('weight') is None else max(int(agent['weight']), 0) for agent in agents], dtype=np.int64)
+        targets = np.minimum(_weighted_targets(current, weights, total), caps)
+        # What capped agents cannot hold goes to the least-loaded agents with room, weighted ones first
+        excess = total - int(targets.sum())
+        if excess:
+            room = np.where(weights > 0, caps - targets, 0)
+            if int(room.sum()) < excess:
+                room = caps - targets
+            targets += _water_fill(targets, excess, room)
+    else:
+        if int(caps.sum()) < total:
+            raise InsufficientCapacity(f"Agents can hold {int(caps.sum())} assignments, there are {total}")
+        # Agents that already hold more keep the odd extra row, so fewer rows move
+        order = np.argsort(-current, kind='stable')
+        targets = np.empty_like(current)
+        targets[order] = _water_fill(np.zeros(len(agents), dtype=np.int64), total, caps[order])
+
+    donors = [(agent_id, n) for agent_id, n in orphans.items()]
+    donors += [(agent_ids[i], int(current[i] - targets[i])) for i in np.flatnonzero(current > targets)]
+    receivers = [(agent_ids[i], int(targets[i] - current[i])) for i in np.flatnonzero(targets > current)]
+
+    transfers = []
+    r = 0
+    for from_id, surplus in donors:
+        while surplus > 0 and r < len(receivers):
+            to_id, deficit = receivers[r]
+            n = min(surplus, deficit)
+            transfers.append({"from_agent_id": from_id, "to_agent_id": to_id, "count": n})
+            surplus -= n
+            if deficit == n:
+                r += 1
+            else:
+                receivers[r] = (to_id, deficit - n)
+
+    names = {agent['id']: agent['name'] for agent in agents}
+    return {
+        "mode": mode,
+        "total_assignments": total,
+        "moves": sum(transfer['count'] for transfer in transfers),
+        "orphaned": orphans,
+        "agents": [
+            {"agent_id": agent_id, "agent_name": names[agent_id], "current": int(c), "target": int(t)}
+            for agent_id, c, t in zip(agent_ids, current, targets)
+        ],
+        "transfers": [
+            {**transfer, "to_agent_name": names[transfer['to_agent_id']], "from_agent_name": names.get(transfer['from_agent_id'])}
+            for transfer in transfers
+        ],
+    }
+
+
+class RebalanceManager:
+    """Moves assignments between agents in the background, one bounded batch at a time.
+
+    Each batch takes up to ``batch_size`` of one donor's newest assignments and
+    reassigns them with a single unordered bulk_write; every update is
+    conditional on the donor still owning the row, so concurrent writes are never
+    overwritten. Jobs run one at a time per process and are planned when they
+    start, against the loads at that moment. Progress and cancellation work like
+    upload jobs, through the job document.
+    """
+
+    def __init__(self, roster, batch_size: int = 1000, pause: float = 0.0, maintain_counters: bool = False):
+        self.roster = roster
+        self.batch_size = batch_size
+        self.pause = pause
+        self.maintain_counters = maintain_counters
+        self._slot = asyncio.Semaphore(1)
+        self._tasks = {}
+
+    async def _loads(self, db, upload_id: str = None) -> dict:
+        if upload_id is None:
+            return await agent_loads(db, self.maintain_counters)
+        rows = db.assignments.aggregate([
+            {"$match": {"upload_id": upload_id}},
+            {"$group": {"_id": "$agent_id", "count": {"$sum": 1}}},
+        ])
+        return {row['_id']: row['count'] async for row in rows}
+
+    async def preview(self, db, mode: str, upload_id: str = None, sources: list = None) -> dict:
+        plan = plan_rebalance(await self.roster.agents(db), await self._loads(db, upload_id), mode, sources)
+        return {**plan, "upload_id": upload_id}
+
+    async def submit(self, db, mode: str, requested_by: str, upload_id: str = None, sources: list = None) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "mode": mode,
+            "upload_id": upload_id,
+            "sources": sources,
+            "status": QUEUED,
+            "requested_by": requested_by,
+            "created_at": _now(),
+            "planned": 0,
+            "moved": 0,
+            "cancel_requested": False,
+        }
+        await db[REBALANCES_COLLECTION].insert_one(dict(job))
+        task = asyncio.create_task(self._run(db, job))
+        self._tasks[job['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job['id'], None))
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        task = self._tasks.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def shutdown(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _finish(self, db, job_id, state, error=None):
+        await db[REBALANCES_COLLECTION].update_one(
+            {"id": job_id}, {"$set": {"status": state, "error": error, "finished_at": _now()}}
+        )
+
+    async def _run(self, db, job):
+        # Rows already moved stay moved on failure or cancellation; a new rebalance continues from there
+        try:
+            async with self._slot:
+                await self._process(db, job)
+        except (asyncio.CancelledError, RebalanceCancelled):
+            await self._finish(db, job['id'], CANCELLED)
+        except InsufficientCapacity as e:
+            await self._finish(db, job['id'], FAILED, str(e))
+        except Exception as e:
+            logger.exception("Rebalance %s failed", job['id'])
+            await self._finish(db, job['id'], FAILED, str(e))
+
+    async def _process(self, db, job):
+        started = await db[REBALANCES_COLLECTION].find_one_and_update(
+            {"id": job['id'], "status": QUEUED, "cancel_requested": {"$ne": True}},
+            {"$set": {"status": PROCESSING, "started_at": _now()}},
+        )
+        if started is None:
+            raise RebalanceCancelled()
+
+        agents = await self.roster.agents(db)
+        plan = plan_rebalance(agents, await self._loads(db, job['upload_id']), job['mode'], job['sources'])
+        await db[REBALANCES_COLLECTION].update_one({"id": job['id']}, {"$set": {
+            "planned": plan['moves'],
+            "transfers": [
+                {key: transfer[key] for key in ("from_agent_id", "to_agent_id", "count")}
+                for transfer in plan['transfers']
+            ],
+        }})
+
+        names = {agent['id']: agent['name'] for agent in agents}
+        by_donor = defaultdict(list)
+        for transfer in plan['transfers']:
+            by_donor[transfer['from_agent_id']].append([transfer['to_agent_id'], transfer['count']])
+
+        moved = 0
+        counters_drifted = False
+        scope = {"upload_id": job['upload_id']} if job['upload_id'] else {}
+        for donor, receivers in by_donor.items():
+            while receivers:
+                wanted = min(self.batch_size, sum(count for _, count in receivers))
+                docs = await db.assignments.find(
+                    {"agent_id": donor, **scope}, {"_id": 0, "id": 1, "upload_id": 1}
+                ).sort([("created_at", DESCENDING), ("seq", DESCENDING), ("id", DESCENDING)]).limit(wanted).to_list(wanted)
+                if not docs:
+                    # The donor ran out (rows deleted or moved elsewhere meanwhile)
+                    break
+
+                # Slice the batch between receivers, grouped per upload for the counters
+                groups = defaultdict(list)
+                start = 0
+                while start < len(docs):
+                    to_id, count = receivers[0]
+                    take = min(count, len(docs) - start)
+                    for doc in docs[start:start + take]:
+                        groups[(donor, to_id, doc['upload_id'])].append(doc['id'])
+                    start += take
+                    if take == count:
+                        receivers.pop(0)
+                    else:
+                        receivers[0][1] = count - take
+
+                now = _now()
+                ops = [
+                    UpdateMany(
+                        {"id": {"$in": ids}, "agent_id": from_id},
+                        {"$set": {"agent_id": to_id, "agent_name": names[to_id], "updated_at": now}},
+                    )
+                    for (from_id, to_id, _), ids in groups.items()
+                ]
+                result = await db.assignments.bulk_write(ops, ordered=False)
+                # The receivers see the rows as changed; the donor's clients need to be told they left
+                complete = result.modified_count == len(docs)
+                if complete:
+                    reassigned = [doc['id'] for doc in docs]
+                else:
+                    # Rows that left the donor before the update got their tombstones from whoever moved them
+                    reassigned = []
+                    for (_, to_id, _), ids in groups.items():
+                        landed = db.assignments.find({"id": {"$in": ids}, "agent_id": to_id}, {"_id": 0, "id": 1})
+                        reassigned += [doc['id'] async for doc in landed]
+                await record_reassigned(db, donor, reassigned, now)
+                moved += result.modified_count
+                if not complete:
+                    counters_drifted = True
+                elif self.maintain_counters:
+                    await move_counters(db, Counter({key: len(ids) for key, ids in groups.items()}))
+
+                await self._report(db, job['id'], moved)
+                if self.pause:
+                    # Leave room for foreground traffic between batches
+                    await asyncio.sleep(self.pause)
+
+        if self.maintain_counters:
+            if counters_drifted:
+                await rebuild_counters(db)
+            # Drop the emptied counters of removed agents
+            await db[COUNTERS_COLLECTION].delete_many({"agent_id": {"$in": list(plan['orphaned'])}, "total": {"$lte": 0}})
+
+        await db[REBALANCES_COLLECTION].update_one({"id": job['id']}, {"$set": {
+            "status": COMPLETED,
+            "moved": moved,
+            "finished_at": _now(),
+        }})
+
+    async def _report(self, db, job_id, moved):
+        doc = await db[REBALANCES_COLLECTION].find_one_and_update(
+            {"id": job_id},
+            {"$set": {"moved": moved}},
+            projection={"_id": 0, "cancel_requested": 1},
+        )
+        if doc is None or doc.get("cancel_requested"):
+            raise RebalanceCancelled()
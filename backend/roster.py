@@ -0,0 +1,49 @@
+import time
+
+META_COLLECTION = "meta"
+ROSTER_VERSION_ID = "agents_roster"
+
+
+class RosterCache:
+    """In-process copy of the agents collection (without password hashes).
+
+    Every agent write bumps a version stamp in the meta collection. A worker checks
+    that stamp at most every ``check_interval`` seconds and reloads the roster only
+    when it changed, so agents edited through another worker show up within one
+    interval and edits made through this worker show up immediately.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._agents = None
+        self._version = None
+        self._checked_at = 0.0
+
+    async def _stored_version(self, db) -> int:
+        doc = await db[META_COLLECTION].find_one({"_id": ROSTER_VERSION_ID}, {"version": 1})
+        return doc["version"] if doc else 0
+
+    async def load(self, db):
+        """Return (version, agents); agents is shared and must not be mutated."""
+        now = time.monotonic()
+        if self._agents is not None and now - self._checked_at < self.check_interval:
+            return self._version, self._agents
+
+        version = await self._stored_version(db)
+        if self._agents is None or version != self._version:
+            # Version is read before the agents, so a concurrent write can only make us reload again
+            self._agents = await db.agents.find({}, {"_id": 0, "password_hash": 0}).to_list(None)
+            self._version = version
+        self._checked_at = now
+        return self._version, self._agents
+
+    async def agents(self, db) -> list:
+        return (await self.load(db))[1]
+
+    async def version(self, db) -> int:
+        return (await self.load(db))[0]
+
+    async def invalidate(self, db):
+        """Call after any write to the agents collection."""
+        await db[META_COLLECTION].update_one({"_id": ROSTER_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+        self._agents = None
@@ -0,0 +1,101 @@
+import base64
+import json
+from pagination import KEYSET_SORT, InvalidCursor, after_cursor, encode_cursor
+from validation import phone_digits
+
+# Fields a search may ask for; id and the sort key are always returned
+SEARCH_FIELDS = (
+    "id", "agent_id", "agent_name", "first_name", "phone", "phone_normalized",
+    "notes", "upload_id", "created_at", "updated_at",
+)
+PHONE_SORT = [("phone_normalized", 1), ("id", 1)]
+
+
+def normalize_phone(phone) -> str:
+    """Digits only, so '+1 (555) 010-0000' and '15550100000' match the same prefix searches."""
+    return phone_digits([phone])[0]
+
+
+def normalize_phones(phones) -> list:
+    return phone_digits(phones)
+
+
+def _encode_phone_cursor(doc: dict) -> str:
+    raw = json.dumps(["p", doc['phone_normalized'], doc['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _after_phone_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        kind, phone, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if kind != "p" or not isinstance(phone, str) or not isinstance(doc_id, str):
+        raise InvalidCursor("Invalid cursor")
+    return {"$or": [
+        {"phone_normalized": {"$gt": phone}},
+        {"phone_normalized": phone, "id": {"$gt": doc_id}},
+    ]}
+
+
+class AssignmentSearch:
+    """One search over assignments, turned into an index-friendly find().
+
+    A phone prefix becomes an anchored regex on phone_normalized and the results
+    are ordered by that field, so the prefix range of the phone_normalized_id
+    index is read in order and only one page of it is touched. Without a phone
+    the order is (created_at, seq, id), served by the created_at indexes (led by
+    agent_id or upload_id when those are given). ``text`` uses the text index
+    over first_name and notes; its matches are then sorted by (created_at, seq, id)
+    with a top-k sort bounded by the page size.
+    """
+
+    def __init__(self, text=None, phone=None, agent_id=None, upload_id=None, created=None, fields=None):
+        self.text = text
+        self.phone = normalize_phone(phone) if phone is not None else None
+        self.agent_id = agent_id
+        self.upload_id = upload_id
+        self.created = created
+        self.fields = fields
+
+    @property
+    def sort(self) -> list:
+        return PHONE_SORT if self.phone else KEYSET_SORT
+
+    def query(self, after: str = None) -> dict:
+        clauses = []
+        if self.agent_id:
+            clauses.append({"agent_id": self.agent_id})
+        if self.upload_id:
+            clauses.append({"upload_id": self.upload_id})
+        if self.created:
+            clauses.append({"created_at": self.created})
+        if self.phone:
+            clauses.append({"phone_normalized": {"$regex": f"^{self.phone}"}})
+        if self.text:
+            clauses.append({"$text": {"$search": self.text}})
+        if after:
+            clauses.append(_after_phone_cursor(after) if self.phone else after_cursor(after))
+        if not clauses:
+            return {}
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
+
+    def projection(self) -> dict:
+        if not self.fields:
+            return {"_id": 0}
+        keys = {"id", *(field for field, _ in self.sort), *self.fields}
+        return {"_id": 0, **{field: 1 for field in keys}}
+
+    def cursor_for(self, doc: dict) -> str:
+        return _encode_phone_cursor(doc) if self.phone else encode_cursor(doc)
+
+    async def page(self, db, limit: int, after: str = None):
+        """Return (docs, next_cursor); next_cursor is None on the last page."""
+        docs = await db.assignments.find(self.query(after), self.projection()).sort(self.sort).limit(limit + 1).to_list(limit + 1)
+        if len(docs) > limit:
+            docs = docs[:limit]
+            return docs, self.cursor_for(docs[-1])
+        return docs, None
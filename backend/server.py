@@ -1,36 +1,259 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Header, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter, ValidationError
 from typing import List, Optional
 import uuid
+from collections import Counter
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
 import jwt
-import pandas as pd
-import io
+import hashlib
+import tempfile
+import time
+
+from admission import AdmissionRejected, ConcurrencyLimit, TokenBucket
+from agent_import import AgentImportError, existing_emails, insert_agents, parse_agent_csv
+from buckets import BUCKET_SIZE, BucketStore
+from database import create_client, open_connections, ping, wait_until_reachable
+from distribution import STRATEGIES, InsufficientCapacity
+from events import ALL_AGENTS, AssignmentBroker
+from indexes import ensure_indexes, explain_hot_queries
+from ingestion import REQUIRED_COLUMNS, LeadFileError, ParsePool, copy_and_hash, peek_columns
+from jobs import (
+    COMPLETED as UPLOAD_COMPLETED,
+    FINISHED_STATES as UPLOAD_FINISHED_STATES,
+    QUEUED as UPLOAD_QUEUED,
+    UploadJobManager,
+)
+from metrics import CONTENT_TYPE, REGISTRY, UPLOAD_PHASES, MetricsMiddleware, MongoCommandMetrics
+from pagination import KEYSET_SORT, InvalidCursor, after_cursor, decode_cursor, encode_cursor, sequence_key
+from passwords import PasswordHasher, PasswordPoolSaturated
+from rebalance import REBALANCE_MODES, REBALANCES_COLLECTION, RebalanceManager
+from responses import ClosingStreamingResponse, CompressionMiddleware, FastJSONResponse, dumps
+from roster import RosterCache
+from search import SEARCH_FIELDS, AssignmentSearch
+from stats import build_stats, count_by_agent_and_upload, ensure_counters, forget_agent, read_counters, rebuild_counters
+from sync import InvalidSyncToken, SyncTokenExpired, changes_since, current_sync_token, record_agent_removed
+from token_cache import TokenCache
+from validation import REJECTIONS_COLLECTION, rejection_report
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Prometheus-text metrics at /metrics; cheap enough to leave on
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# MongoDB connection; the client is created in lifespan() so it is never inherited across a fork.
+# Pool size, timeouts and compression come from the MONGO_* variables in database.py.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+DB_NAME = os.environ['DB_NAME']
+client = None
+db = None
+
+# Startup warm-up and health checks
+MONGO_STARTUP_TIMEOUT_SECONDS = float(os.environ.get('MONGO_STARTUP_TIMEOUT_SECONDS', '10'))
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get('MONGO_WARMUP_CONNECTIONS', os.environ.get('MONGO_MIN_POOL_SIZE') or '10'))
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_PING_TIMEOUT_SECONDS', '1'))
+# Keep serving (while reporting not ready) this long after shutdown starts, so load balancers drain us first
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', '0'))
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+passwords = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', '12')),
+    workers=int(os.environ.get('PASSWORD_POOL_WORKERS', '4')),
+    max_pending=int(os.environ.get('PASSWORD_POOL_MAX_PENDING', '64')),
+    kind=os.environ.get('PASSWORD_POOL_KIND', 'thread')
+)
 security = HTTPBearer()
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# EventSource cannot send headers, so streams authenticate with a token in the URL; it is a
+# separate short-lived token that only opens streams, never the login token
+STREAM_TOKEN_SECONDS = int(os.environ.get('STREAM_TOKEN_SECONDS', '60'))
+STREAM_TOKEN_PURPOSE = "stream"
+token_cache = TokenCache(
+    maxsize=int(os.environ.get('JWT_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('JWT_CACHE_TTL_SECONDS', '300'))
+)
+
+# Bulk agent import
+AGENTS_BULK_MAX_ROWS = int(os.environ.get('AGENTS_BULK_MAX_ROWS', '5000'))
+AGENTS_BULK_INSERT_BATCH_SIZE = int(os.environ.get('AGENTS_BULK_INSERT_BATCH_SIZE', '500'))
+
+# Assignment storage: "documents" keeps one document per lead; "buckets" packs the leads of
+# one (upload, agent, insert batch) into bucket documents (see buckets.BucketStore).
+# Delta sync, search and rebalancing need per-lead documents and answer 501 with buckets.
+ASSIGNMENT_STORAGE = os.environ.get('ASSIGNMENT_STORAGE', 'documents')
+if ASSIGNMENT_STORAGE not in ('documents', 'buckets'):
+    raise ValueError(f"ASSIGNMENT_STORAGE must be 'documents' or 'buckets', not {ASSIGNMENT_STORAGE!r}")
+bucket_store = BucketStore(int(os.environ.get('ASSIGNMENT_BUCKET_SIZE', str(BUCKET_SIZE)))) if ASSIGNMENT_STORAGE == 'buckets' else None
+
+# Upload ingestion
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', Path(tempfile.gettempdir()) / 'agentlist-uploads'))
+UPLOAD_CHUNK_ROWS = int(os.environ.get('UPLOAD_CHUNK_ROWS', '10000'))
+# Each insert batch is split per agent into buckets, so bucket storage inserts whole chunks
+UPLOAD_INSERT_BATCH_SIZE = int(os.environ.get('UPLOAD_INSERT_BATCH_SIZE', '1000' if bucket_store is None else str(UPLOAD_CHUNK_ROWS)))
+UPLOAD_JOB_CONCURRENCY = int(os.environ.get('UPLOAD_JOB_CONCURRENCY', '2'))
+# A worker renews its uploads' lease a few times per period; uploads whose lease runs out
+# (their worker died) are failed by the others, which frees their file hash for a new upload
+UPLOAD_JOB_LEASE_SECONDS = float(os.environ.get('UPLOAD_JOB_LEASE_SECONDS', '60'))
+# Rejected rows kept per upload for the report; the counts per reason are always complete
+UPLOAD_MAX_REJECTED_ROWS = int(os.environ.get('UPLOAD_MAX_REJECTED_ROWS', '100000'))
+DEFAULT_DISTRIBUTION_STRATEGY = os.environ.get('DEFAULT_DISTRIBUTION_STRATEGY', 'round_robin')
+
+# CSV/Excel parsing runs here, off the event loop
+parse_pool = ParsePool(
+    workers=int(os.environ.get('PARSE_POOL_WORKERS', '2')),
+    block_bytes=int(os.environ.get('PARSE_BLOCK_BYTES', str(4 * 1024 * 1024))),
+    kind=os.environ.get('PARSE_POOL_KIND', 'process')
+)
+
+# Stats: keep materialized per-agent counters instead of aggregating on every request
+# Buckets already carry their size, so bucket storage aggregates them and ignores this
+ASSIGNMENT_COUNTERS = os.environ.get('ASSIGNMENT_COUNTERS', 'false').lower() in ('1', 'true', 'yes') and bucket_store is None
+
+# Agent roster cache, shared by the agent list, uploads and stats
+roster = RosterCache(check_interval=float(os.environ.get('ROSTER_CHECK_INTERVAL_SECONDS', '1')))
+
+# Live assignment streams (SSE). "memory" fans out the uploads of this worker only;
+# "change_stream" follows MongoDB (replica sets) so every worker sees every upload.
+ASSIGNMENT_EVENTS_BACKEND = os.environ.get('ASSIGNMENT_EVENTS_BACKEND', 'memory')
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '3000'))
+SSE_BACKLOG_PAGE_SIZE = 500
+# Replays start this long before the client's last event: two uploads inserting at once can
+# commit a batch after a later-stamped one was already sent. Clients de-duplicate by id.
+SSE_REPLAY_OVERLAP_SECONDS = float(os.environ.get('SSE_REPLAY_OVERLAP_SECONDS', '2'))
+assignment_events = AssignmentBroker(max_batches=int(os.environ.get('SSE_MAX_QUEUED_BATCHES', '256')))
+
+upload_jobs = UploadJobManager(
+    UPLOAD_CHUNK_ROWS, UPLOAD_INSERT_BATCH_SIZE, UPLOAD_JOB_CONCURRENCY,
+    roster=roster, parser=parse_pool, maintain_counters=ASSIGNMENT_COUNTERS, events=assignment_events,
+    store=bucket_store, max_rejected_rows=UPLOAD_MAX_REJECTED_ROWS, lease_seconds=UPLOAD_JOB_LEASE_SECONDS
+)
+
+# Moving assignments between agents
+rebalancer = RebalanceManager(
+    roster,
+    batch_size=int(os.environ.get('REBALANCE_BATCH_SIZE', '1000')),
+    pause=float(os.environ.get('REBALANCE_BATCH_PAUSE_SECONDS', '0')),
+    maintain_counters=ASSIGNMENT_COUNTERS
+)
+
+# Admission control for heavy endpoints: <NAME>_CONCURRENCY requests run at once, the next
+# <NAME>_QUEUE wait up to ADMISSION_QUEUE_TIMEOUT_SECONDS, <NAME>_PER_USER caps a single admin.
+# A concurrency of 0 turns the limit off.
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', '5'))
+
+def concurrency_limit(name: str, concurrency: int, queue: int, per_user: int):
+    prefix = f"ADMISSION_{name.upper()}"
+    return ConcurrencyLimit(
+        name,
+        concurrency=int(os.environ.get(f'{prefix}_CONCURRENCY', str(concurrency))),
+        max_queue=int(os.environ.get(f'{prefix}_QUEUE', str(queue))),
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        per_user=int(os.environ.get(f'{prefix}_PER_USER', str(per_user)))
+    )
+
+ADMISSION_LIMITS = {
+    limit.name: limit for limit in (
+        concurrency_limit("uploads", 4, 8, 2),
+        # Admin listings and exports only; agents read their own, index-bounded slice
+        concurrency_limit("exports", 8, 16, 2),
+        concurrency_limit("agent_imports", 2, 2, 1),
+    )
+}
+# Login attempts per client address and email; bcrypt work is also bounded by the password pool
+login_attempts = TokenBucket(
+    "login",
+    rate=float(os.environ.get('LOGIN_RATE_PER_SECOND', '0.5')),
+    burst=int(os.environ.get('LOGIN_RATE_BURST', '10'))
+)
+
+# Scrape-time gauges
+REGISTRY.gauge("password_pool_pending", "bcrypt calls running or queued", function=lambda: passwords.pending)
+REGISTRY.gauge("upload_jobs_active", "Upload jobs queued or running in this process", function=lambda: upload_jobs.active)
+REGISTRY.gauge("token_cache_entries", "Verified JWTs currently cached", function=lambda: token_cache.stats()['size'])
+REGISTRY.gauge("assignment_streams", "Open assignment event streams", function=lambda: assignment_events.connections)
+
+# Assignment listing
+ASSIGNMENTS_MAX_PAGE_SIZE = 10000
+SEARCH_DEFAULT_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 1000
+NDJSON_FLUSH_ROWS = 500
+
+# Render list endpoints straight from their trusted projections, without re-validating each row
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+# gzip/brotli for response bodies of at least this many bytes; 0 disables compression
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+
+async def warm_up():
+    """Open pooled connections, create indexes and fill caches before reporting ready."""
+    started = time.perf_counter()
+    await open_connections(client, MONGO_WARMUP_CONNECTIONS)
+    await ensure_indexes(db)
+    await roster.load(db)
+    # Stats and load-aware strategies read the counters, so they must be seeded before serving
+    if ASSIGNMENT_COUNTERS and await ensure_counters(db):
+        logger.info("Assignment counters rebuilt from the assignments")
+    await parse_pool.warm_up()
+    app.state.warmed_up = True
+    logger.info("Warm-up finished in %.2fs", time.perf_counter() - started)
+
+async def warm_up_when_reachable():
+    while not await wait_until_reachable(client, MONGO_STARTUP_TIMEOUT_SECONDS):
+        pass
+    await warm_up()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db
+    client = create_client(mongo_url, [MongoCommandMetrics()] if METRICS_ENABLED else [])
+    db = client[DB_NAME]
+    app.state.started_at = time.monotonic()
+    
+    # A database that is down at deploy time must not keep the process from starting;
+    # readiness stays false and warm-up continues in the background
+    background_tasks = []
+    if await wait_until_reachable(client, MONGO_STARTUP_TIMEOUT_SECONDS):
+        await warm_up()
+    else:
+        background_tasks.append(asyncio.create_task(warm_up_when_reachable()))
+    # The change stream watches the assignments collection, which bucket storage leaves empty
+    if ASSIGNMENT_EVENTS_BACKEND == "change_stream" and bucket_store is None:
+        background_tasks.append(asyncio.create_task(assignment_events.follow(db)))
+    background_tasks.append(asyncio.create_task(upload_jobs.maintain(db)))
+    
+    yield
+    
+    app.state.draining = True
+    # Open streams would hold the server up; their clients reconnect elsewhere and resume
+    assignment_events.close()
+    if SHUTDOWN_DRAIN_SECONDS > 0:
+        await asyncio.sleep(SHUTDOWN_DRAIN_SECONDS)
+    for task in background_tasks:
+        task.cancel()
+    await upload_jobs.shutdown()
+    await rebalancer.shutdown()
+    parse_pool.shutdown()
+    passwords.shutdown()
+    client.close()
+
+app = FastAPI(lifespan=lifespan)
+app.state.warmed_up = False
+app.state.draining = False
+app.state.started_at = time.monotonic()
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -49,8 +272,13 @@ class Agent(BaseModel):
     email: EmailStr
     mobile: str
     role: str = "agent"
+    # Used by the weighted and capacity_capped distribution strategies
+    weight: int = 1
+    capacity: Optional[int] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+AGENT_LIST = TypeAdapter(List[Agent])
+
 class Assignment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -61,14 +289,42 @@ class Assignment(BaseModel):
     notes: str
     upload_id: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Position of the lead in its upload, the keyset tiebreak after created_at; missing on older rows
+    seq: Optional[int] = None
+    # Last insert or reassignment, for delta sync; missing on rows older than it
+    updated_at: Optional[datetime] = None
 
 class Upload(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     filename: str
-    total_records: int
+    total_records: int = 0
     uploaded_by: str
     uploaded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Background job state; uploads created before jobs existed were processed inline
+    status: str = UPLOAD_COMPLETED
+    strategy: str = "round_robin"
+    rows_parsed: int = 0
+    rows_inserted: int = 0
+    # Rows dropped by validation, and how many per reason (see validation.py)
+    rows_rejected: int = 0
+    rejected_reasons: dict = Field(default_factory=dict)
+    agents_count: int = 0
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Renewed while a worker holds the upload; see UploadJobManager
+    heartbeat_at: Optional[datetime] = None
+    # sha256 of the file and the client's Idempotency-Key; both unique while the upload stands
+    content_hash: Optional[str] = None
+    idempotency_key: Optional[str] = None
+
+UPLOAD_LIST = TypeAdapter(List[Upload])
+
+class RebalanceRequest(BaseModel):
+    mode: str = Field("even", pattern=f"^({'|'.join(REBALANCE_MODES)})$")
+    upload_id: Optional[str] = None
 
 # Input Models
 class LoginRequest(BaseModel):
@@ -85,19 +341,40 @@ class AgentCreate(BaseModel):
     email: EmailStr
     mobile: str
     password: str
+    weight: int = Field(1, ge=0)
+    capacity: Optional[int] = Field(None, ge=0)
 
 class AgentUpdate(BaseModel):
     name: Optional[str] = None
     email: Optional[EmailStr] = None
     mobile: Optional[str] = None
     password: Optional[str] = None
+    weight: Optional[int] = Field(None, ge=0)
+    capacity: Optional[int] = Field(None, ge=0)
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await passwords.hash(password)
+
+async def verify_password(plain_password: str, hashed_password: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash uses an outdated cost."""
+    return await passwords.verify_and_update(plain_password, hashed_password)
+
+def date_range(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """Half-open [start, end) filter; only matches timestamps already stored as native dates."""
+    clause = {}
+    if start:
+        clause["$gte"] = start
+    if end:
+        clause["$lt"] = end
+    return clause
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
 
 def create_token(user_id: str, email: str, role: str) -> str:
     payload = {
@@ -108,21 +385,84 @@ def create_token(user_id: str, email: str, role: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def create_stream_token(user: dict) -> str:
+    payload = {
+        "user_id": user['user_id'],
+        "email": user['email'],
+        "role": user['role'],
+        "purpose": STREAM_TOKEN_PURPOSE,
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=STREAM_TOKEN_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    return authenticate(credentials.credentials)
+
+async def get_stream_user(
+    token: Optional[str] = Query(None, description="Stream token from POST /assignments/stream/token"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+):
+    """Like get_current_user, but also takes a stream token as ?token=, since EventSource cannot send headers."""
+    if credentials:
+        return authenticate(credentials.credentials)
+    if token:
+        payload = decode_token(token)
+        if payload.get("purpose") != STREAM_TOKEN_PURPOSE:
+            raise HTTPException(status_code=401, detail="Invalid token")
         return payload
+    raise HTTPException(status_code=403, detail="Not authenticated")
+
+def decode_token(token: str) -> dict:
+    try:
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def authenticate(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    
+    payload = decode_token(token)
+    # Stream tokens travel in URLs; they open event streams and nothing else
+    if payload.get("purpose") is not None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.put(token, payload)
+    return payload
+
 async def require_admin(current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+def document_storage_only():
+    """Dependency for endpoints that read or rewrite single assignment documents."""
+    if bucket_store is not None:
+        raise HTTPException(status_code=501, detail="Not available with ASSIGNMENT_STORAGE=buckets")
+
+def admission(name: str, roles=("admin", "agent")):
+    """Dependency that holds a slot of ADMISSION_LIMITS[name] while the request runs.
+
+    Yields the Ticket (None when the limit does not apply); a handler returning a
+    streamed body calls ticket.detach() and releases it when the response closes.
+    """
+    limit = ADMISSION_LIMITS[name]
+    
+    async def admit(current_user: dict = Depends(get_current_user)):
+        if limit.concurrency <= 0 or current_user['role'] not in roles:
+            yield None
+            return
+        ticket = await limit.acquire(current_user['user_id'])
+        try:
+            yield ticket
+        finally:
+            if not ticket.detached:
+                ticket.release()
+    
+    return admit
+
 # Auth Routes
 @api_router.post("/auth/register-admin")
 async def register_admin(admin_data: AdminCreate):
@@ -137,28 +477,41 @@ async def register_admin(admin_data: AdminCreate):
     )
     
     doc = admin.model_dump()
-    doc['password_hash'] = hash_password(admin_data.password)
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc['password_hash'] = await hash_password(admin_data.password)
     
-    await db.admins.insert_one(doc)
+    # The unique email index settles concurrent registrations that both passed the check above
+    try:
+        await db.admins.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Admin already exists")
     
     token = create_token(admin.id, admin.email, admin.role)
     return {"token": token, "user": admin, "message": "Admin registered successfully"}
 
 @api_router.post("/auth/login")
-async def login(login_data: LoginRequest):
-    # Check admin
-    user = await db.admins.find_one({"email": login_data.email})
-    if not user:
-        # Check agent
-        user = await db.agents.find_one({"email": login_data.email})
+async def login(login_data: LoginRequest, request: Request):
+    client_host = request.client.host if request.client else "unknown"
+    login_attempts.take(f"{client_host}:{login_data.email.lower()}")
+    
+    # Look up admin and agent concurrently so an agent login costs one round trip; admins win
+    admin, agent = await asyncio.gather(
+        db.admins.find_one({"email": login_data.email}),
+        db.agents.find_one({"email": login_data.email})
+    )
+    user = admin or agent
     
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(login_data.password, user['password_hash']):
+    valid, new_hash = await verify_password(login_data.password, user['password_hash'])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade hashes created with a lower bcrypt cost while we have the plain password
+    if new_hash:
+        collection = db.admins if user['role'] == 'admin' else db.agents
+        await collection.update_one({"id": user['id']}, {"$set": {"password_hash": new_hash}})
+    
     token = create_token(user['id'], user['email'], user['role'])
     
     user_data = {
@@ -181,24 +534,153 @@ async def create_agent(agent_data: AgentCreate, current_user: dict = Depends(req
     agent = Agent(
         name=agent_data.name,
         email=agent_data.email,
-        mobile=agent_data.mobile
+        mobile=agent_data.mobile,
+        weight=agent_data.weight,
+        capacity=agent_data.capacity
     )
     
     doc = agent.model_dump()
-    doc['password_hash'] = hash_password(agent_data.password)
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc['password_hash'] = await hash_password(agent_data.password)
     
-    await db.agents.insert_one(doc)
+    try:
+        await db.agents.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Agent with this email already exists")
+    
+    await roster.invalidate(db)
     return agent
 
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in error.errors()
+    )
+
+@api_router.post("/agents/bulk")
+async def bulk_create_agents(
+    request: Request,
+    current_user: dict = Depends(require_admin),
+    ticket=Depends(admission("agent_imports"))
+):
+    """Create agents from a CSV file (multipart field "file") or a JSON list.
+
+    Every row gets a result; invalid or duplicate rows do not stop the others.
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="Upload a CSV file in the 'file' field")
+            rows = parse_agent_csv(await upload.read())
+        else:
+            payload = await request.json()
+            rows = payload.get("agents") if isinstance(payload, dict) else payload
+            if not isinstance(rows, list):
+                raise HTTPException(status_code=400, detail='Expected a list of agents or {"agents": [...]}')
+    except AgentImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    
+    if len(rows) > AGENTS_BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {AGENTS_BULK_MAX_ROWS} agents per import")
+    
+    results = []
+    accepted = []
+    seen = set()
+    for row_number, row in enumerate(rows, start=1):
+        email = row.get('email') if isinstance(row, dict) else None
+        try:
+            agent_data = AgentCreate.model_validate(row)
+        except ValidationError as e:
+            results.append({"row": row_number, "email": email, "status": "invalid", "error": _validation_message(e)})
+            continue
+        result = {"row": row_number, "email": agent_data.email}
+        results.append(result)
+        if agent_data.email in seen:
+            result.update(status="duplicate", error="Email appears more than once in this import")
+            continue
+        seen.add(agent_data.email)
+        accepted.append((result, agent_data))
+    
+    # One query for every email instead of a find_one per agent
+    taken = await existing_emails(db, [agent_data.email for _, agent_data in accepted])
+    to_create = []
+    for result, agent_data in accepted:
+        if agent_data.email in taken:
+            result.update(status="duplicate", error="Agent with this email already exists")
+        else:
+            to_create.append((result, agent_data))
+    
+    # Hash everything before inserting anything, so a saturated pool fails the import cleanly
+    password_hashes = await passwords.hash_many([agent_data.password for _, agent_data in to_create])
+    
+    docs = []
+    for (result, agent_data), password_hash in zip(to_create, password_hashes):
+        agent = Agent(
+            name=agent_data.name,
+            email=agent_data.email,
+            mobile=agent_data.mobile,
+            weight=agent_data.weight,
+            capacity=agent_data.capacity
+        )
+        doc = agent.model_dump()
+        doc['password_hash'] = password_hash
+        docs.append(doc)
+        result.update(status="created", id=agent.id)
+    
+    # The unique email index catches agents created between the duplicate check and the insert
+    try:
+        rejected = await insert_agents(db, docs, AGENTS_BULK_INSERT_BATCH_SIZE)
+    finally:
+        # A batch that fails part-way may still have written agents
+        if docs:
+            await roster.invalidate(db)
+    for position in rejected:
+        result = to_create[position][0]
+        result.pop('id', None)
+        result.update(status="duplicate", error="Agent with this email already exists")
+    
+    outcomes = Counter(result['status'] for result in results)
+    
+    return {
+        "created": outcomes["created"],
+        "duplicates": outcomes["duplicate"],
+        "invalid": outcomes["invalid"],
+        "results": results
+    }
+
+# (roster list, its JSON); the roster replaces its list whenever it reloads
+_rendered_agents = (None, b"")
+
+def render_agents(agents: list) -> bytes:
+    """The roster as response_model=List[Agent] renders it, validated once per roster load.
+
+    Agents stored before weight/capacity existed get the model defaults, as they do on the
+    validated path, so GET /agents does not depend on FAST_JSON_RESPONSES.
+    """
+    global _rendered_agents
+    if _rendered_agents[0] is not agents:
+        _rendered_agents = (agents, AGENT_LIST.dump_json(AGENT_LIST.validate_python(agents)))
+    return _rendered_agents[1]
+
 @api_router.get("/agents", response_model=List[Agent])
-async def get_agents(current_user: dict = Depends(require_admin)):
-    agents = await db.agents.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
+async def get_agents(request: Request, response: Response, current_user: dict = Depends(require_admin)):
+    version, agents = await roster.load(db)
+    
+    # The roster version changes on every agent write, so it doubles as the ETag
+    etag = f'"agents-{version}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
     
-    for agent in agents:
-        if isinstance(agent['created_at'], str):
-            agent['created_at'] = datetime.fromisoformat(agent['created_at'])
+    if FAST_JSON_RESPONSES:
+        return Response(
+            content=render_agents(agents), media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": "no-cache"}
+        )
     
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
     return agents
 
 @api_router.put("/agents/{agent_id}")
@@ -210,156 +692,668 @@ async def update_agent(agent_id: str, agent_data: AgentUpdate, current_user: dic
     update_data = {k: v for k, v in agent_data.model_dump().items() if v is not None}
     
     if 'password' in update_data:
-        update_data['password_hash'] = hash_password(update_data['password'])
+        update_data['password_hash'] = await hash_password(update_data['password'])
         del update_data['password']
     
     if update_data:
-        await db.agents.update_one({"id": agent_id}, {"$set": update_data})
+        try:
+            await db.agents.update_one({"id": agent_id}, {"$set": update_data})
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Agent with this email already exists")
+        await roster.invalidate(db)
     
     return {"message": "Agent updated successfully"}
 
 @api_router.delete("/agents/{agent_id}")
-async def delete_agent(agent_id: str, current_user: dict = Depends(require_admin)):
+async def delete_agent(
+    agent_id: str,
+    reassign: bool = Query(False, description="Hand the agent's assignments to the least-loaded agents instead of deleting them"),
+    current_user: dict = Depends(require_admin)
+):
+    if reassign:
+        document_storage_only()
+    if reassign and not any(agent['id'] != agent_id for agent in await roster.agents(db)):
+        raise HTTPException(status_code=400, detail="No other agents to reassign to")
+    
     result = await db.agents.delete_one({"id": agent_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
+    await roster.invalidate(db)
+    
+    if reassign:
+        job = await rebalancer.submit(db, "reassign", current_user['email'], sources=[agent_id])
+        return {
+            "message": "Agent deleted, assignments are being reassigned",
+            "rebalance_id": job['id'],
+            "status_url": f"/api/assignments/rebalance/{job['id']}"
+        }
     
     # Also delete assignments
-    await db.assignments.delete_many({"agent_id": agent_id})
+    if bucket_store is not None:
+        await bucket_store.delete(db, agent_id=agent_id)
+    else:
+        await db.assignments.delete_many({"agent_id": agent_id})
+    await record_agent_removed(db, agent_id)
+    if ASSIGNMENT_COUNTERS:
+        await forget_agent(db, agent_id)
     
     return {"message": "Agent deleted successfully"}
 
 # Upload & Distribution Routes
-@api_router.post("/uploads")
-async def upload_and_distribute(file: UploadFile = File(...), current_user: dict = Depends(require_admin)):
+def duplicate_upload_response(original: dict):
+    return JSONResponse(status_code=200, content={
+        "message": "File was already uploaded",
+        "duplicate": True,
+        "upload_id": original['id'],
+        "status": original['status'],
+        "strategy": original.get('strategy', "round_robin"),
+        "status_url": f"/api/uploads/{original['id']}/status"
+    })
+
+async def find_duplicate_upload(content_hash: str, idempotency_key: Optional[str]):
+    keys = [{"content_hash": content_hash}]
+    if idempotency_key:
+        keys.append({"idempotency_key": idempotency_key})
+    return await db.uploads.find_one({"$or": keys}, {"_id": 0, "id": 1, "status": 1, "strategy": 1})
+
+@api_router.post("/uploads", status_code=status.HTTP_202_ACCEPTED)
+async def upload_and_distribute(
+    file: UploadFile = File(...),
+    strategy: str = Form(DEFAULT_DISTRIBUTION_STRATEGY),
+    force: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_user: dict = Depends(require_admin),
+    ticket=Depends(admission("uploads"))
+):
     # Validate file type
     if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only CSV, XLSX, and XLS files are allowed")
     
-    # Read file
-    contents = await file.read()
+    if strategy not in STRATEGIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown distribution strategy, use one of: {', '.join(STRATEGIES)}"
+        )
     
+    # Validate columns up front when the header can be read cheaply (CSV)
     try:
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        else:
-            df = pd.read_excel(io.BytesIO(contents))
-    except Exception as e:
+        columns = await run_in_threadpool(peek_columns, file.file, file.filename)
+    except LeadFileError as e:
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
-    
-    # Validate columns
-    required_columns = ['FirstName', 'Phone', 'Notes']
-    if not all(col in df.columns for col in required_columns):
+    if columns is not None and any(col not in columns for col in REQUIRED_COLUMNS):
         raise HTTPException(
             status_code=400,
-            detail=f"CSV must contain columns: {', '.join(required_columns)}"
+            detail=f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}"
         )
     
-    # Get all agents
-    agents = await db.agents.find({}, {"_id": 0}).to_list(1000)
-    if not agents:
+    if not await roster.agents(db):
         raise HTTPException(status_code=400, detail="No agents available for distribution")
     
-    # Create upload record
+    # A retried request carrying a known key is answered before the file is even stored
+    if idempotency_key:
+        original = await db.uploads.find_one(
+            {"idempotency_key": idempotency_key}, {"_id": 0, "id": 1, "status": 1, "strategy": 1}
+        )
+        if original:
+            return duplicate_upload_response(original)
+    
     upload = Upload(
         filename=file.filename,
-        total_records=len(df),
-        uploaded_by=current_user['email']
+        uploaded_by=current_user['email'],
+        status=UPLOAD_QUEUED,
+        strategy=strategy,
+        idempotency_key=idempotency_key
     )
     
-    upload_doc = upload.model_dump()
-    upload_doc['uploaded_at'] = upload_doc['uploaded_at'].isoformat()
-    await db.uploads.insert_one(upload_doc)
+    # Store the file so the background job can process it after this request returns,
+    # hashing it on the way through
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    path = UPLOAD_DIR / f"{upload.id}{Path(file.filename).suffix}"
+    file.file.seek(0)
+    started = time.perf_counter()
+    with open(path, 'wb') as out:
+        content_hash = await run_in_threadpool(copy_and_hash, file.file, out)
+    UPLOAD_PHASES.observe(time.perf_counter() - started, "read")
     
-    # Distribute records among agents
-    assignments = []
-    agent_count = len(agents)
+    # force re-distributes a file that was uploaded before; it is then not tracked for duplicates
+    if not force:
+        upload.content_hash = content_hash
+        original = await find_duplicate_upload(content_hash, idempotency_key)
+        if original:
+            path.unlink(missing_ok=True)
+            return duplicate_upload_response(original)
     
-    for idx, row in df.iterrows():
-        agent = agents[idx % agent_count]
-        
-        assignment = Assignment(
-            agent_id=agent['id'],
-            agent_name=agent['name'],
-            first_name=str(row['FirstName']),
-            phone=str(row['Phone']),
-            notes=str(row['Notes']),
-            upload_id=upload.id
-        )
-        
-        assignment_doc = assignment.model_dump()
-        assignment_doc['created_at'] = assignment_doc['created_at'].isoformat()
-        assignments.append(assignment_doc)
+    # The unique hash and key indexes collapse concurrent submissions of the same file
+    try:
+        await db.uploads.insert_one(upload.model_dump())
+    except DuplicateKeyError:
+        path.unlink(missing_ok=True)
+        original = await find_duplicate_upload(content_hash, idempotency_key)
+        if original is None:
+            raise HTTPException(status_code=409, detail="A duplicate upload was just cancelled, try again")
+        return duplicate_upload_response(original)
     
-    if assignments:
-        await db.assignments.insert_many(assignments)
+    upload_jobs.submit(db, upload.id, str(path), file.filename)
     
     return {
-        "message": "File uploaded and distributed successfully",
+        "message": "File accepted for processing",
         "upload_id": upload.id,
-        "total_records": len(df),
-        "agents_count": agent_count
+        "status": upload.status,
+        "strategy": upload.strategy,
+        "status_url": f"/api/uploads/{upload.id}/status"
     }
 
 @api_router.get("/uploads", response_model=List[Upload])
-async def get_uploads(current_user: dict = Depends(require_admin)):
-    uploads = await db.uploads.find({}, {"_id": 0}).sort("uploaded_at", -1).to_list(1000)
+async def get_uploads(
+    request: Request,
+    uploaded_from: Optional[datetime] = None,
+    uploaded_to: Optional[datetime] = None,
+    current_user: dict = Depends(require_admin)
+):
+    query = {}
+    if uploaded_from or uploaded_to:
+        query['uploaded_at'] = date_range(uploaded_from, uploaded_to)
+    
+    uploads = await db.uploads.find(query, {"_id": 0}).sort("uploaded_at", -1).to_list(1000)
+    
+    # Upload documents change with job progress, so the ETag is a hash of the rendered list
+    if FAST_JSON_RESPONSES:
+        body = dumps(uploads)
+    else:
+        body = UPLOAD_LIST.dump_json(UPLOAD_LIST.validate_python(uploads))
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.get("/uploads/{upload_id}/status")
+async def get_upload_status(upload_id: str, current_user: dict = Depends(require_admin)):
+    upload = await db.uploads.find_one({"id": upload_id}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    upload = Upload(**upload)
+    elapsed = None
+    if upload.started_at:
+        elapsed = ((upload.finished_at or datetime.now(timezone.utc)) - upload.started_at).total_seconds()
+    
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "status": upload.status,
+        "strategy": upload.strategy,
+        "rows_parsed": upload.rows_parsed,
+        "rows_inserted": upload.rows_inserted,
+        "rows_rejected": upload.rows_rejected,
+        "rejected_reasons": upload.rejected_reasons,
+        "total_records": upload.total_records,
+        "agents_count": upload.agents_count,
+        "rows_per_second": round(upload.rows_inserted / elapsed, 1) if elapsed else 0.0,
+        "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+        "error": upload.error,
+        "cancel_requested": upload.cancel_requested,
+        "uploaded_at": upload.uploaded_at,
+        "started_at": upload.started_at,
+        "finished_at": upload.finished_at
+    }
+
+@api_router.get("/uploads/{upload_id}/rejected")
+async def get_rejected_rows(upload_id: str, current_user: dict = Depends(require_admin)):
+    """The rows of an upload that failed validation, as CSV with their row number and reason."""
+    upload = await db.uploads.find_one({"id": upload_id}, {"_id": 0, "filename": 1})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    cursor = db[REJECTIONS_COLLECTION].find({"upload_id": upload_id}, {"_id": 0}).sort("row", 1)
+    name = Path(upload['filename']).stem.replace('"', '') or "upload"
+    return StreamingResponse(
+        rejection_report(cursor),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{name}-rejected.csv"'}
+    )
+
+@api_router.post("/uploads/{upload_id}/cancel")
+async def cancel_upload(upload_id: str, current_user: dict = Depends(require_admin)):
+    upload = await db.uploads.find_one_and_update(
+        {"id": upload_id, "status": {"$nin": list(UPLOAD_FINISHED_STATES)}},
+        {"$set": {"cancel_requested": True}},
+        projection={"_id": 0, "status": 1}
+    )
+    if not upload:
+        if await db.uploads.find_one({"id": upload_id}, {"_id": 1}):
+            raise HTTPException(status_code=409, detail="Upload has already finished")
+        raise HTTPException(status_code=404, detail="Upload not found")
     
-    for upload in uploads:
-        if isinstance(upload['uploaded_at'], str):
-            upload['uploaded_at'] = datetime.fromisoformat(upload['uploaded_at'])
+    # The job may be running in another worker; it will see the flag on its next progress write
+    upload_jobs.cancel(upload_id)
     
-    return uploads
+    return {"message": "Cancellation requested", "upload_id": upload_id}
 
 @api_router.get("/assignments")
-async def get_assignments(current_user: dict = Depends(get_current_user)):
+async def get_assignments(
+    request: Request,
+    after: Optional[str] = None,
+    since: Optional[str] = Query(None, description="Sync token; returns only what changed after it"),
+    limit: Optional[int] = Query(None, ge=1, le=ASSIGNMENTS_MAX_PAGE_SIZE),
+    upload_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    current_user: dict = Depends(get_current_user),
+    ticket=Depends(admission("exports", roles=("admin",)))
+):
+    if since:
+        document_storage_only()
+        if after or upload_id or created_from or created_to or output != "json":
+            raise HTTPException(status_code=400, detail="since can only be combined with agent_id and limit")
+        scope = current_user['user_id'] if current_user['role'] == 'agent' else agent_id
+        return await assignment_changes(request, since, scope, limit or ASSIGNMENTS_MAX_PAGE_SIZE)
+    
     query = {}
     
     # If agent, filter by agent_id
     if current_user['role'] == 'agent':
         query['agent_id'] = current_user['user_id']
+    elif agent_id:
+        query['agent_id'] = agent_id
+    if upload_id:
+        query['upload_id'] = upload_id
+    if created_from or created_to:
+        query['created_at'] = date_range(created_from, created_to)
+    if after:
+        try:
+            keyset = after_cursor(after)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if bucket_store is None:
+            query.update(keyset)
+    
+    # Taken before reading, so a delta from this token covers everything the read could miss
+    sync_token = current_sync_token()
+    page_size = limit or ASSIGNMENTS_MAX_PAGE_SIZE
     
-    assignments = await db.assignments.find(query, {"_id": 0}).to_list(10000)
+    # Streamed exports are unbounded unless a limit is given
+    if output == "ndjson":
+        if bucket_store is not None:
+            cursor = bucket_store.find(db, query, after, limit)
+        else:
+            cursor = db.assignments.find(query, {"_id": 0}).sort(KEYSET_SORT)
+            if limit:
+                cursor = cursor.limit(limit)
+        # The export keeps its admission slot until the response is over, even if it never starts
+        if ticket:
+            ticket.detach()
+        return ClosingStreamingResponse(
+            _ndjson_lines(cursor), on_close=ticket.release if ticket else lambda: None,
+            media_type="application/x-ndjson", headers={"X-Sync-Token": sync_token}
+        )
     
-    for assignment in assignments:
-        if isinstance(assignment['created_at'], str):
-            assignment['created_at'] = datetime.fromisoformat(assignment['created_at'])
+    # Bucket storage applies the cursor itself and yields the same docs in the same order
+    if bucket_store is not None:
+        assignments = [doc async for doc in bucket_store.find(db, query, after, page_size + 1)]
+    else:
+        assignments = await db.assignments.find(query, {"_id": 0}).sort(KEYSET_SORT).limit(page_size + 1).to_list(page_size + 1)
+    headers = {"X-Sync-Token": sync_token, "Cache-Control": "no-cache"}
+    if len(assignments) > page_size:
+        assignments = assignments[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor(assignments[-1])
     
-    return assignments
+    if FAST_JSON_RESPONSES:
+        rendered = FastJSONResponse(assignments, headers=headers)
+    else:
+        rendered = JSONResponse(jsonable_encoder(assignments), headers=headers)
+    etag = f'"{hashlib.sha1(rendered.body).hexdigest()}"'
+    rendered.headers["ETag"] = etag
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return rendered
+
+async def assignment_changes(request: Request, since: str, agent_id: Optional[str], limit: int):
+    """Delta for GET /assignments?since=: apply "deleted" first, then upsert "changed" by id."""
+    try:
+        delta = await changes_since(db, since, agent_id, limit)
+    except SyncTokenExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except InvalidSyncToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The ETag covers the changes only, so an empty delta stays 304 while the token moves on
+    etag = f'"{hashlib.sha1(dumps([delta["changed"], delta["deleted"]])).hexdigest()}"'
+    headers = {"ETag": etag, "X-Sync-Token": delta["sync_token"], "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(delta, headers=headers)
+
+async def _ndjson_lines(cursor):
+    lines = []
+    async for doc in cursor:
+        lines.append(dumps(doc))
+        if len(lines) >= NDJSON_FLUSH_ROWS:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+@api_router.get("/assignments/search", dependencies=[Depends(document_storage_only)])
+async def search_assignments(
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Words in first_name or notes"),
+    phone: Optional[str] = Query(None, max_length=32, description="Phone number prefix; spaces and punctuation are ignored"),
+    upload_id: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
+    after: Optional[str] = None,
+    limit: int = Query(SEARCH_DEFAULT_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """Filter assignments server-side; results are ordered by phone when phone is given, else by creation."""
+    if phone is not None and not any(c.isdigit() for c in phone):
+        raise HTTPException(status_code=400, detail="phone must contain digits")
+    
+    selected = None
+    if fields:
+        selected = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in selected if field not in SEARCH_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}; use any of: {', '.join(SEARCH_FIELDS)}"
+            )
+    
+    # Agents only ever search their own assignments
+    if current_user['role'] == 'agent':
+        agent_id = current_user['user_id']
+    
+    search = AssignmentSearch(
+        text=q,
+        phone=phone,
+        agent_id=agent_id,
+        upload_id=upload_id,
+        created=date_range(created_from, created_to) if created_from or created_to else None,
+        fields=selected
+    )
+    try:
+        docs, next_cursor = await search.page(db, limit, after)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if FAST_JSON_RESPONSES:
+        return FastJSONResponse(docs, headers=headers)
+    return JSONResponse(jsonable_encoder(docs), headers=headers)
+
+@api_router.post("/assignments/stream/token")
+async def get_stream_token(current_user: dict = Depends(get_current_user)):
+    """A token for GET /assignments/stream?token=, valid for STREAM_TOKEN_SECONDS.
+
+    It is checked when a stream connects; a connected stream outlives it.
+    """
+    return {"token": create_stream_token(current_user), "expires_in": STREAM_TOKEN_SECONDS}
+
+@api_router.get("/assignments/stream")
+async def stream_assignments(
+    request: Request,
+    after: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    current_user: dict = Depends(get_stream_user)
+):
+    """Server-Sent Events carrying assignments as they are created.
+
+    Each event holds a batch of assignments; its id is the keyset cursor of the
+    last one. Assignments are stamped when their batch is inserted and numbered in
+    file order, so event ids follow insertion order and a reconnect with
+    Last-Event-ID (or ?after=) first replays what was missed, starting
+    SSE_REPLAY_OVERLAP_SECONDS early. Delivery is at-least-once: clients should
+    de-duplicate by id.
+    """
+    if current_user['role'] == 'agent':
+        key = current_user['user_id']
+    else:
+        key = agent_id or ALL_AGENTS
+    query = {} if key == ALL_AGENTS else {"agent_id": key}
+    
+    cursor = request.headers.get("last-event-id") or after
+    if cursor:
+        try:
+            after_cursor(cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # Subscribe before replaying, so nothing committed in between is lost
+    subscription = assignment_events.subscribe(key)
+    return ClosingStreamingResponse(
+        _assignment_events(subscription, query, cursor),
+        on_close=lambda: assignment_events.unsubscribe(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse_event(docs: list) -> tuple:
+    cursor = encode_cursor(docs[-1])
+    return cursor, b"event: assignments\nid: " + cursor.encode() + b"\ndata: " + dumps(docs) + b"\n\n"
+
+async def _assignments_after(query: dict, cursor: str):
+    """Pages of the assignments after cursor (less the replay overlap), for replaying what a stream missed."""
+    created_at = decode_cursor(cursor)[0]
+    if SSE_REPLAY_OVERLAP_SECONDS and isinstance(created_at, datetime):
+        query = {**query, "created_at": {"$gte": created_at - timedelta(seconds=SSE_REPLAY_OVERLAP_SECONDS)}}
+        cursor = None
+    while True:
+        if bucket_store is not None:
+            docs = [doc async for doc in bucket_store.find(db, query, cursor, SSE_BACKLOG_PAGE_SIZE)]
+        else:
+            keyset = after_cursor(cursor) if cursor else {}
+            docs = await db.assignments.find({**query, **keyset}, {"_id": 0}).sort(KEYSET_SORT).limit(SSE_BACKLOG_PAGE_SIZE).to_list(SSE_BACKLOG_PAGE_SIZE)
+        if not docs:
+            return
+        yield docs
+        if len(docs) < SSE_BACKLOG_PAGE_SIZE:
+            return
+        cursor = encode_cursor(docs[-1])
+
+async def _assignment_events(subscription, query: dict, cursor: Optional[str]):
+    # Ids already sent by a replay; live batches published before the replay ran may repeat them.
+    # Once the stream has been idle for a heartbeat, every such batch has arrived and the set is dropped.
+    replayed = set()
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        if cursor:
+            async for docs in _assignments_after(query, cursor):
+                replayed.update(doc['id'] for doc in docs)
+                cursor, event = _sse_event(docs)
+                yield event
+        
+        while True:
+            try:
+                docs = await asyncio.wait_for(subscription.get(), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                replayed.clear()
+                yield b": keep-alive\n\n"
+                continue
+            if docs is None:
+                return
+            
+            if subscription.overflowed:
+                # This client fell behind and batches were dropped; replay them from MongoDB
+                subscription.overflowed = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                if not cursor:
+                    yield b"event: resync\ndata: {}\n\n"
+                    continue
+                async for docs in _assignments_after(query, cursor):
+                    replayed.update(doc['id'] for doc in docs)
+                    cursor, event = _sse_event(docs)
+                    yield event
+                continue
+            
+            if replayed:
+                docs = [doc for doc in docs if doc['id'] not in replayed]
+                if not docs:
+                    continue
+            # The event id must be the batch's last keyset position
+            docs = sorted(docs, key=lambda doc: (doc['created_at'], sequence_key(doc.get('seq'), doc['id'])))
+            cursor, event = _sse_event(docs)
+            yield event
+    finally:
+        assignment_events.unsubscribe(subscription)
 
 @api_router.get("/assignments/stats")
 async def get_assignment_stats(current_user: dict = Depends(require_admin)):
-    # Get agents with their assignment counts
-    agents = await db.agents.find({}, {"_id": 0, "password_hash": 0}).to_list(1000)
+    agents = await roster.agents(db)
+    
+    # Either read the materialized counters or count everything in one $group pass
+    if ASSIGNMENT_COUNTERS:
+        counts = await read_counters(db)
+    elif bucket_store is not None:
+        counts = await bucket_store.count_by_agent_and_upload(db)
+    else:
+        counts = await count_by_agent_and_upload(db)
     
-    stats = []
-    for agent in agents:
-        count = await db.assignments.count_documents({"agent_id": agent['id']})
-        stats.append({
-            "agent_id": agent['id'],
-            "agent_name": agent['name'],
-            "agent_email": agent['email'],
-            "assignments_count": count
-        })
+    return build_stats(agents, counts)
+
+@api_router.post("/assignments/stats/rebuild", dependencies=[Depends(document_storage_only)])
+async def rebuild_assignment_stats(current_user: dict = Depends(require_admin)):
+    agents_count = await rebuild_counters(db)
+    return {"message": "Assignment counters rebuilt", "agents_count": agents_count}
+
+@api_router.get("/assignments/rebalance/preview", dependencies=[Depends(document_storage_only)])
+async def preview_rebalance(
+    mode: str = Query("even", pattern=f"^({'|'.join(REBALANCE_MODES)})$"),
+    upload_id: Optional[str] = None,
+    current_user: dict = Depends(require_admin)
+):
+    try:
+        return await rebalancer.preview(db, mode, upload_id)
+    except InsufficientCapacity as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@api_router.post("/assignments/rebalance", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(document_storage_only)])
+async def start_rebalance(request_data: RebalanceRequest, current_user: dict = Depends(require_admin)):
+    if not await roster.agents(db):
+        raise HTTPException(status_code=400, detail="No agents available for distribution")
+    
+    job = await rebalancer.submit(db, request_data.mode, current_user['email'], upload_id=request_data.upload_id)
+    return {
+        "message": "Rebalance started",
+        "rebalance_id": job['id'],
+        "status": job['status'],
+        "status_url": f"/api/assignments/rebalance/{job['id']}"
+    }
+
+@api_router.get("/assignments/rebalance/{rebalance_id}")
+async def get_rebalance(rebalance_id: str, current_user: dict = Depends(require_admin)):
+    job = await db[REBALANCES_COLLECTION].find_one({"id": rebalance_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Rebalance not found")
     
-    return stats
+    elapsed = None
+    if job.get('started_at'):
+        elapsed = ((job.get('finished_at') or datetime.now(timezone.utc)) - job['started_at']).total_seconds()
+    job['rows_per_second'] = round(job['moved'] / elapsed, 1) if elapsed else 0.0
+    job['elapsed_seconds'] = round(elapsed, 3) if elapsed is not None else None
+    return job
+
+@api_router.post("/assignments/rebalance/{rebalance_id}/cancel")
+async def cancel_rebalance(rebalance_id: str, current_user: dict = Depends(require_admin)):
+    job = await db[REBALANCES_COLLECTION].find_one_and_update(
+        {"id": rebalance_id, "status": {"$nin": list(UPLOAD_FINISHED_STATES)}},
+        {"$set": {"cancel_requested": True}},
+        projection={"_id": 0, "status": 1}
+    )
+    if not job:
+        if await db[REBALANCES_COLLECTION].find_one({"id": rebalance_id}, {"_id": 1}):
+            raise HTTPException(status_code=409, detail="Rebalance has already finished")
+        raise HTTPException(status_code=404, detail="Rebalance not found")
+    
+    rebalancer.cancel(rebalance_id)
+    return {"message": "Cancellation requested", "rebalance_id": rebalance_id}
+
+# Health
+@api_router.get("/health")
+@api_router.get("/health/live")
+async def liveness():
+    return {"status": "ok", "uptime_seconds": round(time.monotonic() - app.state.started_at, 1)}
+
+@api_router.get("/health/ready")
+async def readiness():
+    try:
+        latency = await ping(client, HEALTH_PING_TIMEOUT_SECONDS)
+        database = {"status": "ok", "latency_ms": round(latency * 1000, 2)}
+    except Exception as e:
+        database = {"status": "unreachable", "error": str(e) or type(e).__name__}
+    
+    ready = app.state.warmed_up and not app.state.draining and database["status"] == "ok"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "warmed_up": app.state.warmed_up,
+            "draining": app.state.draining,
+            "database": database
+        }
+    )
+
+@api_router.get("/auth/token-cache")
+async def get_token_cache_stats(current_user: dict = Depends(require_admin)):
+    return token_cache.stats()
+
+@api_router.get("/admin/query-plans")
+async def get_query_plans(current_user: dict = Depends(require_admin)):
+    return await explain_hot_queries(db)
+
+@api_router.get("/admin/admission")
+async def get_admission_state(current_user: dict = Depends(require_admin)):
+    return {
+        "queue_timeout_seconds": ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        "limits": {name: limit.snapshot() for name, limit in ADMISSION_LIMITS.items()},
+        "login": login_attempts.snapshot()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
 
 app.include_router(api_router)
 
+@app.exception_handler(PasswordPoolSaturated)
+async def password_pool_saturated_handler(request: Request, exc: PasswordPoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": exc.retry_after_header}
+    )
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Token", "ETag", "Retry-After"],
 )
 
+if RESPONSE_COMPRESSION_MIN_BYTES > 0:
+    app.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_BYTES)
+
+if METRICS_ENABLED:
+    # Outermost, so the timings include every other middleware
+    app.add_middleware(MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
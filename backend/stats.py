@@ -0,0 +1,140 @@
+from collections import Counter, defaultdict
+
+from pymongo import UpdateOne
+
+# One document per agent: {"agent_id", "total", "uploads": {upload_id: count}}
+COUNTERS_COLLECTION = "assignment_counters"
+
+
+async def count_by_agent_and_upload(db, match: dict = None) -> dict:
+    """Single $group pass over assignments -> {agent_id: {upload_id: count}}."""
+    pipeline = [{"$match": match}] if match else []
+    pipeline.append({"$group": {
+        "_id": {"agent_id": "$agent_id", "upload_id": "$upload_id"},
+        "count": {"$sum": 1},
+    }})
+
+    counts = defaultdict(dict)
+    async for row in db.assignments.aggregate(pipeline):
+        counts[row['_id']['agent_id']][row['_id']['upload_id']] = row['count']
+    return counts
+
+
+async def agent_loads(db, use_counters: bool) -> dict:
+    """Current number of assignments per agent -> {agent_id: count}."""
+    if use_counters:
+        docs = db[COUNTERS_COLLECTION].find({}, {"_id": 0, "agent_id": 1, "total": 1})
+        return {doc['agent_id']: doc.get('total', 0) async for doc in docs}
+    rows = db.assignments.aggregate([{"$group": {"_id": "$agent_id", "count": {"$sum": 1}}}])
+    return {row['_id']: row['count'] async for row in rows}
+
+
+async def read_counters(db) -> dict:
+    counts = {}
+    async for doc in db[COUNTERS_COLLECTION].find({}, {"_id": 0, "agent_id": 1, "uploads": 1}):
+        counts[doc['agent_id']] = doc.get('uploads', {})
+    return counts
+
+
+def build_stats(agents: list, counts: dict) -> list:
+    stats = []
+    for agent in agents:
+        per_upload = {upload_id: n for upload_id, n in counts.get(agent['id'], {}).items() if n > 0}
+        stats.append({
+            "agent_id": agent['id'],
+            "agent_name": agent['name'],
+            "agent_email": agent['email'],
+            "assignments_count": sum(per_upload.values()),
+            "uploads": [
+                {"upload_id": upload_id, "count": n}
+                for upload_id, n in sorted(per_upload.items(), key=lambda item: -item[1])
+            ],
+        })
+    return stats
+
+
+async def increment_counters(db, upload_id: str, agent_counts: dict):
+    """Apply {agent_id: delta} for one upload to the materialized counters."""
+    ops = [
+        UpdateOne(
+            {"agent_id": agent_id},
+            {"$inc": {"total": delta, f"uploads.{upload_id}": delta}},
+            upsert=True,
+        )
+        for agent_id, delta in agent_counts.items() if delta
+    ]
+    if ops:
+        await db[COUNTERS_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def move_counters(db, moves: dict):
+    """Apply {(from_agent_id, to_agent_id, upload_id): n} reassignments to the counters."""
+    deltas = Counter()
+    for (from_agent, to_agent, upload_id), n in moves.items():
+        deltas[(from_agent, upload_id)] -= n
+        deltas[(to_agent, upload_id)] += n
+    ops = [
+        UpdateOne(
+            {"agent_id": agent_id},
+            {"$inc": {"total": delta, f"uploads.{upload_id}": delta}},
+            upsert=True,
+        )
+        for (agent_id, upload_id), delta in deltas.items() if delta
+    ]
+    if ops:
+        await db[COUNTERS_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def count_batch(db, upload_id: str, docs: list):
+    await increment_counters(db, upload_id, Counter(doc['agent_id'] for doc in docs))
+
+
+async def forget_upload(db, upload_id: str):
+    """Remove an upload's contribution, e.g. before its assignments are rolled back.
+
+    Takes back what the counters hold for the upload rather than what is stored: a
+    batch inserted but not counted yet (the job was cancelled in between) was never added.
+    """
+    field = f"uploads.{upload_id}"
+    docs = db[COUNTERS_COLLECTION].find({field: {"$exists": True}}, {"_id": 0, "agent_id": 1, "uploads": 1})
+    ops = [
+        UpdateOne(
+            {"agent_id": doc['agent_id']},
+            {"$inc": {"total": -doc['uploads'][upload_id]}, "$unset": {field: ""}},
+        )
+        async for doc in docs
+    ]
+    if ops:
+        await db[COUNTERS_COLLECTION].bulk_write(ops, ordered=False)
+
+
+async def forget_agent(db, agent_id: str):
+    await db[COUNTERS_COLLECTION].delete_one({"agent_id": agent_id})
+
+
+async def rebuild_counters(db) -> int:
+    """Recompute the counters collection from the assignments themselves."""
+    counts = await count_by_agent_and_upload(db)
+    await db[COUNTERS_COLLECTION].delete_many({})
+    docs = [
+        {"agent_id": agent_id, "total": sum(per_upload.values()), "uploads": per_upload}
+        for agent_id, per_upload in counts.items()
+    ]
+    if docs:
+        await db[COUNTERS_COLLECTION].insert_many(docs)
+    return len(docs)
+
+
+async def ensure_counters(db) -> bool:
+    """Rebuild the counters when they do not add up to the stored assignments; True if rebuilt.
+
+    Covers turning ASSIGNMENT_COUNTERS on for a database that already has assignments,
+    and counters that fell behind while it was off.
+    """
+    counted = 0
+    async for row in db[COUNTERS_COLLECTION].aggregate([{"$group": {"_id": None, "total": {"$sum": "$total"}}}]):
+        counted = row['total']
+    if counted == await db.assignments.count_documents({}):
+        return False
+    await rebuild_counters(db)
+    return True
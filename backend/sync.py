@@ -0,0 +1,158 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+TOMBSTONES_COLLECTION = "assignment_tombstones"
+# Tombstones expire through a TTL index; a since token older than this needs a full reload
+TOMBSTONE_RETENTION_SECONDS = 30 * 24 * 3600
+# Writers stamp updated_at before their write commits, and workers' clocks differ a little,
+# so every delta re-reads this much time before its token. Clients upsert by id.
+SYNC_OVERLAP_SECONDS = 10
+
+# Tombstone kinds: one assignment left an agent (reassigned), or every assignment
+# of an agent or an upload was deleted
+ASSIGNMENT = "assignment"
+AGENT = "agent"
+UPLOAD = "upload"
+
+SYNC_SORT = [("updated_at", 1), ("id", 1)]
+TOMBSTONE_SORT = [("deleted_at", 1), ("id", 1)]
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class SyncTokenExpired(InvalidSyncToken):
+    pass
+
+
+def _now() -> datetime:
+    now = datetime.now(timezone.utc)
+    # Milliseconds, like the BSON dates the token is compared with
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _millis(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def _from_millis(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000, timezone.utc)
+
+
+def encode_sync_token(since: datetime, changed_after=None, deleted_after=None) -> str:
+    """Opaque token: the time a sync started, plus how far a truncated delta got in each list."""
+    key = [_millis(since)]
+    for position in (changed_after, deleted_after):
+        key.append(None if position is None else [_millis(position[0]), position[1]])
+    raw = json.dumps(key, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def current_sync_token() -> str:
+    return encode_sync_token(_now())
+
+
+def decode_sync_token(token: str):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        since, changed_after, deleted_after = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        since = _from_millis(int(since))
+        positions = [
+            None if position is None else (_from_millis(int(position[0])), str(position[1]))
+            for position in (changed_after, deleted_after)
+        ]
+    except (ValueError, TypeError, IndexError) as e:
+        raise InvalidSyncToken("Invalid sync token") from e
+    if since < _now() - timedelta(seconds=TOMBSTONE_RETENTION_SECONDS - SYNC_OVERLAP_SECONDS):
+        raise SyncTokenExpired("Sync token has expired, reload all assignments")
+    return since, positions[0], positions[1]
+
+
+def stamp(docs: list, now: datetime = None) -> datetime:
+    now = now or _now()
+    for doc in docs:
+        doc['updated_at'] = now
+    return now
+
+
+async def record_reassigned(db, from_agent_id: str, ids: list, now: datetime = None):
+    """Tombstones telling from_agent_id's clients that these assignments moved to someone else."""
+    now = now or _now()
+    if ids:
+        await db[TOMBSTONES_COLLECTION].insert_many([
+            {"kind": ASSIGNMENT, "id": assignment_id, "agent_id": from_agent_id, "deleted_at": now}
+            for assignment_id in ids
+        ])
+
+
+async def record_agent_removed(db, agent_id: str):
+    await db[TOMBSTONES_COLLECTION].insert_one(
+        {"kind": AGENT, "id": f"agent:{agent_id}", "agent_id": agent_id, "deleted_at": _now()}
+    )
+
+
+async def record_upload_removed(db, upload_id: str):
+    await db[TOMBSTONES_COLLECTION].insert_one(
+        {"kind": UPLOAD, "id": f"upload:{upload_id}", "upload_id": upload_id, "deleted_at": _now()}
+    )
+
+
+def _after(field: str, since: datetime, position) -> dict:
+    window = {field: {"$gte": since - timedelta(seconds=SYNC_OVERLAP_SECONDS)}}
+    if position is None:
+        return window
+    stamped, last_id = position
+    return {"$and": [window, {"$or": [
+        {field: {"$gt": stamped}},
+        {field: stamped, "id": {"$gt": last_id}},
+    ]}]}
+
+
+async def changes_since(db, token: str, agent_id: str = None, limit: int = 10000) -> dict:
+    """Assignments created or changed, and tombstones written, since a sync token.
+
+    agent_id scopes the delta to one agent; without it every assignment is
+    included and per-assignment tombstones are left out, because a reassigned
+    assignment then shows up among the changes with its new agent. Either list
+    is cut at ``limit``; ``has_more`` then asks the client to call again with the
+    returned token straight away.
+    """
+    since, changed_after, deleted_after = decode_sync_token(token)
+    started = _now()
+
+    query = _after("updated_at", since, changed_after)
+    if agent_id:
+        query = {"agent_id": agent_id, **query}
+    changed = await db.assignments.find(query, {"_id": 0}).sort(SYNC_SORT).limit(limit + 1).to_list(limit + 1)
+
+    if agent_id:
+        scope = {"$or": [{"agent_id": agent_id}, {"kind": UPLOAD}]}
+    else:
+        scope = {"kind": {"$in": [AGENT, UPLOAD]}}
+    deleted = await db[TOMBSTONES_COLLECTION].find(
+        {**scope, **_after("deleted_at", since, deleted_after)}, {"_id": 0}
+    ).sort(TOMBSTONE_SORT).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(changed) > limit or len(deleted) > limit
+    if has_more:
+        # Keep the original start time and continue each list where it stopped
+        changed, deleted = changed[:limit], deleted[:limit]
+        next_token = encode_sync_token(
+            since,
+            (changed[-1]['updated_at'], changed[-1]['id']) if changed else changed_after,
+            (deleted[-1]['deleted_at'], deleted[-1]['id']) if deleted else deleted_after,
+        )
+    else:
+        next_token = encode_sync_token(started)
+
+    return {
+        "changed": changed,
+        "deleted": [
+            {key: tombstone[key] for key in ("kind", "id", "agent_id", "upload_id") if key in tombstone}
+            for tombstone in deleted
+        ],
+        "has_more": has_more,
+        "sync_token": next_token,
+    }
@@ -0,0 +1,269 @@
+import csv
+import io
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+REJECTIONS_COLLECTION = "upload_rejections"
+
+# Rejection reasons, in the order they are checked; a row gets the first that applies
+MISSING_FIRST_NAME = "missing_first_name"
+MISSING_PHONE = "missing_phone"
+INVALID_PHONE = "invalid_phone"
+DUPLICATE_PHONE = "duplicate_phone"
+_REASONS = np.array([None, MISSING_FIRST_NAME, MISSING_PHONE, INVALID_PHONE, DUPLICATE_PHONE], dtype=object)
+
+# E.164 allows at most 15 digits; fewer than 7 is no dialable number anywhere
+MIN_PHONE_DIGITS = 7
+MAX_PHONE_DIGITS = 15
+# Longer cells are invalid without being looked at, so one huge cell costs nothing
+MAX_PHONE_CHARS = 32
+# Digits of each row's canonical phone, for build_assignments' phone_normalized
+PHONE_DIGITS_COLUMN = "PhoneDigits"
+# Index into _REASONS of the first check a row failed; 0 for rows that passed
+REASON_COLUMN = "Reason"
+# The digits packed into one int64, for duplicate detection
+PHONE_KEY_COLUMN = "PhoneKey"
+
+_ZERO, _PLUS, _DOT = ord('0'), ord('+'), ord('.')
+# Class of every code point; everything but digits, separators and '+' is STRAY
+_DIGIT, _SEPARATOR, _SIGN, _STRAY = range(4)
+_CLASSES = np.full(0x110000, _STRAY, dtype=np.uint8)
+_CLASSES[ord('0'):ord('9') + 1] = _DIGIT
+# Formatting people put in phone numbers
+_CLASSES[[ord(c) for c in " \t()-./"]] = _SEPARATOR
+_CLASSES[_PLUS] = _SIGN
+# Place value of each digit of a left-aligned MAX_PHONE_DIGITS-digit number; digits past it count 0
+_PLACES = np.append(10.0 ** np.arange(MAX_PHONE_DIGITS - 1, -1, -1), 0.0)
+_NON_DIGITS = re.compile(r"\D+")
+
+
+def _text(column: pd.Series) -> np.ndarray:
+    """Stripped cells; much faster than .str.strip() on object columns."""
+    values = column.tolist()
+    try:
+        return np.fromiter(map(str.strip, values), dtype=object, count=len(values))
+    except TypeError:
+        # Short rows leave NaN even with keep_default_na=False; workbooks give numbers and dates
+        return np.fromiter((_cell_text(value) for value in values), dtype=object, count=len(values))
+
+
+def _cell_text(value) -> str:
+    if isinstance(value, str):
+        return value.strip()
+    if value is None or pd.isna(value):
+        return ""
+    return str(value).strip()
+
+
+def canonicalize_phones(phones: np.ndarray):
+    """Canonical phones, their digits, dedupe keys and validity for an array of stripped phone cells.
+
+    Returns (canonical, digits, key, valid). A canonical phone is its digits with the
+    leading '+' kept when there was one: '+1 (555) 010-0000' -> '+15550100000'.
+    Spreadsheet floats ('5550100.0') lose their '.0'. A phone is valid with 7 to 15
+    digits and nothing but separators around them. ``key`` packs the digits into one
+    int64 (the digits as a left-aligned 15-digit number plus 10**15 times their
+    count, so '0123' and '123' differ); it is only meaningful for valid phones.
+
+    All cells are concatenated into one array of code points. Digits, the common
+    case, are only classified; the work is done on the much shorter array of the
+    other characters, and only cells that contain any are rebuilt as strings.
+    """
+    n = len(phones)
+    lengths = np.fromiter(map(len, phones), dtype=np.int64, count=n)
+    too_long = lengths > MAX_PHONE_CHARS
+    if too_long.any():
+        phones = np.where(too_long, "", phones)
+        lengths[too_long] = 0
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    chars = np.frombuffer("".join(phones).encode('utf-32-le'), dtype=np.uint32)
+
+    classes = _CLASSES[chars]
+    is_digit = classes == _DIGIT
+    other = np.flatnonzero(~is_digit)
+    other_row = np.searchsorted(ends, other, side='right')
+    other_class = classes[other]
+
+    # Cells are stripped, so a '+' is only allowed as the first character
+    plus = np.zeros(n, dtype=bool)
+    leading = other_class == _SIGN
+    leading[leading] = other[leading] == starts[other_row[leading]]
+    plus[other_row[leading]] = True
+    bad = (other_class == _STRAY) | ((other_class == _SIGN) & ~leading)
+    stray = np.bincount(other_row[bad], minlength=n) > 0
+    count = lengths - np.bincount(other_row, minlength=n)
+
+    # '5550100.0': a lone dot followed only by zeros is a float rendering, not a separator
+    single = np.bincount(other_row, minlength=n) == 1
+    dot = other[(chars[other] == _DOT) & single[other_row]]
+    if len(dot):
+        dot_row = np.searchsorted(ends, dot, side='right')
+        tail = ends[dot_row] - dot - 1
+        zeros = tail > 0
+        for offset in range(1, int(tail.max(initial=0)) + 1):
+            inside = tail >= offset
+            zeros[inside] &= chars[dot[inside] + offset] == _ZERO
+        dot, dot_row, tail = dot[zeros], dot_row[zeros], tail[zeros]
+        count[dot_row] -= tail
+        is_digit[np.repeat(dot + 1, tail) + np.arange(tail.sum()) - np.repeat(np.cumsum(tail) - tail, tail)] = False
+
+    valid = ~too_long & ~stray & (count >= MIN_PHONE_DIGITS) & (count <= MAX_PHONE_DIGITS)
+
+    # The key from each row's digits: the j-th digit is worth _PLACES[j]; float64 sums are
+    # exact below 2**53, and every left-aligned 15-digit value is below 10**15
+    digit_chars = chars[is_digit]
+    digit_row = np.repeat(np.arange(n), count)
+    index = np.arange(len(digit_chars)) - np.repeat(np.cumsum(count) - count, count)
+    worth = _PLACES[np.minimum(index, MAX_PHONE_DIGITS)] * (digit_chars.astype(np.float64) - _ZERO)
+    key = np.bincount(digit_row, weights=worth, minlength=n).astype(np.int64) + count * 10 ** MAX_PHONE_DIGITS
+
+    # Cells of digits and a leading '+' already are canonical; the others are rebuilt from what they keep
+    canonical = phones.copy()
+    kept_lengths = count + plus
+    changed = np.flatnonzero(kept_lengths != lengths)
+    if len(changed):
+        is_digit[starts[plus]] = True
+        text = chars[is_digit].tobytes().decode('utf-32-le')
+        kept_ends = np.cumsum(kept_lengths)
+        canonical[changed] = [
+            text[end - length:end]
+            for end, length in zip(kept_ends[changed].tolist(), kept_lengths[changed].tolist())
+        ]
+    digits = canonical.copy()
+    signed = np.flatnonzero(plus)
+    digits[signed] = [phone[1:] for phone in canonical[signed].tolist()]
+    return canonical, digits, key, valid
+
+
+def phone_digits(phones) -> list:
+    """The digits canonicalize_phones keeps of each phone, as stored in phone_normalized.
+
+    Uploads, the phone_normalized backfill and search input all go through here, so
+    they agree: '+1 (555) 010-0000' -> '15550100000', '5550100.0' -> '5550100'.
+    Cells too long to canonicalize keep all their digits.
+    """
+    values = [phone.strip() if isinstance(phone, str) else str(phone).strip() for phone in phones]
+    if not values:
+        return []
+    digits = canonicalize_phones(np.array(values, dtype=object))[1].tolist()
+    for i in np.flatnonzero(np.fromiter(map(len, values), dtype=np.int64, count=len(values)) > MAX_PHONE_CHARS).tolist():
+        digits[i] = _NON_DIGITS.sub("", values[i])
+    return digits
+
+
+def normalize_leads(df: pd.DataFrame) -> pd.DataFrame:
+    """The checks that need no other rows, run on a parsed frame (in the parse pool).
+
+    Returns FirstName and Notes stripped, Phone canonical (stripped only when it is
+    invalid), its PhoneDigits and PhoneKey, and the Reason code of the first failed check, 0 when
+    the row is fine. Duplicates are left to LeadValidator, which sees the whole file.
+    """
+    first_names = _text(df['FirstName'])
+    notes = _text(df['Notes'])
+    phones = _text(df['Phone'])
+    canonical, digits, key, valid_phone = canonicalize_phones(phones)
+
+    # Later assignments win, so the first check that fails is the one reported
+    reason = np.zeros(len(df), dtype=np.uint8)
+    reason[~valid_phone] = 3
+    reason[phones == ""] = 2
+    reason[first_names == ""] = 1
+    return pd.DataFrame({
+        'FirstName': first_names,
+        'Phone': np.where(valid_phone, canonical, phones),
+        'Notes': notes,
+        PHONE_DIGITS_COLUMN: digits,
+        PHONE_KEY_COLUMN: key,
+        REASON_COLUMN: reason,
+    }, index=df.index)
+
+
+class LeadValidator:
+    """Splits an upload's lead frames into leads to distribute and rejected rows.
+
+    Created once per upload and given its frames in file order, so duplicate
+    phones are found across the whole file through the set of phone keys seen so
+    far; a phone's first row wins. Frames from the parse pool arrive normalized
+    (normalize_leads), others are normalized here.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.rejected = Counter()
+        self._seen = set()
+
+    @property
+    def rows_rejected(self) -> int:
+        return sum(self.rejected.values())
+
+    def validate(self, df: pd.DataFrame):
+        """Return (leads, rejected) for the next frame of the file.
+
+        ``leads`` holds FirstName, Phone, Notes and PhoneDigits of the rows to keep.
+        ``rejected`` holds FirstName, Phone and Notes of the others, with their
+        1-based ``row`` in the file and the ``reason``.
+        """
+        if REASON_COLUMN not in df.columns:
+            df = normalize_leads(df)
+        reason = df[REASON_COLUMN].to_numpy().copy()
+        candidates = np.flatnonzero(reason == 0)
+        keys = df[PHONE_KEY_COLUMN].to_numpy()[candidates]
+        repeated = pd.Series(keys).duplicated().to_numpy()
+        first = keys[~repeated].tolist()
+        repeated[~repeated] = np.fromiter(map(self._seen.__contains__, first), dtype=bool, count=len(first))
+        self._seen.update(first)
+        reason[candidates[repeated]] = 4
+
+        kept = np.flatnonzero(reason == 0)
+        rejected_at = np.flatnonzero(reason)
+        columns = {column: df[column].to_numpy() for column in ('FirstName', 'Phone', 'Notes', PHONE_DIGITS_COLUMN)}
+        leads = pd.DataFrame({column: values[kept] for column, values in columns.items()})
+        reasons = _REASONS[reason[rejected_at]]
+        rejected = pd.DataFrame({
+            'row': rejected_at + self.rows + 1,
+            'reason': reasons,
+            **{column: columns[column][rejected_at] for column in ('FirstName', 'Phone', 'Notes')},
+        })
+        self.rejected.update(reasons.tolist())
+        self.rows += len(df)
+        return leads, rejected
+
+
+async def record_rejections(db, upload_id: str, rejected: pd.DataFrame, limit: int) -> int:
+    """Store the first ``limit`` rows of a rejected frame; returns how many were stored."""
+    rows = rejected.iloc[:max(limit, 0)]
+    if rows.empty:
+        return 0
+    await db[REJECTIONS_COLLECTION].insert_many([
+        {"upload_id": upload_id, "row": int(row), "reason": reason, "first_name": first_name, "phone": phone, "notes": notes}
+        for row, reason, first_name, phone, notes in zip(
+            rows['row'], rows['reason'], rows['FirstName'], rows['Phone'], rows['Notes']
+        )
+    ])
+    return len(rows)
+
+
+# Columns of the rejected-rows report; the lead columns keep the upload's names
+REPORT_COLUMNS = ['row', 'reason', 'FirstName', 'Phone', 'Notes']
+
+
+async def rejection_report(cursor, rows_per_chunk: int = 1000):
+    """CSV lines (as bytes, a chunk of rows at a time) for a cursor over stored rejections."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(REPORT_COLUMNS)
+    pending = 1
+    async for doc in cursor:
+        writer.writerow([doc['row'], doc['reason'], doc['first_name'], doc['phone'], doc['notes']])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+            pending = 0
+    if pending:
+        yield out.getvalue().encode()
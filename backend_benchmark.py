@@ -0,0 +1,633 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+
+import server  # noqa: E402
+from admission import TokenBucket  # noqa: E402
+from buckets import BUCKETS_COLLECTION, BucketStore  # noqa: E402
+from distribution import STRATEGIES, build_assignments, distribute_frame  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+from ingestion import ParsePool  # noqa: E402
+from responses import FastJSONResponse, brotli, dumps, orjson  # noqa: E402
+from pagination import KEYSET_SORT, after_cursor, encode_cursor  # noqa: E402
+from search import normalize_phone  # noqa: E402
+from stats import rebuild_counters  # noqa: E402
+from sync import stamp  # noqa: E402
+from validation import LeadValidator  # noqa: E402
+
+
+def make_leads(rows):
+    return pd.DataFrame({
+        'FirstName': [f"Lead{i}" for i in range(rows)],
+        'Phone': np.arange(9000000000, 9000000000 + rows),
+        'Notes': [f"note {i}" for i in range(rows)],
+    })
+
+
+def make_agents(count):
+    return [{"id": f"agent-{i}", "name": f"Agent {i}"} for i in range(count)]
+
+
+def iterrows_engine(df, agents, upload_id):
+    """The original per-row distribution loop, kept as the baseline to compare against"""
+    assignments = []
+    agent_count = len(agents)
+
+    for idx, row in df.iterrows():
+        agent = agents[idx % agent_count]
+
+        assignment = server.Assignment(
+            agent_id=agent['id'],
+            agent_name=agent['name'],
+            first_name=str(row['FirstName']),
+            phone=str(row['Phone']),
+            notes=str(row['Notes']),
+            upload_id=upload_id,
+            seq=idx
+        )
+
+        assignment_doc = assignment.model_dump()
+        assignment_doc['phone_normalized'] = normalize_phone(assignment_doc['phone'])
+        assignment_doc['created_at'] = assignment_doc['created_at'].isoformat()
+        assignments.append(assignment_doc)
+
+    return assignments
+
+
+def vectorized_engine(df, agents, upload_id):
+    return distribute_frame(df, agents, upload_id)
+
+
+def strip_generated(docs):
+    # updated_at is stamped when a batch is inserted, so neither engine sets it
+    return [{k: v for k, v in doc.items() if k not in ('id', 'created_at', 'updated_at')} for doc in docs]
+
+
+def bench_distribution(rows, agent_count):
+    df = make_leads(rows)
+    agents = make_agents(agent_count)
+    results = {}
+
+    for name, engine in (("iterrows", iterrows_engine), ("vectorized", vectorized_engine)):
+        start = time.perf_counter()
+        docs = engine(df, agents, "bench-upload")
+        elapsed = time.perf_counter() - start
+        results[name] = (elapsed, docs)
+        print(f"   {name:<12} {elapsed:8.3f}s  {rows / elapsed:>12,.0f} rows/s")
+
+    same = strip_generated(results["iterrows"][1]) == strip_generated(results["vectorized"][1])
+    speedup = results["iterrows"][0] / results["vectorized"][0]
+    print(f"   outputs identical: {same}   speedup: {speedup:.1f}x")
+    return same
+
+
+def bench_strategies(rows, agent_count, chunk_rows):
+    rng = np.random.default_rng(0)
+    agents = [
+        {**agent, "weight": int(w), "capacity": int(c)}
+        for agent, w, c in zip(make_agents(agent_count), rng.integers(1, 5, agent_count), rng.integers(rows // agent_count, 4 * rows // agent_count, agent_count))
+    ]
+    loads = {agent['id']: int(load) for agent, load in zip(agents, rng.integers(0, 500, agent_count))}
+    df = make_leads(chunk_rows)
+
+    for name, strategy_cls in STRATEGIES.items():
+        strategy = strategy_cls(agents, loads)
+        start = time.perf_counter()
+        allocated = [strategy.allocate(min(chunk_rows, rows - done)) for done in range(0, rows, chunk_rows)]
+        alloc_elapsed = time.perf_counter() - start
+
+        # Building the docs for one chunk is strategy independent; time it once per strategy for scale
+        start = time.perf_counter()
+        build_assignments(df, agents, allocated[0][:len(df)], "bench-upload")
+        build_elapsed = (time.perf_counter() - start) * rows / chunk_rows
+
+        final = np.array([loads[agent['id']] for agent in agents]) + np.bincount(np.concatenate(allocated), minlength=agent_count)
+        print(
+            f"   {name:<16} allocate {rows / alloc_elapsed:>14,.0f} rows/s   "
+            f"with docs {rows / (alloc_elapsed + build_elapsed):>10,.0f} rows/s   "
+            f"load min/max {final.min()}/{final.max()}"
+        )
+
+
+# Upload validation, timed end to end on a CSV file: the parse pool parses and normalizes
+# blocks (normalize_leads), the job dedupes each frame in file order (LeadValidator)
+
+# What the pipeline aims for with enough parse workers; a reference figure, not a gate
+# (--min-rows-per-second makes it one), since it depends on the cores at hand
+VALIDATION_TARGET_ROWS_PER_SECOND = 1_000_000
+
+
+def make_dirty_leads(rows, seed=0):
+    """Leads as people export them: padded names, formatted and repeated phones, a few bad rows."""
+    rng = np.random.default_rng(seed)
+    numbers = rng.integers(5550000000, 5560000000, rows).astype(str)
+    # One row in twenty repeats an earlier phone
+    repeats = np.flatnonzero(rng.random(rows) < 0.05)
+    numbers[repeats] = numbers[rng.integers(0, rows, len(repeats))]
+    phones = numbers.astype(object)
+    styled = rng.random(rows)
+    phones[styled < 0.3] = [f"+1 ({p[:3]}) {p[3:6]}-{p[6:]}" for p in numbers[styled < 0.3]]
+    phones[styled > 0.99] = "n/a"
+    names = np.array([f" Lead{i} " for i in range(rows)], dtype=object)
+    names[rng.random(rows) < 0.01] = ""
+    return pd.DataFrame({
+        'FirstName': names,
+        'Phone': phones,
+        'Notes': [f"note {i}" for i in range(rows)],
+    }).astype(str)
+
+
+async def _validate_file(path, chunk_rows, workers, block_bytes):
+    """Run a stored CSV through the upload job's pipeline: ParsePool.frames, then LeadValidator."""
+    pool = ParsePool(workers=workers, block_bytes=block_bytes, kind="process")
+    try:
+        await pool.warm_up()
+        validator = LeadValidator()
+        kept = 0
+        start = time.perf_counter()
+        async for frame in pool.frames(path, "leads.csv", chunk_rows):
+            kept += len(validator.validate(frame)[0])
+        return time.perf_counter() - start, kept, validator
+    finally:
+        pool.shutdown()
+
+
+def bench_validation(rows, chunk_rows, workers, min_rows_per_second=0, block_bytes=4 * 1024 * 1024):
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "leads.csv")
+        make_dirty_leads(rows).to_csv(path, index=False)
+        elapsed, kept, validator = asyncio.run(_validate_file(path, chunk_rows, workers, block_bytes))
+
+    rate = rows / elapsed
+    print(f"   parse + validate with {workers} parse workers {rate:>12,.0f} rows/s "
+          f"({rate / VALIDATION_TARGET_ROWS_PER_SECOND:.0%} of the {VALIDATION_TARGET_ROWS_PER_SECOND:,} rows/s target)")
+    print(f"   kept {kept:,}, rejected {dict(validator.rejected)}")
+    if not min_rows_per_second:
+        return True
+    ok = rate >= min_rows_per_second
+    print(f"   meets {min_rows_per_second:,} rows/s: {ok}")
+    return ok
+
+
+def _per_10k(fn, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000 * 10000 / rows, result
+
+
+def bench_serialization(rows, repeat=3):
+    """Time each way a list endpoint can render rows as they come back from Mongo"""
+    docs = distribute_frame(make_leads(rows), make_agents(5), "bench-upload")
+    assignment_list = TypeAdapter(List[server.Assignment])
+
+    paths = {
+        # What FastAPI does for a route returning raw dicts (GET /assignments)
+        "jsonable_encoder": lambda: JSONResponse(jsonable_encoder(docs)).body,
+        # What response_model=List[...] adds on top: validate every row, then encode
+        "response_model": lambda: JSONResponse(jsonable_encoder(assignment_list.dump_python(assignment_list.validate_python(docs)))).body,
+        # The pydantic-core serializer used by GET /uploads
+        "pydantic dump_json": lambda: assignment_list.dump_json(assignment_list.validate_python(docs)),
+        # FAST_JSON_RESPONSES=true
+        f"fast ({'orjson' if orjson else 'json'})": lambda: FastJSONResponse(docs).body,
+    }
+
+    body = None
+    for name, fn in paths.items():
+        ms, body = _per_10k(fn, rows, repeat)
+        print(f"   {name:<20} {ms:8.2f} ms / 10k rows   {len(body) / rows:6.1f} bytes/row")
+
+    body = dumps(docs)
+    encoders = {"gzip -6": lambda: gzip.compress(body, 6)}
+    if brotli:
+        encoders["brotli -4"] = lambda: brotli.compress(body, quality=4)
+    for name, fn in encoders.items():
+        ms, compressed = _per_10k(fn, rows, repeat)
+        print(f"   {name:<20} {ms:8.2f} ms / 10k rows   {len(compressed) / rows:6.1f} bytes/row ({len(body) / len(compressed):.1f}x smaller)")
+
+
+# In-process API benchmarks
+#
+# The app is driven through httpx's ASGI transport, so no server or network is
+# involved. Mongo is an in-memory mongomock stand-in unless --mongo-url points at
+# a local mongod; absolute numbers differ a lot between the two, so only compare
+# runs made against the same backend.
+
+BENCH_PASSWORD = "bench-password"
+
+
+def _latency_summary(samples):
+    ordered = np.sort(np.asarray(samples) * 1000)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(float(ordered.mean()), 3),
+        "p50_ms": round(float(np.percentile(ordered, 50)), 3),
+        "p90_ms": round(float(np.percentile(ordered, 90)), 3),
+        "p99_ms": round(float(np.percentile(ordered, 99)), 3),
+        "max_ms": round(float(ordered[-1]), 3),
+    }
+
+
+class ApiBench:
+    def __init__(self, mongo_url=None):
+        if mongo_url:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self.client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+            self.backend = "mongodb"
+        else:
+            from mongomock_motor import AsyncMongoMockClient
+            self.client = AsyncMongoMockClient(tz_aware=True)
+            self.backend = "mongomock"
+        self.databases = []
+        self.headers = {"Authorization": f"Bearer {server.create_token('bench-admin', 'bench@example.com', 'admin')}"}
+        self.password_hash = None
+
+    async def __aenter__(self):
+        import httpx
+        self.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=None)
+        self.password_hash = await server.hash_password(BENCH_PASSWORD)
+        # Measure what a login costs, not the per-client rate limit in front of it
+        server.login_attempts = TokenBucket("login", rate=1e9, burst=10**9)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.aclose()
+        await server.upload_jobs.shutdown()
+        if self.backend == "mongodb":
+            for name in self.databases:
+                await self.client.drop_database(name)
+        self.client.close()
+
+    async def fresh_db(self):
+        """Point the app at an empty database with no cached state (and every index, on a real mongod)."""
+        name = f"agentlist_bench_{uuid.uuid4().hex[:12]}"
+        self.databases.append(name)
+        server.db = self.client[name]
+        if self.backend == "mongodb":
+            # mongomock checks indexes by scanning the collection on every insert, which would dominate
+            await ensure_indexes(server.db)
+        await server.roster.invalidate(server.db)
+        server.token_cache.clear()
+        server.ASSIGNMENT_COUNTERS = server.upload_jobs.maintain_counters = False
+        return server.db
+
+    async def seed_agents(self, count):
+        agents = make_agents(count)
+        docs = []
+        for agent in agents:
+            doc = server.Agent(name=agent['name'], email=f"{agent['id']}@example.com", mobile="0000000000").model_dump()
+            doc['password_hash'] = self.password_hash
+            docs.append(doc)
+        await server.db.agents.insert_many(docs)
+        await server.roster.invalidate(server.db)
+        return docs
+
+    async def seed_assignments(self, agents, rows, chunk_rows=10000):
+        for start in range(0, rows, chunk_rows):
+            df = make_leads(min(chunk_rows, rows - start))
+            await server.db.assignments.insert_many(distribute_frame(df, agents, "bench-upload", offset=start))
+
+    async def upload(self, rows, agent_count=10):
+        await self.fresh_db()
+        await self.seed_agents(agent_count)
+        body = make_leads(rows).to_csv(index=False).encode()
+
+        start = time.perf_counter()
+        response = await self.http.post("/api/uploads", files={"file": ("bench.csv", body, "text/csv")}, headers=self.headers)
+        response.raise_for_status()
+        status_url = f"/api/uploads/{response.json()['upload_id']}/status"
+        while True:
+            job = (await self.http.get(status_url, headers=self.headers)).json()
+            if job['status'] in ("completed", "failed", "cancelled"):
+                break
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - start
+        if job['status'] != "completed":
+            raise RuntimeError(f"Upload benchmark job {job['status']}: {job.get('error')}")
+        return {
+            "rows": rows,
+            "bytes": len(body),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1),
+            "job_rows_per_second": job['rows_per_second'],
+        }
+
+    async def login(self, requests, concurrency):
+        await self.fresh_db()
+        agents = await self.seed_agents(concurrency)
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(i):
+            async with slots:
+                start = time.perf_counter()
+                response = await self.http.post("/api/auth/login", json={"email": agents[i % len(agents)]['email'], "password": BENCH_PASSWORD})
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+        return {**_latency_summary(latencies), "concurrency": concurrency, "requests_per_second": round(requests / elapsed, 1)}
+
+    async def listing(self, sizes, repeat):
+        await self.fresh_db()
+        agents = await self.seed_agents(10)
+        await self.seed_assignments(agents, max(sizes))
+        results = {}
+        for fast in (False, True):
+            server.FAST_JSON_RESPONSES = fast
+            for size in sizes:
+                latencies = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = await self.http.get("/api/assignments", params={"limit": size}, headers=self.headers)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                results[f"listing.limit_{size}.{'fast_json' if fast else 'json'}"] = _latency_summary(latencies)
+        server.FAST_JSON_RESPONSES = False
+        return results
+
+    async def stats(self, roster_sizes, rows, repeat):
+        results = {}
+        for count in roster_sizes:
+            await self.fresh_db()
+            agents = await self.seed_agents(count)
+            await self.seed_assignments(agents, rows)
+            for counters in (False, True):
+                if counters:
+                    await rebuild_counters(server.db)
+                server.ASSIGNMENT_COUNTERS = counters
+                latencies = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = await self.http.get("/api/assignments/stats", headers=self.headers)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                results[f"stats.agents_{count}.{'counters' if counters else 'aggregate'}"] = _latency_summary(latencies)
+        server.ASSIGNMENT_COUNTERS = False
+        return results
+
+
+# Storage layout: one document per assignment vs ASSIGNMENT_STORAGE=buckets
+#
+# Both layouts get the same leads, inserted the way the upload job would insert
+# them (UPLOAD_INSERT_BATCH_SIZE documents, or one chunk of buckets at a time).
+# Sizes are BSON bytes as sent to the server; against a real mongod the
+# collection's storageSize and totalIndexSize (with every declared index) are
+# reported as well.
+
+async def _collection_sizes(db, name):
+    stats = await db.command("collStats", name)
+    return {"storage_bytes": stats['storageSize'], "index_bytes": stats['totalIndexSize']}
+
+
+async def _read_documents(db, agent_id, page_size):
+    rows, after = 0, None
+    while True:
+        query = {"agent_id": agent_id, **(after_cursor(after) if after else {})}
+        docs = await db.assignments.find(query, {"_id": 0}).sort(KEYSET_SORT).limit(page_size).to_list(page_size)
+        rows += len(docs)
+        if len(docs) < page_size:
+            return rows
+        after = encode_cursor(docs[-1])
+
+
+async def _read_buckets(db, store, agent_id, page_size):
+    rows, after = 0, None
+    while True:
+        docs = [doc async for doc in store.find(db, {"agent_id": agent_id}, after, page_size)]
+        rows += len(docs)
+        if len(docs) < page_size:
+            return rows
+        after = encode_cursor(docs[-1])
+
+
+async def bench_storage(rows, agent_count, chunk_rows, batch_size, page_size, mongo_url=None):
+    import bson
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client, backend = AsyncIOMotorClient(mongo_url, tz_aware=True), "mongodb"
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client, backend = AsyncMongoMockClient(tz_aware=True), "mongomock"
+
+    agents = make_agents(agent_count)
+    chunks = []
+    for start in range(0, rows, chunk_rows):
+        docs = distribute_frame(make_leads(min(chunk_rows, rows - start)), agents, "bench-upload", offset=start)
+        stamp(docs)
+        chunks.append(docs)
+    store = BucketStore()
+    results = {}
+    try:
+        for layout in ("documents", "buckets"):
+            db = client[f"agentlist_bench_{uuid.uuid4().hex[:12]}"]
+            if backend == "mongodb":
+                await ensure_indexes(db)
+            collection = db.assignments if layout == "documents" else db[BUCKETS_COLLECTION]
+
+            start = time.perf_counter()
+            for docs in chunks:
+                if layout == "documents":
+                    # Copies, so the _id insert_many adds does not leak into the bucket run
+                    batch = [dict(doc) for doc in docs]
+                    for i in range(0, len(batch), batch_size):
+                        await db.assignments.insert_many(batch[i:i + batch_size])
+                else:
+                    await store.insert(db, docs)
+            write_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if layout == "documents":
+                read_rows = await _read_documents(db, agents[0]['id'], page_size)
+            else:
+                read_rows = await _read_buckets(db, store, agents[0]['id'], page_size)
+            read_seconds = time.perf_counter() - start
+
+            stored = await collection.find({}).to_list(None)
+            result = results[layout] = {
+                "documents": len(stored),
+                "bson_bytes": sum(len(bson.encode(doc)) for doc in stored),
+                "write_rows_per_second": round(rows / write_seconds, 1),
+                "read_rows_per_second": round(read_rows / read_seconds, 1),
+            }
+            if backend == "mongodb":
+                result.update(await _collection_sizes(db, collection.name))
+                await client.drop_database(db.name)
+    finally:
+        client.close()
+
+    for layout, result in results.items():
+        print(f"   {layout:<10} {result['documents']:>10,} docs  {result['bson_bytes'] / 2**20:9.1f} MiB BSON"
+              f"  write {result['write_rows_per_second']:>11,.0f} rows/s  read {result['read_rows_per_second']:>11,.0f} rows/s")
+        if "storage_bytes" in result:
+            print(f"   {'':<10} storage {result['storage_bytes'] / 2**20:9.1f} MiB  indexes {result['index_bytes'] / 2**20:9.1f} MiB")
+    documents, buckets = results["documents"], results["buckets"]
+    print(f"   buckets use {buckets['bson_bytes'] / documents['bson_bytes']:.0%} of the BSON bytes"
+          f" in {buckets['documents'] / documents['documents']:.2%} of the documents ({backend})")
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def bench_api(args):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.bcrypt_rounds:
+        server.passwords.rounds = args.bcrypt_rounds
+
+    results = {}
+    async with ApiBench(args.mongo_url) as bench:
+        print(f"\n📊 Uploads ({bench.backend})")
+        # Unmeasured, so worker start-up in the parse pool is not billed to the first size
+        await bench.upload(100)
+        for rows in args.rows or [1000, 10000, 50000]:
+            result = results[f"upload.rows_{rows}"] = await bench.upload(rows)
+            print(f"   {rows:>9,} rows   {result['seconds']:8.3f}s  {result['rows_per_second']:>12,.0f} rows/s")
+
+        print(f"\n📊 Login, {args.logins} requests at concurrency {args.concurrency} (bcrypt cost {server.passwords.rounds})")
+        result = results[f"login.c{args.concurrency}"] = await bench.login(args.logins, args.concurrency)
+        print(f"   p50 {result['p50_ms']:.1f} ms   p99 {result['p99_ms']:.1f} ms   {result['requests_per_second']:.1f} req/s")
+
+        print("\n📊 Assignment listing")
+        for name, result in (await bench.listing(args.page_sizes, args.repeat)).items():
+            results[name] = result
+            print(f"   {name:<32} p50 {result['p50_ms']:9.2f} ms   p99 {result['p99_ms']:9.2f} ms")
+
+        print(f"\n📊 Stats, {args.stats_rows:,} assignments")
+        for name, result in (await bench.stats(args.roster_sizes, args.stats_rows, args.repeat)).items():
+            results[name] = result
+            print(f"   {name:<32} p50 {result['p50_ms']:9.2f} ms   p99 {result['p99_ms']:9.2f} ms")
+
+        backend = bench.backend
+
+    return {
+        "meta": {
+            "suite": "api",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": backend,
+            "bcrypt_rounds": server.passwords.rounds,
+            "parse_pool": server.parse_pool.kind,
+        },
+        "results": results,
+    }
+
+
+# Metrics where a larger value is an improvement; everything else is a latency or duration
+HIGHER_IS_BETTER = ("rows_per_second", "job_rows_per_second", "requests_per_second")
+
+
+def compare_reports(previous, current):
+    """Print the change of every metric present in both reports."""
+    print(f"\n📈 Compared with {previous['meta'].get('revision')} from {previous['meta'].get('timestamp')}")
+    if previous['meta'].get('mongo') != current['meta'].get('mongo'):
+        print("   ⚠️  runs used different Mongo backends")
+    for name, metrics in current['results'].items():
+        before = previous['results'].get(name)
+        if not before:
+            continue
+        for key in ("p50_ms", "p99_ms", *HIGHER_IS_BETTER):
+            if key in metrics and before.get(key):
+                change = (metrics[key] - before[key]) / before[key] * 100
+                better = change > 0 if key in HIGHER_IS_BETTER else change < 0
+                print(f"   {name + ' ' + key:<48} {before[key]:>12,.2f} -> {metrics[key]:>12,.2f}  {change:+7.1f}% {'✅' if better else '🔻'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the distribution backend")
+    parser.add_argument("suite", nargs="?", choices=["engine", "strategies", "serialization", "api", "storage", "validation"], default="engine")
+    parser.add_argument("--rows", type=int, nargs="+", default=None)
+    parser.add_argument("--agents", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=2, help="validation suite: parse pool workers (PARSE_POOL_WORKERS)")
+    parser.add_argument("--min-rows-per-second", type=int, default=0,
+                        help="validation suite: exit 1 below this end-to-end rate (default: report only)")
+    api = parser.add_argument_group("api and storage suites")
+    api.add_argument("--mongo-url", default=None, help="local mongod to use instead of the in-memory stand-in")
+    api.add_argument("--batch-size", type=int, default=1000, help="storage suite: insert batch for the documents layout")
+    api.add_argument("--page-size", type=int, default=1000, help="storage suite: page size when reading one agent back")
+    api.add_argument("--logins", type=int, default=200)
+    api.add_argument("--concurrency", type=int, default=20)
+    api.add_argument("--bcrypt-rounds", type=int, default=None, help="defaults to BCRYPT_ROUNDS")
+    api.add_argument("--page-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    api.add_argument("--roster-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    api.add_argument("--stats-rows", type=int, default=20000)
+    api.add_argument("--repeat", type=int, default=20)
+    api.add_argument("--json", dest="json_path", default=None, help="write the results to this file")
+    api.add_argument("--compare", default=None, help="earlier --json output to compare against")
+    args = parser.parse_args()
+
+    ok = True
+    if args.suite == "engine":
+        print("🚀 Distribution engine: iterrows vs vectorized")
+        agents = args.agents or 5
+        for rows in args.rows or [10000, 100000, 500000]:
+            print(f"\n📊 {rows:,} rows / {agents} agents")
+            ok = bench_distribution(rows, agents) and ok
+    elif args.suite == "api":
+        print("🚀 In-process API benchmarks")
+        report = asyncio.run(bench_api(args))
+        if args.json_path:
+            Path(args.json_path).write_text(json.dumps(report, indent=2))
+            print(f"\n💾 Results written to {args.json_path}")
+        if args.compare:
+            compare_reports(json.loads(Path(args.compare).read_text()), report)
+    elif args.suite == "storage":
+        print("🚀 Assignment storage: documents vs buckets")
+        agents = args.agents or 10
+        for rows in args.rows or [100000]:
+            print(f"\n📊 {rows:,} assignments / {agents} agents, listing one agent {args.page_size:,} at a time")
+            asyncio.run(bench_storage(rows, agents, args.chunk_rows, args.batch_size, args.page_size, args.mongo_url))
+    elif args.suite == "validation":
+        print("🚀 Upload validation: normalize in the parse pool, dedupe in the job")
+        for rows in args.rows or [1000000]:
+            print(f"\n📊 {rows:,} rows, {args.chunk_rows:,}-row frames")
+            ok = bench_validation(rows, args.chunk_rows, args.workers, args.min_rows_per_second) and ok
+    elif args.suite == "serialization":
+        print("🚀 List response serialization")
+        for rows in args.rows or [10000, 100000]:
+            print(f"\n📊 {rows:,} assignments")
+            bench_serialization(rows)
+    else:
+        print("🚀 Distribution strategies")
+        agents = args.agents or 1000
+        for rows in args.rows or [1000000]:
+            print(f"\n📊 {rows:,} rows / {agents:,} agents, {args.chunk_rows:,}-row chunks")
+            bench_strategies(rows, agents, args.chunk_rows)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import requests
 import sys
+import time
 import json
 import io
 import pandas as pd
@@ -183,7 +184,7 @@ class DistributionManagerAPITester:
             "Upload CSV File",
             "POST",
             "uploads",
-            200,
+            202,
             files={"file": ("test_data.csv", csv_content, "text/csv")},
             headers={"Authorization": f"Bearer {self.admin_token}"}
         )
@@ -191,9 +192,25 @@ class DistributionManagerAPITester:
         if success:
             self.upload_id = response.get('upload_id')
             print(f"   Upload ID: {self.upload_id}")
-            print(f"   Total records: {response.get('total_records')}")
-            print(f"   Agents count: {response.get('agents_count')}")
-            return True
+            return self.wait_for_upload(self.upload_id)
+        return False
+
+    def wait_for_upload(self, upload_id, timeout=60):
+        """Poll the upload job until it finishes"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            response = requests.get(
+                f"{self.base_url}/uploads/{upload_id}/status",
+                headers={"Authorization": f"Bearer {self.admin_token}"}
+            )
+            job = response.json() if response.status_code == 200 else {}
+            if job.get('status') in ('completed', 'failed', 'cancelled'):
+                print(f"   Status: {job['status']}")
+                print(f"   Total records: {job.get('total_records')}")
+                print(f"   Agents count: {job.get('agents_count')}")
+                return job['status'] == 'completed'
+            time.sleep(0.5)
+        print("❌ Upload did not finish in time")
         return False
 
     def test_invalid_csv_upload(self):
@@ -1,9 +1,69 @@
+import { useState } from "react";
+import axios from "axios";
+import { Button } from "@/components/ui/button";
+import { Input } from "@/components/ui/input";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
-import { BarChart, List } from "lucide-react";
+import { toast } from "sonner";
+import { BarChart, List, Search, X } from "lucide-react";
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+const SEARCH_PAGE_SIZE = 100;
 
 export default function AssignmentsView({ assignments, stats }) {
+  const [text, setText] = useState("");
+  const [phone, setPhone] = useState("");
+  // null while not searching; otherwise { results, cursor, params }
+  const [search, setSearch] = useState(null);
+  const [searching, setSearching] = useState(false);
+
+  // Filtering happens on the server, so only matching rows are downloaded
+  const runSearch = async (params, previous = []) => {
+    setSearching(true);
+    try {
+      const token = localStorage.getItem("token");
+      const response = await axios.get(`${API}/assignments/search`, {
+        params: { ...params, limit: SEARCH_PAGE_SIZE },
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      setSearch({
+        results: [...previous, ...response.data],
+        cursor: response.headers["x-next-cursor"] || null,
+        params,
+      });
+    } catch (error) {
+      toast.error(error.response?.data?.detail || "Search failed");
+    } finally {
+      setSearching(false);
+    }
+  };
+
+  const handleSearch = (e) => {
+    e.preventDefault();
+    const params = {};
+    if (text.trim()) params.q = text.trim();
+    if (phone.trim()) params.phone = phone.trim();
+    if (Object.keys(params).length === 0) {
+      setSearch(null);
+      return;
+    }
+    runSearch(params);
+  };
+
+  const handleLoadMore = () => {
+    runSearch({ ...search.params, after: search.cursor }, search.results);
+  };
+
+  const clearSearch = () => {
+    setText("");
+    setPhone("");
+    setSearch(null);
+  };
+
+  const rows = search ? search.results : assignments;
+
   return (
     <Tabs defaultValue="all" className="space-y-6">
       <TabsList className="bg-white shadow-sm border border-slate-200">
@@ -21,10 +81,43 @@ export default function AssignmentsView({ assignments, stats }) {
         <Card className="border-0 shadow-lg">
           <CardHeader>
             <CardTitle className="text-xl" style={{ fontFamily: 'Space Grotesk' }}>All Assignments</CardTitle>
-            <CardDescription>Complete list of distributed assignments</CardDescription>
+            <CardDescription>
+              {search ? `${search.results.length}${search.cursor ? "+" : ""} matching assignments` : "Complete list of distributed assignments"}
+            </CardDescription>
           </CardHeader>
           <CardContent>
-            {assignments.length === 0 ? (
+            <form onSubmit={handleSearch} className="flex flex-wrap gap-3 mb-6" data-testid="assignment-search-form">
+              <Input
+                value={text}
+                onChange={(e) => setText(e.target.value)}
+                placeholder="Search first name or notes"
+                className="max-w-xs"
+                data-testid="assignment-search-text"
+              />
+              <Input
+                value={phone}
+                onChange={(e) => setPhone(e.target.value)}
+                placeholder="Phone starts with"
+                className="max-w-xs"
+                data-testid="assignment-search-phone"
+              />
+              <Button type="submit" disabled={searching} data-testid="assignment-search-button">
+                <Search className="w-4 h-4 mr-2" />
+                Search
+              </Button>
+              {search && (
+                <Button type="button" variant="outline" onClick={clearSearch} data-testid="assignment-search-clear">
+                  <X className="w-4 h-4 mr-2" />
+                  Clear
+                </Button>
+              )}
+            </form>
+            {rows.length === 0 && search ? (
+              <div className="text-center py-12 text-slate-500">
+                <Search className="w-16 h-16 mx-auto mb-4 opacity-30" />
+                <p className="text-lg font-medium">No matching assignments</p>
+              </div>
+            ) : rows.length === 0 ? (
               <div className="text-center py-12 text-slate-500">
                 <List className="w-16 h-16 mx-auto mb-4 opacity-30" />
                 <p className="text-lg font-medium">No assignments yet</p>
@@ -43,7 +136,7 @@ export default function AssignmentsView({ assignments, stats }) {
                     </TableRow>
                   </TableHeader>
                   <TableBody>
-                    {assignments.map((assignment, index) => (
+                    {rows.map((assignment, index) => (
                       <TableRow key={assignment.id} data-testid={`all-assignment-row-${index}`} className="hover:bg-slate-50">
                         <TableCell className="font-medium" data-testid={`all-assignment-agent-${index}`}>
                           <div className="flex items-center gap-2">
@@ -65,6 +158,13 @@ export default function AssignmentsView({ assignments, stats }) {
                     ))}
                   </TableBody>
                 </Table>
+                {search?.cursor && (
+                  <div className="flex justify-center mt-4">
+                    <Button variant="outline" onClick={handleLoadMore} disabled={searching} data-testid="assignment-search-more">
+                      Load more
+                    </Button>
+                  </div>
+                )}
               </div>
             )}
           </CardContent>
@@ -1,17 +1,97 @@
-import { useState, useRef } from "react";
+import { useState, useRef, useEffect } from "react";
 import axios from "axios";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { toast } from "sonner";
-import { Upload, FileSpreadsheet, AlertCircle, CheckCircle2 } from "lucide-react";
+import { Upload, FileSpreadsheet, AlertCircle, CheckCircle2, Download, Loader2, XCircle } from "lucide-react";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const POLL_INTERVAL_MS = 1000;
+const FINISHED_STATES = ["completed", "failed", "cancelled"];
+const STRATEGIES = [
+  { value: "round_robin", label: "Round robin" },
+  { value: "weighted", label: "Weighted by agent" },
+  { value: "least_loaded", label: "Least loaded first" },
+  { value: "capacity_capped", label: "Least loaded, capped at agent capacity" },
+];
 
 export default function UploadSection({ onSuccess, agents }) {
   const [file, setFile] = useState(null);
+  // One key per chosen file, so a double click or a retried request is answered with the same upload
+  const [idempotencyKey, setIdempotencyKey] = useState(null);
   const [uploading, setUploading] = useState(false);
+  const [job, setJob] = useState(null);
+  const [strategy, setStrategy] = useState("round_robin");
   const fileInputRef = useRef(null);
+  const pollTimerRef = useRef(null);
+
+  useEffect(() => {
+    return () => clearTimeout(pollTimerRef.current);
+  }, []);
+
+  const pollStatus = async (uploadId) => {
+    try {
+      const token = localStorage.getItem("token");
+      const response = await axios.get(`${API}/uploads/${uploadId}/status`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      const current = response.data;
+      setJob(current);
+
+      if (!FINISHED_STATES.includes(current.status)) {
+        pollTimerRef.current = setTimeout(() => pollStatus(uploadId), POLL_INTERVAL_MS);
+        return;
+      }
+
+      setUploading(false);
+      if (current.status === "completed") {
+        toast.success(
+          `File uploaded! ${current.total_records} records distributed among ${current.agents_count} agents` +
+            (current.rows_rejected ? `, ${current.rows_rejected} rows skipped` : "")
+        );
+        onSuccess();
+      } else if (current.status === "failed") {
+        toast.error(current.error || "Failed to process file");
+      } else {
+        toast.info("Upload cancelled");
+      }
+    } catch (error) {
+      setUploading(false);
+      toast.error(error.response?.data?.detail || "Failed to fetch upload status");
+    }
+  };
+
+  const handleCancel = async () => {
+    if (!job) return;
+    try {
+      const token = localStorage.getItem("token");
+      await axios.post(`${API}/uploads/${job.upload_id}/cancel`, null, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      setJob({ ...job, cancel_requested: true });
+    } catch (error) {
+      toast.error(error.response?.data?.detail || "Failed to cancel upload");
+    }
+  };
+
+  const handleDownloadRejected = async () => {
+    try {
+      const token = localStorage.getItem("token");
+      const response = await axios.get(`${API}/uploads/${job.upload_id}/rejected`, {
+        headers: { Authorization: `Bearer ${token}` },
+        responseType: "blob",
+      });
+      const url = URL.createObjectURL(response.data);
+      const link = document.createElement("a");
+      link.href = url;
+      link.download = `${(job.filename || "upload").replace(/\.[^.]+$/, "")}-rejected.csv`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      toast.error("Failed to download rejected rows");
+    }
+  };
 
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
@@ -21,6 +101,7 @@ export default function UploadSection({ onSuccess, agents }) {
       
       if (validTypes.includes(fileExtension.toLowerCase())) {
         setFile(selectedFile);
+        setIdempotencyKey(crypto.randomUUID());
       } else {
         toast.error("Please upload a CSV, XLSX, or XLS file");
         e.target.value = null;
@@ -40,28 +121,32 @@ export default function UploadSection({ onSuccess, agents }) {
     }
 
     setUploading(true);
+    setJob(null);
 
     try {
       const token = localStorage.getItem("token");
       const formData = new FormData();
       formData.append("file", file);
+      formData.append("strategy", strategy);
 
       const response = await axios.post(`${API}/uploads`, formData, {
         headers: {
           Authorization: `Bearer ${token}`,
           "Content-Type": "multipart/form-data",
+          "Idempotency-Key": idempotencyKey,
         },
       });
 
-      toast.success(
-        `File uploaded! ${response.data.total_records} records distributed among ${response.data.agents_count} agents`
-      );
+      if (response.data.duplicate) {
+        toast.info("This file was already uploaded, showing the original upload");
+      }
+      setJob({ upload_id: response.data.upload_id, status: response.data.status, rows_inserted: 0 });
       setFile(null);
+      setIdempotencyKey(null);
       if (fileInputRef.current) fileInputRef.current.value = null;
-      onSuccess();
+      pollStatus(response.data.upload_id);
     } catch (error) {
       toast.error(error.response?.data?.detail || "Failed to upload file");
-    } finally {
       setUploading(false);
     }
   };
@@ -83,7 +168,7 @@ export default function UploadSection({ onSuccess, agents }) {
                 <p className="text-sm text-blue-700 mb-2">Your file must contain the following columns:</p>
                 <ul className="text-sm text-blue-700 space-y-1 list-disc list-inside">
                   <li><strong>FirstName</strong> - Text field</li>
-                  <li><strong>Phone</strong> - Number field</li>
+                  <li><strong>Phone</strong> - 7 to 15 digits, optionally with a leading + and spaces, dashes, dots or brackets</li>
                   <li><strong>Notes</strong> - Text field</li>
                 </ul>
                 <p className="text-sm text-blue-700 mt-2">Accepted formats: CSV, XLSX, XLS</p>
@@ -125,6 +210,82 @@ export default function UploadSection({ onSuccess, agents }) {
             </div>
           )}
 
+          <div className="flex items-center justify-between gap-4">
+            <label htmlFor="distribution-strategy" className="text-sm font-medium text-slate-700">
+              Distribution strategy
+            </label>
+            <select
+              id="distribution-strategy"
+              value={strategy}
+              onChange={(e) => setStrategy(e.target.value)}
+              data-testid="strategy-select"
+              className="h-10 rounded-md border border-slate-300 bg-white px-3 text-sm text-slate-700"
+            >
+              {STRATEGIES.map((option) => (
+                <option key={option.value} value={option.value}>
+                  {option.label}
+                </option>
+              ))}
+            </select>
+          </div>
+
+          {job && !FINISHED_STATES.includes(job.status) && (
+            <div className="bg-blue-50 border border-blue-200 rounded-lg p-4" data-testid="upload-progress">
+              <div className="flex items-center justify-between gap-3">
+                <div className="flex items-center gap-3">
+                  <Loader2 className="w-5 h-5 text-blue-600 animate-spin" />
+                  <div>
+                    <p className="font-medium text-blue-900">
+                      {job.status === "queued" ? "Waiting to start..." : "Distributing records..."}
+                    </p>
+                    <p className="text-sm text-blue-700">
+                      {(job.rows_inserted || 0).toLocaleString()} records distributed
+                      {job.rows_per_second ? ` (${Math.round(job.rows_per_second).toLocaleString()} rows/s)` : ""}
+                    </p>
+                  </div>
+                </div>
+                <Button
+                  onClick={handleCancel}
+                  variant="outline"
+                  size="sm"
+                  disabled={job.cancel_requested}
+                  data-testid="cancel-upload-button"
+                  className="hover:bg-red-50 hover:text-red-600 hover:border-red-300"
+                >
+                  <XCircle className="w-4 h-4 mr-2" />
+                  Cancel
+                </Button>
+              </div>
+            </div>
+          )}
+
+          {job?.status === "completed" && job.rows_rejected > 0 && (
+            <div className="bg-amber-50 border border-amber-200 rounded-lg p-4" data-testid="upload-rejected">
+              <div className="flex items-center justify-between gap-3">
+                <div className="flex items-center gap-3">
+                  <AlertCircle className="w-5 h-5 text-amber-600" />
+                  <div>
+                    <p className="font-medium text-amber-900">
+                      {job.rows_rejected.toLocaleString()} rows were skipped
+                    </p>
+                    <p className="text-sm text-amber-700">
+                      Missing names or phones, invalid phones and repeated phones are not distributed
+                    </p>
+                  </div>
+                </div>
+                <Button
+                  onClick={handleDownloadRejected}
+                  variant="outline"
+                  size="sm"
+                  data-testid="download-rejected-button"
+                >
+                  <Download className="w-4 h-4 mr-2" />
+                  Download
+                </Button>
+              </div>
+            </div>
+          )}
+
           <Button
             onClick={handleUpload}
             disabled={!file || uploading || agents.length === 0}
@@ -132,7 +293,7 @@ export default function UploadSection({ onSuccess, agents }) {
             className="w-full h-12 bg-gradient-to-r from-blue-600 to-purple-600 hover:from-blue-700 hover:to-purple-700 text-white font-medium shadow-lg hover:shadow-xl transition-all"
           >
             {uploading ? (
-              "Uploading..."
+              job ? "Processing..." : "Uploading..."
             ) : (
               <>
                 <Upload className="w-5 h-5 mr-2" />
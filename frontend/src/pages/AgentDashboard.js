@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
@@ -8,23 +8,133 @@ import { LogOut, Clipboard, Phone, FileText } from "lucide-react";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+// Deletions and reassignments are not pushed; a delta sync picks them up
+const SYNC_INTERVAL_MS = 60000;
+const STREAM_RETRY_MS = 5000;
+
+// Append the assignments of `incoming` that `current` does not have yet; streams may repeat some
+const mergeAssignments = (current, incoming) => {
+  const known = new Set(current.map((assignment) => assignment.id));
+  const added = incoming.filter((assignment) => !known.has(assignment.id));
+  return added.length ? [...current, ...added] : current;
+};
+
+// Apply a delta from GET /assignments?since=: drop tombstoned rows first, then upsert the changed ones
+const applyDelta = (current, { changed, deleted }) => {
+  const removedIds = new Set(deleted.filter((t) => t.kind === "assignment").map((t) => t.id));
+  const removedUploads = new Set(deleted.filter((t) => t.kind === "upload").map((t) => t.upload_id));
+  const removedAgents = new Set(deleted.filter((t) => t.kind === "agent").map((t) => t.agent_id));
+  const changedById = new Map(changed.map((assignment) => [assignment.id, assignment]));
+  const kept = current
+    .filter(
+      (assignment) =>
+        !removedIds.has(assignment.id) &&
+        !removedUploads.has(assignment.upload_id) &&
+        !removedAgents.has(assignment.agent_id)
+    )
+    .map((assignment) => changedById.get(assignment.id) || assignment);
+  return mergeAssignments(kept, changed);
+};
 
 export default function AgentDashboard({ user, onLogout }) {
   const [assignments, setAssignments] = useState([]);
   const [loading, setLoading] = useState(true);
+  const syncTokenRef = useRef(null);
 
   useEffect(() => {
-    fetchAssignments();
+    // New assignments are pushed over SSE; the full list is only loaded once the stream is
+    // subscribed (or if it cannot connect), so nothing created in between is missed
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+    let loaded = false;
+    let lastEventId = null;
+
+    const load = () => {
+      loaded = true;
+      fetchAssignments();
+    };
+
+    const retry = () => {
+      if (!closed) retryTimer = setTimeout(connect, STREAM_RETRY_MS);
+    };
+
+    // EventSource cannot send headers, so each connection gets a short-lived stream token
+    // instead of putting the login token in the URL
+    const connect = async () => {
+      let streamToken;
+      try {
+        const response = await axios.post(`${API}/assignments/stream/token`, null, {
+          headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+        });
+        streamToken = response.data.token;
+      } catch (error) {
+        if (!loaded) load();
+        return retry();
+      }
+      if (closed) return;
+      const params = new URLSearchParams({ token: streamToken });
+      if (lastEventId) params.set("after", lastEventId);
+      source = new EventSource(`${API}/assignments/stream?${params}`);
+
+      source.onopen = () => {
+        // Connections resume from the last event once one has arrived; before that, reload
+        if (!loaded || !lastEventId) load();
+      };
+      source.onerror = () => {
+        if (!loaded) load();
+        // The browser retries with the same URL, which fails once the stream token has
+        // expired; then reconnect with a fresh token
+        if (source.readyState === EventSource.CLOSED) {
+          source.close();
+          retry();
+        }
+      };
+      source.addEventListener("assignments", (event) => {
+        lastEventId = event.lastEventId || lastEventId;
+        setAssignments((current) => mergeAssignments(current, JSON.parse(event.data)));
+      });
+      source.addEventListener("resync", load);
+    };
+
+    connect();
+    const syncTimer = setInterval(() => loaded && fetchAssignments(), SYNC_INTERVAL_MS);
+
+    return () => {
+      closed = true;
+      if (source) source.close();
+      clearTimeout(retryTimer);
+      clearInterval(syncTimer);
+    };
   }, []);
 
+  // The first load fetches the whole list; later ones only what changed since its sync token
   const fetchAssignments = async () => {
+    const headers = { Authorization: `Bearer ${localStorage.getItem("token")}` };
     try {
-      const token = localStorage.getItem("token");
-      const response = await axios.get(`${API}/assignments`, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
-      setAssignments(response.data);
+      if (syncTokenRef.current) {
+        let hasMore = true;
+        while (hasMore) {
+          const response = await axios.get(`${API}/assignments`, {
+            params: { since: syncTokenRef.current },
+            headers,
+          });
+          syncTokenRef.current = response.headers["x-sync-token"];
+          setAssignments((current) => applyDelta(current, response.data));
+          hasMore = response.data.has_more;
+        }
+      } else {
+        const response = await axios.get(`${API}/assignments`, { headers });
+        syncTokenRef.current = response.headers["x-sync-token"];
+        setAssignments((current) => mergeAssignments(response.data, current));
+      }
     } catch (error) {
+      if (error.response?.status === 410) {
+        // Token older than the tombstones we keep: start over with a full load
+        syncTokenRef.current = null;
+        setAssignments([]);
+        return fetchAssignments();
+      }
       toast.error("Failed to fetch assignments");
     } finally {
       setLoading(false);
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionRejected, ConcurrencyLimit
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_runs_queues_then_sheds():
+    async def scenario():
+        limit = ConcurrencyLimit("test", concurrency=1, max_queue=1, queue_timeout=1.0)
+        first = await limit.acquire()
+        queued = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        assert limit.snapshot()["queued"] == 1
+
+        with pytest.raises(AdmissionRejected) as shed:
+            await limit.acquire()
+        assert shed.value.status_code == 503
+
+        first.release()
+        second = await queued
+        assert limit.snapshot()["active"] == 1
+        second.release()
+        assert limit.snapshot()["active"] == 0
+        assert limit.admitted == 2
+        assert limit.rejected == {"queue_full": 1}
+
+    run(scenario())
+
+
+def test_queue_timeout():
+    async def scenario():
+        limit = ConcurrencyLimit("test", concurrency=1, max_queue=5, queue_timeout=0.01)
+        ticket = await limit.acquire("a")
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await limit.acquire("b")
+        assert timed_out.value.status_code == 503
+        assert limit.snapshot()["queued"] == 0
+        assert limit.snapshot()["users_active"] == 1
+        ticket.release()
+
+    run(scenario())
+
+
+def test_per_user_counts_queued_requests():
+    async def scenario():
+        limit = ConcurrencyLimit("test", concurrency=1, max_queue=5, queue_timeout=1.0, per_user=1, retry_after=2.5)
+        running = await limit.acquire("a")
+        queued = asyncio.create_task(limit.acquire("b"))
+        await asyncio.sleep(0)
+
+        # b's one request is only queued, but it still counts
+        with pytest.raises(AdmissionRejected) as too_many:
+            await limit.acquire("b")
+        assert too_many.value.status_code == 429
+        assert too_many.value.retry_after_header == "3"
+
+        running.release()
+        (await queued).release()
+        assert limit.snapshot()["users_active"] == 0
+        (await limit.acquire("b")).release()
+
+    run(scenario())
+
+
+def test_cancelled_waiter_gives_its_place_back():
+    async def scenario():
+        limit = ConcurrencyLimit("test", concurrency=1, max_queue=1, queue_timeout=1.0, per_user=1)
+        running = await limit.acquire("a")
+        waiter = asyncio.create_task(limit.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limit.snapshot()["queued"] == 0
+        assert limit.snapshot()["users_active"] == 1
+
+        running.release()
+        (await limit.acquire("b")).release()
+        assert limit.snapshot()["active"] == 0
+
+    run(scenario())
+
+
+def test_release_is_idempotent():
+    async def scenario():
+        limit = ConcurrencyLimit("test", concurrency=1, max_queue=0, queue_timeout=1.0)
+        ticket = await limit.acquire("a")
+        ticket.release()
+        ticket.release()
+        assert limit.snapshot()["active"] == 0
+        assert limit.snapshot()["users_active"] == 0
+        # Only one slot came back
+        held = await limit.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limit.acquire()
+        held.release()
+
+    run(scenario())
@@ -0,0 +1,85 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from mongomock_motor import AsyncMongoMockClient
+
+from buckets import BucketStore, from_bucket, to_buckets
+from pagination import encode_cursor
+
+NOW = datetime(2024, 5, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+
+def assignment(i, agent_id="a0", upload_id="u0", created_at=NOW, **fields):
+    return {
+        "id": str(uuid.UUID(int=i)),
+        "agent_id": agent_id,
+        "agent_name": f"Agent {agent_id}",
+        "first_name": f"Lead{i}",
+        "phone": f"+1 (555) 010-{i:04d}",
+        "phone_normalized": f"1555010{i:04d}",
+        "notes": f"note {i}",
+        "upload_id": upload_id,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "seq": i,
+        **fields,
+    }
+
+
+def test_round_trip():
+    docs = [assignment(i, agent_id=f"a{i % 2}") for i in range(5)]
+    buckets = to_buckets(docs)
+    assert sorted(bucket['count'] for bucket in buckets) == [2, 3]
+    unpacked = [doc for bucket in buckets for doc in from_bucket(bucket)]
+    assert sorted(unpacked, key=lambda doc: doc['seq']) == docs
+
+
+def test_buckets_split_at_bucket_size_and_group_by_batch():
+    later = NOW + timedelta(seconds=1)
+    docs = [assignment(i) for i in range(5)] + [assignment(5, created_at=later), assignment(6, upload_id="u1")]
+    buckets = to_buckets(docs, bucket_size=2)
+    assert [(bucket['upload_id'], bucket['created_at'], bucket['count']) for bucket in buckets] == [
+        ("u0", NOW, 2), ("u0", NOW, 2), ("u0", NOW, 1), ("u0", later, 1), ("u1", NOW, 1),
+    ]
+    assert buckets[1]['seqs'] == [2, 3]
+
+
+def test_buckets_without_seqs():
+    (bucket,) = to_buckets([assignment(1), assignment(2)])
+    del bucket['seqs']
+    assert [doc['seq'] for doc in from_bucket(bucket)] == [None, None]
+
+
+def test_from_bucket_normalizes_phones():
+    (bucket,) = to_buckets([assignment(1, phone="5550100.0")])
+    assert from_bucket(bucket)[0]['phone_normalized'] == "5550100"
+
+
+def test_find_pages_in_keyset_order():
+    async def run():
+        db = AsyncMongoMockClient().db
+        store = BucketStore(bucket_size=3)
+        later = NOW + timedelta(seconds=1)
+        # Agents' buckets interleave within a batch; ids are not in seq order
+        docs = [assignment(100 - i, agent_id=f"a{i % 2}", seq=i) for i in range(8)]
+        docs += [assignment(200 + i, created_at=later, seq=i) for i in range(4)]
+        await store.insert(db, docs)
+
+        found = [doc async for doc in store.find(db)]
+        assert [doc['id'] for doc in found] == [doc['id'] for doc in docs]
+
+        pages, after = [], None
+        while True:
+            page = [doc async for doc in store.find(db, after=after, limit=5)]
+            if not page:
+                break
+            pages.append(page)
+            after = encode_cursor(page[-1])
+        assert [len(page) for page in pages] == [5, 5, 2]
+        assert [doc['id'] for page in pages for doc in page] == [doc['id'] for doc in docs]
+
+        agent = [doc async for doc in store.find(db, {"agent_id": "a1"})]
+        assert [doc['seq'] for doc in agent] == [1, 3, 5, 7]
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from distribution import (
+    STRATEGIES, UNCAPPED, CapacityCappedStrategy, InsufficientCapacity, LeastLoadedStrategy,
+    RoundRobinStrategy, WeightedStrategy, _water_fill,
+)
+
+
+def agents(n, **fields):
+    return [{"id": f"a{i}", **{key: values[i] for key, values in fields.items()}} for i in range(n)]
+
+
+def water_fill(loads, n, caps=None):
+    loads = np.array(loads, dtype=np.int64)
+    caps = np.full(len(loads), UNCAPPED, dtype=np.int64) if caps is None else np.array(caps, dtype=np.int64)
+    return _water_fill(loads, n, caps).tolist()
+
+
+def test_water_fill_tops_up_the_least_loaded_first():
+    assert water_fill([0, 0, 0], 7) == [3, 2, 2]
+    assert water_fill([5, 0, 2], 4) == [0, 3, 1]
+    assert water_fill([5, 0, 2], 10) == [1, 6, 3]
+    assert water_fill([0, 0], 0) == [0, 0]
+
+
+def test_water_fill_respects_caps():
+    assert water_fill([0, 0, 0], 6, caps=[1, 5, 5]) == [1, 3, 2]
+    assert water_fill([0, 3], 4, caps=[2, 5]) == [2, 2]
+
+
+def test_water_fill_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        size = int(rng.integers(1, 6))
+        loads = rng.integers(0, 10, size)
+        caps = rng.integers(0, 10, size)
+        n = int(rng.integers(0, caps.sum() + 1))
+        counts = np.array(water_fill(loads, n, caps))
+        # One row at a time to the least-loaded agent with room, lowest index first
+        expected = np.zeros(size, dtype=np.int64)
+        for _ in range(n):
+            room = np.flatnonzero(expected < caps)
+            expected[room[np.argmin((loads + expected)[room])]] += 1
+        assert counts.tolist() == expected.tolist()
+
+
+def allocate(strategy, *sizes):
+    return np.concatenate([strategy.allocate(n) for n in sizes]).tolist()
+
+
+def test_round_robin_continues_across_chunks():
+    assert allocate(RoundRobinStrategy(agents(3)), 2, 3, 2) == [0, 1, 2, 0, 1, 2, 0]
+
+
+def test_weighted_spreads_heavier_agents():
+    strategy = WeightedStrategy(agents(3, weight=[2, 1, None]))
+    first, second = allocate(strategy, 4), allocate(strategy, 4)
+    assert sorted(first) == [0, 0, 1, 2]
+    assert first == second
+    assert first[0] == 0 and first[1] != 0
+
+
+def test_weighted_without_weights_is_round_robin():
+    strategy = WeightedStrategy(agents(3, weight=[0, 0, 0]))
+    assert sorted(allocate(strategy, 3)) == [0, 1, 2]
+
+
+def test_least_loaded_counts_existing_assignments():
+    strategy = LeastLoadedStrategy(agents(3), {"a0": 4, "a1": 1})
+    rows = allocate(strategy, 3, 3)
+    assert np.bincount(rows, minlength=3).tolist() == [0, 3, 3]
+    assert strategy.loads.tolist() == [4, 4, 3]
+
+
+def test_least_loaded_chunks_match_one_allocation():
+    whole = allocate(LeastLoadedStrategy(agents(4), {"a2": 3}), 20)
+    chunked = allocate(LeastLoadedStrategy(agents(4), {"a2": 3}), 7, 6, 7)
+    assert np.bincount(whole).tolist() == np.bincount(chunked).tolist()
+
+
+def test_capacity_capped_stops_at_capacity():
+    strategy = CapacityCappedStrategy(agents(3, capacity=[2, None, 5]), {"a2": 4})
+    assert np.bincount(allocate(strategy, 5), minlength=3).tolist() == [2, 3, 0]
+    with pytest.raises(InsufficientCapacity):
+        CapacityCappedStrategy(agents(2, capacity=[1, 1])).allocate(3)
+
+
+def test_strategies_are_registered_by_name():
+    assert set(STRATEGIES) == {"round_robin", "weighted", "least_loaded", "capacity_capped"}
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from mongomock_motor import AsyncMongoMockClient
+
+from jobs import FAILED, PROCESSING, QUEUED, UploadJobManager
+
+
+def manager():
+    return UploadJobManager(chunk_rows=100, batch_size=100, concurrency=1, roster=None, parser=None, lease_seconds=60)
+
+
+def upload(upload_id, age, status=QUEUED, heartbeat_age=None, **fields):
+    now = datetime.now(timezone.utc)
+    return {
+        "id": upload_id,
+        "status": status,
+        "uploaded_at": now - timedelta(seconds=age),
+        "heartbeat_at": None if heartbeat_age is None else now - timedelta(seconds=heartbeat_age),
+        "content_hash": f"hash-{upload_id}",
+        "idempotency_key": f"key-{upload_id}",
+        **fields,
+    }
+
+
+def test_reaps_uploads_whose_lease_expired():
+    async def scenario():
+        db = AsyncMongoMockClient().db
+        never_renewed = upload("never", age=120)
+        missing_field = upload("legacy", age=120)
+        del missing_field["heartbeat_at"]
+        await db.uploads.insert_many([
+            never_renewed,
+            missing_field,
+            upload("stale", age=300, status=PROCESSING, heartbeat_age=90),
+            upload("fresh", age=10),
+            upload("renewed", age=300, status=PROCESSING, heartbeat_age=5),
+            upload("done", age=300, status="completed"),
+        ])
+        await db.assignments.insert_one({"id": "a", "upload_id": "stale"})
+
+        assert await manager().reap_orphans(db) == 3
+        docs = {doc["id"]: doc async for doc in db.uploads.find({}, {"_id": 0})}
+        for upload_id in ("never", "legacy", "stale"):
+            assert docs[upload_id]["status"] == FAILED
+            # The same file can be uploaded again
+            assert "content_hash" not in docs[upload_id]
+            assert "idempotency_key" not in docs[upload_id]
+        assert docs["fresh"]["status"] == QUEUED
+        assert docs["renewed"]["status"] == PROCESSING
+        assert docs["done"]["status"] == "completed"
+        assert await db.assignments.count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_skips_uploads_this_worker_runs():
+    async def scenario():
+        db = AsyncMongoMockClient().db
+        await db.uploads.insert_one(upload("mine", age=120))
+        jobs = manager()
+        jobs._tasks["mine"] = None
+        assert await jobs.reap_orphans(db) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from distribution import InsufficientCapacity
+from rebalance import REBALANCES_COLLECTION, RebalanceManager, plan_rebalance
+from sync import TOMBSTONES_COLLECTION
+
+
+def agents(n, **fields):
+    return [
+        {"id": f"a{i}", "name": f"Agent {i}", **{key: values[i] for key, values in fields.items()}}
+        for i in range(n)
+    ]
+
+
+def targets(plan):
+    return [agent['target'] for agent in plan['agents']]
+
+
+def test_weighted_targets_follow_weights():
+    plan = plan_rebalance(agents(3, weight=[2, 1, 1]), {"a0": 10, "a1": 10, "a2": 0}, "weighted")
+    assert targets(plan) == [10, 5, 5]
+    assert plan['moves'] == 5
+
+
+def test_weighted_targets_respect_capacity():
+    roster = agents(3, weight=[4, 1, 1], capacity=[6, None, 8])
+    plan = plan_rebalance(roster, {"a0": 0, "a1": 12, "a2": 0}, "weighted")
+    assert targets(plan) == [6, 3, 3]
+
+    plan = plan_rebalance(roster, {"a0": 12, "a1": 12, "a2": 0}, "weighted")
+    assert targets(plan)[0] == 6
+    assert sum(targets(plan)) == 24
+    assert targets(plan)[2] <= 8
+
+    with pytest.raises(InsufficientCapacity):
+        plan_rebalance(agents(2, capacity=[1, 1]), {"a0": 3}, "weighted")
+
+
+def test_weighted_leftovers_skip_zero_weight_agents_while_others_have_room():
+    plan = plan_rebalance(agents(3, weight=[1, 1, 0], capacity=[2, None, None]), {"a2": 10}, "weighted")
+    assert targets(plan) == [2, 8, 0]
+
+
+class Roster:
+    def __init__(self, agents):
+        self._agents = agents
+
+    async def agents(self, db):
+        return self._agents
+
+
+def test_tombstones_only_for_rows_that_moved(monkeypatch):
+    async def scenario():
+        db = AsyncMongoMockClient().db
+        roster = agents(2)
+        await db.assignments.insert_many([
+            {"id": f"r{i}", "agent_id": "a0", "agent_name": "Agent 0", "upload_id": "u", "created_at": i, "seq": 0}
+            for i in range(4)
+        ])
+
+        # Another writer takes one of the batch's rows away between the read and the update
+        collection = type(db.assignments)
+        bulk_write = collection.bulk_write
+
+        async def racing_bulk_write(self, ops, **kwargs):
+            await db.assignments.update_one({"id": "r3"}, {"$set": {"agent_id": "elsewhere"}})
+            return await bulk_write(self, ops, **kwargs)
+
+        monkeypatch.setattr(collection, "bulk_write", racing_bulk_write)
+        manager = RebalanceManager(Roster(roster))
+        job = await manager.submit(db, "even", "admin")
+        await asyncio.gather(*manager._tasks.values())
+
+        done = await db[REBALANCES_COLLECTION].find_one({"id": job['id']})
+        assert done['status'] == "completed"
+        assert done['moved'] == 1
+        moved = [doc['id'] async for doc in db.assignments.find({"agent_id": "a1"})]
+        tombstones = [doc['id'] async for doc in db[TOMBSTONES_COLLECTION].find({"agent_id": "a0"})]
+        assert tombstones == moved
+
+    asyncio.run(scenario())
@@ -0,0 +1,51 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from stats import COUNTERS_COLLECTION, agent_loads, count_batch, ensure_counters, forget_upload, read_counters
+
+
+def assignments(upload_id, *agent_ids):
+    return [{"id": f"{upload_id}-{i}", "upload_id": upload_id, "agent_id": agent_id} for i, agent_id in enumerate(agent_ids)]
+
+
+def test_ensure_counters_seeds_an_existing_database():
+    async def scenario():
+        db = AsyncMongoMockClient().db
+        await db.assignments.insert_many(assignments("u1", "a", "a", "b"))
+        assert await ensure_counters(db) is True
+        assert await agent_loads(db, use_counters=True) == {"a": 2, "b": 1}
+        assert await read_counters(db) == {"a": {"u1": 2}, "b": {"u1": 1}}
+        # Counters that add up are left alone
+        assert await ensure_counters(db) is False
+
+        # Assignments written while counters were off
+        await db.assignments.insert_many(assignments("u2", "b"))
+        assert await ensure_counters(db) is True
+        assert await agent_loads(db, use_counters=True) == {"a": 2, "b": 2}
+
+    asyncio.run(scenario())
+
+
+def test_forget_upload_takes_back_only_what_was_counted():
+    async def scenario():
+        db = AsyncMongoMockClient().db
+        counted = assignments("u1", "a", "b")
+        await db.assignments.insert_many(counted + assignments("u2", "a"))
+        await count_batch(db, "u1", counted)
+        await count_batch(db, "u2", assignments("u2", "a"))
+        # A batch inserted but cancelled before it was counted
+        await db.assignments.insert_many(assignments("u1-late", "a", "a"))
+        for doc in await db.assignments.find({"upload_id": "u1-late"}).to_list(None):
+            await db.assignments.update_one({"_id": doc["_id"]}, {"$set": {"upload_id": "u1"}})
+
+        await forget_upload(db, "u1")
+        assert await agent_loads(db, use_counters=True) == {"a": 1, "b": 0}
+        assert await read_counters(db) == {"a": {"u2": 1}, "b": {}}
+
+        # Forgetting an upload that was never counted changes nothing
+        await forget_upload(db, "u3")
+        totals = [doc["total"] async for doc in db[COUNTERS_COLLECTION].find()]
+        assert sorted(totals) == [0, 1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from validation import (
+    DUPLICATE_PHONE, INVALID_PHONE, MISSING_FIRST_NAME, MISSING_PHONE, PHONE_DIGITS_COLUMN,
+    LeadValidator, canonicalize_phones, normalize_leads,
+)
+
+
+def canonicalize(*phones):
+    canonical, digits, key, valid = canonicalize_phones(np.array(phones, dtype=object))
+    return canonical.tolist(), digits.tolist(), key.tolist(), valid.tolist()
+
+
+def test_canonical_phones_keep_digits_and_leading_plus():
+    canonical, digits, _, valid = canonicalize("+1 (555) 010-0000", "555.010.0000", "5550100000")
+    assert canonical == ["+15550100000", "5550100000", "5550100000"]
+    assert digits == ["15550100000", "5550100000", "5550100000"]
+    assert valid == [True, True, True]
+
+
+def test_spreadsheet_floats_lose_their_zeros():
+    canonical, digits, _, valid = canonicalize("5550100.0", "5550100.00", "5550100.5")
+    assert canonical[:2] == ["5550100", "5550100"]
+    assert digits[:2] == ["5550100", "5550100"]
+    # Any other dot is a separator
+    assert digits[2] == "55501005"
+    assert valid == [True, True, True]
+
+
+def test_invalid_phones():
+    _, _, _, valid = canonicalize("555010", "1234567890123456", "555-0100 ext 2", "555+0100000", "", "1" * 40)
+    assert valid == [False] * 6
+
+
+def test_phone_length_limits():
+    _, _, _, valid = canonicalize("5550100", "123456789012345")
+    assert valid == [True, True]
+
+
+def test_keys_match_equal_digits_only():
+    _, _, key, _ = canonicalize("+1 555 010 0000", "15550100000", "0123456789", "123456789")
+    assert key[0] == key[1]
+    # Leading zeros count
+    assert key[2] != key[3]
+
+
+def test_phone_normalized_matches_search_input():
+    from search import normalize_phone
+    assert normalize_phone("5550100.0") == canonicalize("5550100.0")[1][0] == "5550100"
+    assert normalize_phone(" +1 (555) 010-0000 ") == "15550100000"
+
+
+def leads(*rows):
+    return pd.DataFrame(rows, columns=['FirstName', 'Phone', 'Notes'])
+
+
+def test_validator_reports_first_failed_check():
+    validator = LeadValidator()
+    kept, rejected = validator.validate(leads(
+        (" Ann ", " +1 555 010 0000 ", " hi "),
+        ("", "", ""),
+        ("Bob", "", ""),
+        ("Cy", "12", ""),
+    ))
+    assert kept.to_dict('records') == [
+        {'FirstName': "Ann", 'Phone': "+15550100000", 'Notes': "hi", PHONE_DIGITS_COLUMN: "15550100000"}
+    ]
+    assert rejected['row'].tolist() == [2, 3, 4]
+    assert rejected['reason'].tolist() == [MISSING_FIRST_NAME, MISSING_PHONE, INVALID_PHONE]
+    assert validator.rows_rejected == 3
+
+
+def test_validator_keeps_first_row_of_a_phone_across_frames():
+    validator = LeadValidator()
+    kept, rejected = validator.validate(leads(
+        ("A", "5550100000", ""), ("B", "555-010-0000", ""), ("C", "5550100001", ""),
+    ))
+    assert kept['FirstName'].tolist() == ["A", "C"]
+    assert rejected['row'].tolist() == [2]
+
+    # Frames from the parse pool arrive normalized already
+    kept, rejected = validator.validate(normalize_leads(leads(
+        ("D", "+1 555 010 0001", ""), ("E", "5550100001", ""), ("F", "5550100002", ""),
+    )))
+    # '+1 555 010 0001' has other digits than '5550100001'
+    assert kept['FirstName'].tolist() == ["D", "F"]
+    assert rejected['row'].tolist() == [5]
+    assert rejected['reason'].tolist() == [DUPLICATE_PHONE]
+    assert validator.rows == 6
+    assert dict(validator.rejected) == {DUPLICATE_PHONE: 2}
+
+
+def test_invalid_rows_do_not_claim_phones():
+    validator = LeadValidator()
+    kept, _ = validator.validate(leads(("", "5550100000", ""), ("A", "5550100000", "")))
+    assert kept['FirstName'].tolist() == ["A"]
+
+
+def test_workbook_cells_are_converted_not_dropped():
+    frame = pd.DataFrame({
+        'FirstName': pd.Series(["Ann", 42, None], dtype=object),
+        'Phone': pd.Series([5550100000, 5550100001.0, "5550100002"], dtype=object),
+        'Notes': pd.Series([1.5, np.nan, " x "], dtype=object),
+    })
+    normalized = normalize_leads(frame)
+    assert normalized['FirstName'].tolist() == ["Ann", "42", ""]
+    assert normalized['Phone'].tolist() == ["5550100000", "5550100001", "5550100002"]
+    assert normalized['Notes'].tolist() == ["1.5", "", "x"]